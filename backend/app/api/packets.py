@@ -1,18 +1,28 @@
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 import logging
 import json
+import csv
+import io
 import os
 import socket
 import psutil
 import datetime
-import time
 import threading
 import subprocess
 import re
 
+from ..core.network_classifier import network_classifier
+from ..core.ring_buffer import RingBuffer
+from ..db.session import AsyncReadSessionLocal, get_db, get_read_db
+from ..models.database import PacketRecord
+from ..services.database import DatabaseService, encode_packet_cursor, decode_packet_cursor
+from ..services.packet_parser import parse_frame
+from ..services.pcap_stream import PcapStreamReader
+
 # Set up logging first
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -46,11 +56,44 @@ capture_settings = {
     "promiscuous": True  # Enable promiscuous mode by default
 }
 
-# Packet storage
-recent_packets = []
+# Packet storage: a ring that API polls read without consuming
+recent_packets = RingBuffer(1000)
 capture_thread = None
 stop_capture_flag = threading.Event()
 
+# Stored packet columns under the field names the live packet views use
+PACKET_FIELDS = (
+    ("packet_id", PacketRecord.id),
+    ("timestamp", PacketRecord.timestamp),
+    ("source_ip", PacketRecord.source_ip),
+    ("source_port", PacketRecord.source_port),
+    ("source_device_name", PacketRecord.source_device_name),
+    ("dest_ip", PacketRecord.destination_ip),
+    ("dest_port", PacketRecord.destination_port),
+    ("dest_device_name", PacketRecord.destination_device_name),
+    ("protocol", PacketRecord.protocol),
+    ("protocol_version", PacketRecord.protocol_version),
+    ("length", PacketRecord.length),
+    ("ttl", PacketRecord.ttl),
+    ("flags", PacketRecord.flags),
+    ("service", PacketRecord.application_protocol),
+    ("is_malicious", PacketRecord.is_malicious),
+    ("threat_category", PacketRecord.threat_category),
+    ("confidence_score", PacketRecord.confidence_score),
+    ("notes", PacketRecord.notes),
+    ("connection_id", PacketRecord.connection_id),
+)
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+# Media type of each of DatabaseService's BLOCKLIST_FORMATS
+BLOCKLIST_MEDIA_TYPES = {
+    "text": "text/plain",
+    "ipset": "text/plain",
+    "json": "application/json",
+}
+
 def get_host_interfaces():
     """Get network interfaces from the host machine"""
     interfaces = []
@@ -199,7 +242,6 @@ async def get_interfaces():
 
 def generate_mock_data():
     """Generate mock packet data when real capture is not available"""
-    global recent_packets
     logger.info("Generating mock packet data")
     
     # Sample IPs for simulation
@@ -216,7 +258,7 @@ def generate_mock_data():
     protocols = ["TCP", "UDP", "ICMP"]
     
     # Generate packets
-    recent_packets = []
+    packets = []
     for i in range(20):
         # Decide direction - outgoing (local to external) or incoming (external to local)
         direction = "outgoing" if i % 2 == 0 else "incoming"
@@ -274,118 +316,46 @@ def generate_mock_data():
             packet_info["source_port"] = 0
             packet_info["dest_port"] = 0
             
-        recent_packets.append(packet_info)
+        packets.append(packet_info)
     
-    # Sort by timestamp (newest first)
-    recent_packets = sorted(recent_packets, key=lambda p: p["timestamp"], reverse=True)
+    # Store oldest first so sequence numbers follow the timestamps
+    recent_packets.clear()
+    for packet_info in sorted(packets, key=lambda p: p["timestamp"]):
+        recent_packets.append(packet_info)
     
     logger.info(f"Generated {len(recent_packets)} mock packets")
 
 def packet_capture_thread(interface, filter_str="", packet_limit=100, promiscuous=True):
     """Background thread to capture packets using scapy"""
-    global recent_packets, stop_capture_flag
+    global stop_capture_flag
     
     logger.info(f"Starting packet capture thread on interface {interface} with filter: {filter_str}")
-    recent_packets = []  # Clear existing packets
+    # Clear existing packets; sequence numbers keep counting so client cursors stay valid
+    recent_packets.clear()
+    recent_packets.resize(max(packet_limit, 1))
     
     # Try to use host capture file if available
-    if HOST_CAPTURE_AVAILABLE and SCAPY_AVAILABLE:
+    if HOST_CAPTURE_AVAILABLE:
         try:
             logger.info(f"Using host capture file: {HOST_CAPTURE_FILE}")
             
-            # Use sniff with offline parameter to read from the pipe
-            def packet_callback(packet):
-                if stop_capture_flag.is_set() or len(recent_packets) >= packet_limit:
-                    return True  # Signal to stop sniffing
-                    
-                # Extract packet information
-                packet_info = {
-                    "packet_id": len(recent_packets) + 1,
-                    "timestamp": datetime.datetime.now().isoformat(),
-                    "protocol": "Unknown",
-                    "length": len(packet),
-                    "flags": None,
-                    "interface": interface
-                }
-                
-                # IP layer
-                if scapy.IP in packet:
-                    packet_info["source_ip"] = packet[scapy.IP].src
-                    packet_info["dest_ip"] = packet[scapy.IP].dst
-                    
-                    # Determine direction based on source/dest IP
-                    if is_local_ip(packet_info["source_ip"]):
-                        packet_info["direction"] = "outgoing"
-                    elif is_local_ip(packet_info["dest_ip"]):
-                        packet_info["direction"] = "incoming"
-                    else:
-                        packet_info["direction"] = "unknown"
-                    
-                    # Transport layer
-                    if scapy.TCP in packet:
-                        packet_info["protocol"] = "TCP"
-                        packet_info["source_port"] = packet[scapy.TCP].sport
-                        packet_info["dest_port"] = packet[scapy.TCP].dport
-                        
-                        # Get TCP flags
-                        flags = []
-                        if packet[scapy.TCP].flags & 0x02:  # SYN
-                            flags.append("SYN")
-                        if packet[scapy.TCP].flags & 0x10:  # ACK
-                            flags.append("ACK")
-                        if packet[scapy.TCP].flags & 0x01:  # FIN
-                            flags.append("FIN")
-                        if packet[scapy.TCP].flags & 0x04:  # RST
-                            flags.append("RST")
-                        if flags:
-                            packet_info["flags"] = " ".join(flags)
-                            
-                        # Try to get service name based on port
-                        port = packet_info["dest_port"] if packet_info["direction"] == "outgoing" else packet_info["source_port"]
-                        packet_info["service"] = get_service_name(port)
-                    
-                    elif scapy.UDP in packet:
-                        packet_info["protocol"] = "UDP"
-                        packet_info["source_port"] = packet[scapy.UDP].sport
-                        packet_info["dest_port"] = packet[scapy.UDP].dport
-                        
-                        # Try to get service name based on port
-                        port = packet_info["dest_port"] if packet_info["direction"] == "outgoing" else packet_info["source_port"]
-                        packet_info["service"] = get_service_name(port)
-                    
-                    elif scapy.ICMP in packet:
-                        packet_info["protocol"] = "ICMP"
-                        packet_info["source_port"] = 0
-                        packet_info["dest_port"] = 0
-                
-                recent_packets.append(packet_info)
-                logger.debug(f"Captured packet: {packet_info}")
-            
-            # Start sniffing from the host capture file
-            logger.info(f"Starting packet capture from host file")
-            try:
-                # For a named pipe that's continuously being written to
-                # we use a separate thread to read from it
+            # Keep the pipe open and read records incrementally in large chunks
+            with PcapStreamReader(HOST_CAPTURE_FILE) as reader:
                 while not stop_capture_flag.is_set() and len(recent_packets) < packet_limit:
-                    try:
-                        packets = scapy.sniff(offline=HOST_CAPTURE_FILE, count=10, timeout=1)
-                        for packet in packets:
-                            if stop_capture_flag.is_set() or len(recent_packets) >= packet_limit:
-                                break
-                            packet_callback(packet)
+                    batch = []
+                    for timestamp, linktype, frame in reader.read_batch(timeout=0.5):
+                        packet_info = frame_to_packet_info(frame, linktype, timestamp, interface)
+                        if packet_info:
+                            batch.append(packet_info)
+                    set_directions(batch)
+                    
+                    # Deliver the whole batch at once
+                    room = packet_limit - len(recent_packets)
+                    for packet_info in batch[:room]:
+                        packet_info["packet_id"] = len(recent_packets) + 1
+                        recent_packets.append(packet_info)
                         
-                        # Short sleep to avoid busy waiting
-                        time.sleep(0.1)
-                    except Exception as read_error:
-                        logger.error(f"Error reading from host capture file: {str(read_error)}")
-                        time.sleep(1)  # Wait a bit before trying again
-            except Exception as sniff_error:
-                logger.error(f"Error in scapy.sniff with host capture: {str(sniff_error)}")
-                # Fall back to regular capture or mock data
-                if SCAPY_AVAILABLE:
-                    try_regular_capture(interface, filter_str, packet_limit, promiscuous, packet_callback)
-                else:
-                    generate_mock_data()
+            logger.info(f"Host capture stream stats: {reader.stats}")
         except Exception as e:
             logger.error(f"Error in host capture thread: {str(e)}")
             # Fall back to regular capture or mock data
@@ -402,9 +372,58 @@ def packet_capture_thread(interface, filter_str="", packet_limit=100, promiscuou
     
     logger.info("Packet capture thread finished")
 
+def frame_to_packet_info(frame, linktype, timestamp, interface):
+    """Build packet info from a raw frame with the fast-path header parser"""
+    header = parse_frame(frame, linktype)
+    if header is None:
+        return None
+        
+    packet_info = {
+        "timestamp": datetime.datetime.fromtimestamp(timestamp).isoformat(),
+        "protocol": header["protocol"],
+        "length": len(frame),
+        "flags": None,
+        "interface": interface,
+        "source_ip": header["source_ip"],
+        "dest_ip": header["destination_ip"]
+    }
+    
+    if header["protocol"] in ("TCP", "UDP"):
+        packet_info["source_port"] = header["source_port"]
+        packet_info["dest_port"] = header["destination_port"]
+        
+        if header["flags"]:
+            flags = header["flags"].split(",")
+            flags = [flag for flag in ("SYN", "ACK", "FIN", "RST") if flag in flags]
+            if flags:
+                packet_info["flags"] = " ".join(flags)
+    elif header["protocol"] == "ICMP":
+        packet_info["source_port"] = 0
+        packet_info["dest_port"] = 0
+        
+    return packet_info
+
+def set_directions(batch):
+    """Set direction and service on a batch of packets with one classifier pass per side"""
+    source_local = network_classifier.is_local_many([p["source_ip"] for p in batch])
+    dest_local = network_classifier.is_local_many([p["dest_ip"] for p in batch])
+    
+    for packet_info, from_local, to_local in zip(batch, source_local, dest_local):
+        if from_local:
+            packet_info["direction"] = "outgoing"
+        elif to_local:
+            packet_info["direction"] = "incoming"
+        else:
+            packet_info["direction"] = "unknown"
+            
+        # Try to get service name based on port
+        if packet_info["protocol"] in ("TCP", "UDP"):
+            port = packet_info["dest_port"] if packet_info["direction"] == "outgoing" else packet_info["source_port"]
+            packet_info["service"] = get_service_name(port)
+
 def try_regular_capture(interface, filter_str, packet_limit, promiscuous, callback=None):
     """Try to use regular Scapy packet capture"""
-    global recent_packets, stop_capture_flag
+    global stop_capture_flag
     
     try:
         # Define packet callback function if not provided
@@ -429,12 +448,7 @@ def try_regular_capture(interface, filter_str, packet_limit, promiscuous, callba
                     packet_info["dest_ip"] = packet[scapy.IP].dst
                     
                     # Determine direction based on source/dest IP
-                    if is_local_ip(packet_info["source_ip"]):
-                        packet_info["direction"] = "outgoing"
-                    elif is_local_ip(packet_info["dest_ip"]):
-                        packet_info["direction"] = "incoming"
-                    else:
-                        packet_info["direction"] = "unknown"
+                    packet_info["direction"] = network_classifier.direction(packet_info["source_ip"], packet_info["dest_ip"])
                     
                     # Transport layer
                     if scapy.TCP in packet:
@@ -492,16 +506,8 @@ def try_regular_capture(interface, filter_str, packet_limit, promiscuous, callba
         generate_mock_data()
 
 def is_local_ip(ip):
-    """Check if an IP is a local IP address"""
-    # Check for localhost
-    if ip == "127.0.0.1" or ip == "::1":
-        return True
-    
-    # Check for private IP ranges
-    if ip.startswith(("10.", "172.16.", "172.17.", "172.18.", "172.19.", "172.2", "172.3", "192.168.")):
-        return True
-    
-    return False
+    """Check if an IP is in a local network (loopback, private, link-local or configured)"""
+    return network_classifier.is_local(ip)
 
 def get_service_name(port):
     """Try to identify service from port number"""
@@ -527,50 +533,156 @@ def get_service_name(port):
     return common_ports.get(port, "")
 
 @router.get("/recent", response_model=Dict[str, Any])
-async def get_recent_packets(limit: int = 20):
+async def get_recent_packets(limit: int = 20, since: Optional[int] = None):
     """
-    Get recent packets captured
+    Get recent packets captured, newest first
+
+    Reading does not consume packets, so any number of clients can poll.
+    Pass the returned ``next_since`` back as ``since`` to get only the packets
+    captured after the previous call; ``missed`` counts newer packets that
+    were not returned because of ``limit`` or because the ring overwrote them.
     """
-    logger.info(f"Getting recent packets (limit={limit})")
+    logger.info(f"Getting recent packets (limit={limit}, since={since})")
     # Use mock data if no real packets available
-    if not recent_packets:
+    if not recent_packets and since is None:
         generate_mock_data()
         
-    # Limit the number of packets returned
-    limited_packets = recent_packets[:limit]
-    return {"packets": limited_packets}
+    last_seq = recent_packets.last_seq
+    entries = recent_packets.snapshot(limit, since)
+    available = last_seq - since if since is not None else len(recent_packets)
+    return {
+        "packets": [{**packet_info, "seq": seq} for seq, packet_info in reversed(entries)],
+        "next_since": last_seq,
+        "missed": max(available - len(entries), 0)
+    }
+
+def packet_record_to_dict(record: PacketRecord) -> Dict[str, Any]:
+    """Convert a stored packet into the API packet format"""
+    packet = {field: getattr(record, column.key) for field, column in PACKET_FIELDS}
+    packet["timestamp"] = record.timestamp.isoformat() if record.timestamp else None
+    return packet
+
+def parse_packet_cursor(cursor: Optional[str]):
+    """Decode a page cursor, rejecting malformed ones with a 400"""
+    if cursor is None:
+        return None
+    try:
+        return decode_packet_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @router.get("/db", response_model=Dict[str, Any])
 async def get_db_packets(
-    limit: int = 10, 
-    offset: int = 0, 
-    source_ip: str = None,
-    dest_ip: str = None
+    limit: int = Query(10, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    protocol: Optional[str] = None,
+    source_ip: Optional[str] = None,
+    dest_ip: Optional[str] = None,
+    is_malicious: Optional[bool] = None,
+    start_time: Optional[datetime.datetime] = None,
+    end_time: Optional[datetime.datetime] = None,
+    connection_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    Get packets from database with pagination and filtering
+    Get packets from database with pagination and filtering, newest first
+
+    Pass the returned ``next_cursor`` back as ``cursor`` for the next page;
+    cursor pages cost the same at any depth, unlike ``offset``. ``total`` is
+    an estimate on large tables (see ``DatabaseService.count_packets``).
     """
-    logger.info(f"Getting database packets (limit={limit}, offset={offset})")
-    
-    # For now, we'll generate mock data (this would be replaced with actual DB queries)
-    if not recent_packets:
-        generate_mock_data()
-    
-    # Apply filtering if requested
-    filtered_packets = recent_packets
-    if source_ip:
-        filtered_packets = [p for p in filtered_packets if p["source_ip"] == source_ip]
-    if dest_ip:
-        filtered_packets = [p for p in filtered_packets if p["dest_ip"] == dest_ip]
+    logger.info(f"Getting database packets (limit={limit}, offset={offset}, cursor={cursor})")
+    position = parse_packet_cursor(cursor)
+    filters = dict(
+        protocol=protocol, source_ip=source_ip, destination_ip=dest_ip, is_malicious=is_malicious,
+        start_time=start_time, end_time=end_time, connection_id=connection_id
+    )
     
-    # Apply pagination
-    paginated_packets = filtered_packets[offset:offset + limit]
+    try:
+        db_service = DatabaseService(db)
+        records = await db_service.get_packets(limit=limit, offset=offset, cursor=position, **filters)
+        total = await db_service.count_packets(estimate=True, **filters)
+    except Exception as e:
+        error_message = f"Error retrieving packets: {str(e)}"
+        logger.error(error_message)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=error_message
+        )
     
     return {
-        "packets": paginated_packets,
-        "total": len(filtered_packets)
+        "packets": [packet_record_to_dict(record) for record in records],
+        "total": total,
+        "next_cursor": encode_packet_cursor(records[-1]) if len(records) == limit else None
     }
 
+def export_value(value: Any) -> Any:
+    """Make a column value JSON and CSV friendly"""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+async def export_packet_chunks(export_format: str, limit: Optional[int], cursor, filters: Dict[str, Any]):
+    """Yield an export one encoded chunk of rows at a time"""
+    fields = [field for field, _column in PACKET_FIELDS]
+    # The response outlives request dependencies, so the stream keeps its own session
+    async with AsyncReadSessionLocal() as session:
+        chunks = DatabaseService(session).stream_packets(
+            [column for _field, column in PACKET_FIELDS], limit=limit, cursor=cursor, **filters
+        )
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+            async for rows in chunks:
+                writer.writerows([export_value(value) for value in row] for row in rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        else:
+            async for rows in chunks:
+                yield "".join(
+                    json.dumps(dict(zip(fields, map(export_value, row)))) + "\n" for row in rows
+                )
+
+@router.get("/db/export")
+async def export_db_packets(
+    format: str = "ndjson",
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    protocol: Optional[str] = None,
+    source_ip: Optional[str] = None,
+    dest_ip: Optional[str] = None,
+    is_malicious: Optional[bool] = None,
+    start_time: Optional[datetime.datetime] = None,
+    end_time: Optional[datetime.datetime] = None,
+    connection_id: Optional[str] = None
+):
+    """
+    Export stored packets as NDJSON or CSV, newest first
+
+    Takes the same filters as ``/db``. Rows are streamed from a server-side
+    cursor with chunked transfer, so exports of any size run in constant
+    memory and start downloading right away.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid format: {format} (expected one of {', '.join(EXPORT_FORMATS)})"
+        )
+    logger.info(f"Exporting database packets as {format} (limit={limit})")
+    filters = dict(
+        protocol=protocol, source_ip=source_ip, destination_ip=dest_ip, is_malicious=is_malicious,
+        start_time=start_time, end_time=end_time, connection_id=connection_id
+    )
+    
+    return StreamingResponse(
+        export_packet_chunks(format, limit, parse_packet_cursor(cursor), filters),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="packets.{format}"'}
+    )
+
 @router.post("/start", response_model=Dict[str, Any])
 async def start_capture(settings: Optional[Dict[str, Any]] = None):
     """
@@ -688,43 +800,115 @@ async def update_settings(settings: Dict[str, Any]):
             detail=error_message
         )
 
+@router.get("/blocklist")
+async def get_blocklist(format: str = "text", db: AsyncSession = Depends(get_read_db)):
+    """
+    Addresses seen in malicious packets, as plain text, an ``ipset restore`` script or JSON
+
+    Served from the ``malicious_ips`` summary; each format is rendered once
+    and cached until a packet is flagged.
+    """
+    if format not in BLOCKLIST_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid format: {format} (expected one of {', '.join(BLOCKLIST_MEDIA_TYPES)})"
+        )
+    return Response(content=await DatabaseService(db).get_blocklist(format), media_type=BLOCKLIST_MEDIA_TYPES[format])
+
 @router.get("/db/{packet_id}", response_model=Dict[str, Any])
-async def get_db_packet(packet_id: int):
+async def get_db_packet(packet_id: int, db: AsyncSession = Depends(get_read_db)):
     """
     Get a specific packet from the database by ID
     """
     logger.info(f"Getting database packet {packet_id}")
     
-    # For now, we'll use mock data
-    if not recent_packets:
-        generate_mock_data()
-    
-    # Find packet by ID
-    for packet in recent_packets:
-        if packet["packet_id"] == packet_id:
-            return packet
+    record = await DatabaseService(db).get_packet(packet_id)
+    if record is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Packet with ID {packet_id} not found"
+        )
     
-    # If not found
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail=f"Packet with ID {packet_id} not found"
+    return packet_record_to_dict(record)
+
+def parse_threat_details(data: Dict[str, Any]) -> Dict[str, Any]:
+    """threat_category, confidence_score and notes from a mark-malicious request body"""
+    confidence_score = data.get("confidence_score")
+    if confidence_score is not None:
+        try:
+            confidence_score = float(confidence_score)
+        except (TypeError, ValueError):
+            confidence_score = -1.0
+        if not 0.0 <= confidence_score <= 1.0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="confidence_score must be a number between 0 and 1"
+            )
+    return dict(
+        threat_category=data.get("threat_category"),
+        confidence_score=confidence_score,
+        notes=data.get("notes")
     )
 
+@router.post("/db/mark-malicious", response_model=Dict[str, Any])
+async def mark_packets_as_malicious(
+    data: Dict[str, Any],
+    protocol: Optional[str] = None,
+    source_ip: Optional[str] = None,
+    dest_ip: Optional[str] = None,
+    ip: Optional[str] = None,
+    start_time: Optional[datetime.datetime] = None,
+    end_time: Optional[datetime.datetime] = None,
+    connection_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Mark every stored packet matching the filters as malicious
+
+    Takes the ``/db`` filters as query parameters (``ip`` matches either
+    end; at least one filter is required) and ``threat_category``,
+    ``confidence_score`` and ``notes`` in the body. Matching packets stop
+    expiring and feed the blocklists. Runs in chunks, so it suits whole
+    flows, hosts or time ranges.
+    """
+    details = parse_threat_details(data)
+    logger.info(f"Marking packets as malicious (protocol={protocol}, source_ip={source_ip}, dest_ip={dest_ip}, "
+                f"ip={ip}, start_time={start_time}, end_time={end_time}, connection_id={connection_id})")
+    try:
+        updated = await DatabaseService(db).mark_packets_as_malicious(
+            protocol=protocol, source_ip=source_ip, destination_ip=dest_ip, ip=ip,
+            start_time=start_time, end_time=end_time, connection_id=connection_id, **details
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {
+        "status": "success",
+        "updated": updated,
+        "details": details
+    }
+
 @router.post("/db/{packet_id}/mark-malicious", response_model=Dict[str, Any])
 async def mark_packet_as_malicious(
     packet_id: int,
-    data: Dict[str, Any]
+    data: Dict[str, Any],
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Mark a packet as malicious in the database
     """
     logger.info(f"Marking packet {packet_id} as malicious")
-    
-    # This would update the database in a real implementation
+    details = parse_threat_details(data)
+    try:
+        record = await DatabaseService(db).mark_packet_as_malicious(packet_id, **details)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Packet with ID {packet_id} not found"
+        )
     return {
         "status": "success",
         "message": f"Packet {packet_id} marked as malicious",
-        "details": data
+        "packet": packet_record_to_dict(record)
     }
 
 # Initialize with mock data
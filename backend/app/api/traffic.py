@@ -1,81 +1,45 @@
 from typing import Dict, List, Optional, Any
-from fastapi import APIRouter, HTTPException, Query
-from datetime import datetime, timedelta
-import random
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+import ipaddress
+import json
+import logging
 import time
 
+from ..db.session import AsyncReadSessionLocal, get_read_db
+from ..services.database import DatabaseService
+from ..services.packet_capture import packet_capture
+from ..services.traffic_stats import interval_seconds
+from ..services.cardinality import DIMENSIONS, relative_error
+
+logger = logging.getLogger(__name__)
+
 # Define the router
-router = APIRouter()
-
-# Mock data generator functions
-def generate_mock_connection(unique_id: int = None):
-    """Generate a mock connection"""
-    id_suffix = unique_id if unique_id is not None else random.randint(1000, 9999)
-    
-    countries = ['US', 'CN', 'RU', 'GB', 'DE', 'FR', 'JP', 'IN', 'BR', 'AU']
-    cities = ['New York', 'Beijing', 'Moscow', 'London', 'Berlin', 'Paris', 'Tokyo', 'Mumbai', 'Sao Paulo', 'Sydney']
-    
-    # Source location
-    src_country_idx = random.randint(0, len(countries) - 1)
-    src_country = countries[src_country_idx]
-    src_city = cities[src_country_idx]
-    
-    # Destination location (different from source)
-    dst_country_idx = (src_country_idx + random.randint(1, len(countries) - 1)) % len(countries)
-    dst_country = countries[dst_country_idx]
-    dst_city = cities[dst_country_idx]
-    
-    protocols = ['TCP', 'UDP', 'ICMP']
-    applications = ['HTTP', 'HTTPS', 'SSH', 'DNS', 'SMTP', 'FTP', 'IMAP', None]
-    statuses = ['active', 'closed', 'blocked']
-    
-    # Create connection with reasonable values
-    return {
-        'id': f'conn-{id_suffix}',
-        'source': {
-            'ip': f'192.168.{random.randint(1, 254)}.{random.randint(1, 254)}',
-            'lat': (random.random() * 180) - 90,
-            'lng': (random.random() * 360) - 180,
-            'city': src_city,
-            'country': src_country
-        },
-        'destination': {
-            'ip': f'{random.randint(1, 254)}.{random.randint(1, 254)}.{random.randint(1, 254)}.{random.randint(1, 254)}',
-            'lat': (random.random() * 180) - 90,
-            'lng': (random.random() * 360) - 180,
-            'city': dst_city,
-            'country': dst_country
-        },
-        'protocol': protocols[random.randint(0, len(protocols) - 1)],
-        'source_port': random.randint(1024, 65535),
-        'destination_port': random.randint(1, 1023),
-        'bytes_sent': random.randint(100, 100000),
-        'bytes_received': random.randint(100, 100000),
-        'timestamp': (datetime.now() - timedelta(seconds=random.randint(0, 3600))).isoformat(),
-        'application': applications[random.randint(0, len(applications) - 1)],
-        'status': statuses[random.randint(0, len(statuses) - 1)]
-    }
+router = APIRouter(prefix="/traffic", tags=["traffic"])
 
-def generate_mock_stats():
-    """Generate mock traffic statistics"""
+def flow_to_connection(flow: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a flow row (from the flow table or the connections table) like a Connection"""
+    last_seen = flow.get('last_seen')
     return {
-        'total_connections': random.randint(100, 1000),
-        'active_connections': random.randint(10, 100),
-        'bytes_per_second': random.uniform(1000, 10000),
-        'total_bytes': random.randint(1000000, 10000000),
-        'connections_per_second': random.uniform(1, 10),
-        'top_protocols': {
-            'TCP': random.randint(50, 200),
-            'UDP': random.randint(20, 100),
-            'ICMP': random.randint(5, 30)
-        },
-        'top_applications': {
-            'HTTP': random.randint(20, 100),
-            'HTTPS': random.randint(50, 200),
-            'SSH': random.randint(5, 30),
-            'DNS': random.randint(10, 50)
-        },
-        'timestamp': datetime.now().isoformat()
+        'id': flow['connection_id'],
+        # Geolocation is not resolved for live flows yet
+        'source': {'ip': flow['source_ip'], 'lat': None, 'lng': None, 'city': None, 'country': None},
+        'destination': {'ip': flow['destination_ip'], 'lat': None, 'lng': None, 'city': None, 'country': None},
+        'protocol': flow['protocol'],
+        'source_port': flow['source_port'],
+        'destination_port': flow['destination_port'],
+        'bytes_sent': flow['bytes_sent'],
+        'bytes_received': flow['bytes_received'],
+        'packets_sent': flow['packets_sent'],
+        'packets_received': flow['packets_received'],
+        'timestamp': flow['timestamp'].isoformat(),
+        'last_seen': last_seen.isoformat() if last_seen else None,
+        'duration': flow['duration'],
+        'application': flow['application'],
+        'tcp_state': flow['tcp_state'],
+        'status': flow['status']
     }
 
 # API endpoints
@@ -83,51 +47,84 @@ def generate_mock_stats():
 async def get_current_connections(
     limit: int = Query(25, ge=1, le=1000),
     protocol: Optional[str] = None,
-    application: Optional[str] = None
+    application: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ) -> List[Dict]:
-    """Get current connections with optional filtering"""
+    """Get the most recently active flows with optional filtering"""
     try:
-        # Generate mock connections
-        connections = [generate_mock_connection(i) for i in range(limit)]
-        
-        # Apply filtering if specified
-        if protocol:
-            connections = [conn for conn in connections if conn['protocol'] == protocol]
-        if application:
-            connections = [conn for conn in connections if conn['application'] == application]
-            
-        return connections
+        if packet_capture.fanout:
+            # Each fan-out worker keeps its own flow table and upserts it into the database
+            records = await DatabaseService(db).get_active_connections(limit, protocol, application)
+            flows = [{column.name: getattr(record, column.name) for column in record.__table__.columns}
+                     for record in records]
+        else:
+            flows = packet_capture.flow_table.active(limit, protocol, application)
+        return [flow_to_connection(flow) for flow in flows]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving connections: {str(e)}")
 
+def history_row_to_connection(row: Any) -> Dict[str, Any]:
+    """Shape a joined connection history row like a Connection, locations included"""
+    connection = flow_to_connection(row._mapping)
+    for endpoint in ('source', 'destination'):
+        for field in ('lat', 'lng', 'city', 'country'):
+            connection[endpoint][field] = getattr(row, f"{endpoint}_{field}")
+    return connection
+
+async def connection_history_chunks(start_time: datetime, end_time: datetime, limit: int,
+                                    protocol: Optional[str], application: Optional[str]):
+    """Yield the history as a JSON array, one encoded chunk of rows at a time"""
+    # The response outlives request dependencies, so the stream keeps its own session
+    separator = "["
+    async with AsyncReadSessionLocal() as session:
+        chunks = DatabaseService(session).stream_connection_history(
+            start_time, end_time, limit=limit, protocol=protocol, application=application
+        )
+        try:
+            async for rows in chunks:
+                yield separator + ",".join(json.dumps(history_row_to_connection(row)) for row in rows)
+                separator = ","
+        except Exception as e:
+            if separator == "[":
+                raise
+            # The 200 is already sent; end the array so the client still gets valid JSON
+            logger.error(f"Connection history stream cut short: {e}")
+    yield "[]" if separator == "[" else "]"
+
 @router.get("/connections/history")
 async def get_connection_history(
     start_time: datetime,
     end_time: datetime,
-    limit: int = Query(100, ge=1, le=1000),
+    limit: int = Query(100, ge=1, le=100000),
     protocol: Optional[str] = None,
     application: Optional[str] = None
-) -> List[Dict]:
-    """Get historical connections within specified time range"""
+):
+    """Get stored connections within specified time range, newest first
+
+    Rows are read with both locations joined in and streamed as a JSON
+    array while they arrive, so long ranges run in constant memory.
+    """
+    chunks = connection_history_chunks(start_time, end_time, limit, protocol, application)
+    # Read the first chunk here, so a failing query is still a 500
     try:
-        # Generate mock historical connections
-        connections = [generate_mock_connection(i) for i in range(limit)]
-        
-        # Apply filtering if specified
-        if protocol:
-            connections = [conn for conn in connections if conn['protocol'] == protocol]
-        if application:
-            connections = [conn for conn in connections if conn['application'] == application]
-            
-        return connections
+        first = await chunks.__anext__()
     except Exception as e:
+        await chunks.aclose()
+        logger.error(f"Error retrieving connection history: {e}")
         raise HTTPException(status_code=500, detail=f"Error retrieving connection history: {str(e)}")
 
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(body(), media_type="application/json")
+
 @router.get("/stats/current")
 async def get_current_stats() -> Dict:
     """Get current traffic statistics"""
     try:
-        return generate_mock_stats()
+        return packet_capture.traffic_stats.current()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving stats: {str(e)}")
 
@@ -135,79 +132,111 @@ async def get_current_stats() -> Dict:
 async def get_stats_history(
     start_time: datetime,
     end_time: datetime,
-    interval: str = "1m"
+    interval: str = "1m",
+    db: AsyncSession = Depends(get_read_db)
 ) -> List[Dict]:
     """Get historical statistics within specified time range"""
     try:
-        # Number of data points to generate
-        interval_seconds = 60  # Default 1m
-        if interval.endswith('s'):
-            interval_seconds = int(interval[:-1])
-        elif interval.endswith('m'):
-            interval_seconds = int(interval[:-1]) * 60
-        elif interval.endswith('h'):
-            interval_seconds = int(interval[:-1]) * 3600
-            
-        duration = (end_time - start_time).total_seconds()
-        num_points = min(100, int(duration / interval_seconds))
+        seconds = interval_seconds(interval)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid interval: {interval}")
         
-        # Generate timestamps at regular intervals
-        timestamps = [start_time + timedelta(seconds=i * (duration / max(1, num_points - 1))) for i in range(num_points)]
-        
-        # Generate stats for each timestamp
-        stats_history = []
-        for ts in timestamps:
-            stats = generate_mock_stats()
-            stats['timestamp'] = ts.isoformat()
-            stats_history.append(stats)
-            
-        return stats_history
+    try:
+        # Live rings while they reach back far enough, the rollup tables otherwise
+        traffic_stats = packet_capture.traffic_stats
+        if traffic_stats.covers(start_time.timestamp(), seconds):
+            return traffic_stats.history(start_time.timestamp(), end_time.timestamp(), seconds)
+        history = await DatabaseService(db).get_stats_history(start_time, end_time, interval)
+        return [{**stats.model_dump(), 'packets_per_second': stats.total_packets / seconds,
+                 'timestamp': stats.timestamp.isoformat()} for stats in history]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving stats history: {str(e)}")
 
+def top_keys(dimension: str, duration: str, limit: int) -> List[tuple]:
+    """Largest keys of one heavy-hitter dimension over the last ``duration``."""
+    try:
+        seconds = interval_seconds(duration)
+        keys, _total = packet_capture.heavy_hitters.top(dimension, seconds, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid duration: {duration} ({e})")
+    return keys
+
 @router.get("/top/protocols")
 async def get_top_protocols(
     duration: str = "5m",
     limit: int = Query(10, ge=1, le=100)
 ) -> Dict[str, int]:
-    """Get top protocols by traffic volume"""
-    try:
-        # Generate mock protocol data
-        protocols = {
-            'TCP': random.randint(100, 1000),
-            'UDP': random.randint(50, 500),
-            'ICMP': random.randint(10, 100),
-            'GRE': random.randint(5, 50),
-            'ESP': random.randint(1, 20)
-        }
-        
-        # Sort and limit results
-        sorted_protocols = dict(sorted(protocols.items(), key=lambda x: x[1], reverse=True)[:limit])
-        return sorted_protocols
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving top protocols: {str(e)}")
+    """Get top protocols by traffic volume (bytes)"""
+    return {protocol: count for protocol, count, _max_count in top_keys('protocols', duration, limit)}
 
 @router.get("/top/applications")
 async def get_top_applications(
     duration: str = "5m",
     limit: int = Query(10, ge=1, le=100)
 ) -> Dict[str, int]:
-    """Get top applications by traffic volume"""
+    """Get top applications by traffic volume (bytes)"""
+    return {application: count for application, count, _max_count in top_keys('applications', duration, limit)}
+
+@router.get("/top/talkers")
+async def get_top_talkers(
+    duration: str = "5m",
+    direction: str = "source",
+    limit: int = Query(10, ge=1, le=100)
+) -> List[Dict[str, Any]]:
+    """Get the addresses sending (or receiving) the most bytes.
+
+    ``bytes`` is a lower bound and ``max_bytes`` an upper bound on the true count.
+    """
+    if direction not in ('source', 'destination'):
+        raise HTTPException(status_code=400, detail=f"Invalid direction: {direction}")
+    dimension = 'sources' if direction == 'source' else 'destinations'
+    return [
+        {'ip_address': address, 'bytes': count, 'max_bytes': max_count}
+        for address, count, max_count in top_keys(dimension, duration, limit)
+    ]
+
+@router.get("/top/ports")
+async def get_top_ports(
+    duration: str = "5m",
+    limit: int = Query(10, ge=1, le=100)
+) -> List[Dict[str, Any]]:
+    """Get the service ports (the lower port of each packet) carrying the most bytes"""
+    return [
+        {'port': port, 'bytes': count, 'max_bytes': max_count}
+        for port, count, max_count in top_keys('ports', duration, limit)
+    ]
+
+@router.get("/top/conversations")
+async def get_top_conversations(
+    duration: str = "5m",
+    limit: int = Query(10, ge=1, le=100)
+) -> List[Dict[str, Any]]:
+    """Get the address pairs exchanging the most bytes, both directions combined"""
+    return [
+        {'hosts': list(hosts), 'bytes': count, 'max_bytes': max_count}
+        for hosts, count, max_count in top_keys('conversations', duration, limit)
+    ]
+
+@router.get("/cardinality")
+async def get_cardinality(
+    duration: str = "1h",
+    host: Optional[str] = None
+) -> Dict[str, Any]:
+    """Get distinct counts over the last ``duration``, for all traffic or one local host.
+
+    Counts are HyperLogLog estimates; ``relative_error`` is their standard error.
+    """
+    tracker = packet_capture.cardinality
     try:
-        # Generate mock application data
-        applications = {
-            'HTTPS': random.randint(100, 1000),
-            'HTTP': random.randint(50, 500),
-            'DNS': random.randint(20, 200),
-            'SSH': random.randint(10, 100),
-            'SMTP': random.randint(5, 50),
-            'FTP': random.randint(1, 20),
-            'IMAP': random.randint(1, 15),
-            'POP3': random.randint(1, 10)
-        }
-        
-        # Sort and limit results
-        sorted_applications = dict(sorted(applications.items(), key=lambda x: x[1], reverse=True)[:limit])
-        return sorted_applications
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving top applications: {str(e)}")
+        seconds = interval_seconds(duration)
+        if host is None:
+            counts = tracker.window(seconds) or dict.fromkeys(DIMENSIONS, 0)
+            return {'duration': duration, **counts, 'relative_error': round(relative_error(tracker.precision), 4)}
+        address = ipaddress.ip_address(host).packed
+        counts = tracker.host_count(address, seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if counts is None:
+        raise HTTPException(status_code=404, detail=f"No distinct counts for {host} in the last {duration}")
+    return {'host': host, 'duration': duration, **counts,
+            'relative_error': round(relative_error(tracker.host_precision), 4)}
@@ -9,6 +9,7 @@ logger = logging.getLogger(__name__)
 class GeoIP:
     def __init__(self):
         self.reader = None
+        self.loaded_mtime = None
         self.db_path = os.getenv('GEOIP_DB_PATH', str(Path(__file__).parent.parent / 'data' / 'GeoLite2-City.mmdb'))
         self._init_reader()
 
@@ -16,12 +17,28 @@ class GeoIP:
         """Initialize the GeoIP reader"""
         try:
             if os.path.exists(self.db_path):
+                self.loaded_mtime = os.path.getmtime(self.db_path)
                 self.reader = geoip2.database.Reader(self.db_path)
             else:
                 logger.warning(f"GeoIP database not found at {self.db_path}, using mock data")
         except Exception as e:
             logger.error(f"Failed to initialize GeoIP reader: {e}")
 
+    def reload(self) -> bool:
+        """Reopen the database if the file has changed since it was loaded"""
+        try:
+            mtime = os.path.getmtime(self.db_path)
+        except OSError:
+            return False
+        if mtime == self.loaded_mtime:
+            return False
+        previous = self.reader
+        self._init_reader()
+        if previous is not None and self.reader is not previous:
+            previous.close()
+        logger.info(f"Reloaded GeoIP database from {self.db_path}")
+        return True
+
     def get_location(self, ip: str) -> Dict:
         """Get location information for an IP address"""
         try:
@@ -69,4 +86,6 @@ class GeoIP:
     def __del__(self):
         """Clean up the reader when the object is destroyed"""
         if self.reader:
-            self.reader.close() 
\ No newline at end of file
+            self.reader.close() 
+
+geoip = GeoIP()
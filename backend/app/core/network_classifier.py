@@ -0,0 +1,225 @@
+import ipaddress
+import json
+import logging
+import os
+import socket
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+IPLike = Union[str, int, bytes]
+
+# Networks treated as local, with the label shown for them
+DEFAULT_LOCAL_NETWORKS = [
+    ('127.0.0.0/8', 'localhost'),
+    ('::1/128', 'localhost'),
+    ('10.0.0.0/8', 'Private Network'),
+    ('172.16.0.0/12', 'Private Network'),
+    ('192.168.0.0/16', 'Private Network'),
+    ('100.64.0.0/10', 'Carrier-Grade NAT'),
+    ('169.254.0.0/16', 'Link-Local'),
+    ('fc00::/7', 'Private Network'),
+    ('fe80::/10', 'Link-Local'),
+]
+
+DEFAULT_PROVIDER_NETWORKS_PATH = Path(__file__).parent.parent / 'data' / 'provider_networks.txt'
+
+class CIDRTrie:
+    """Longest-prefix-match trie over IP address bytes.
+
+    A multibit radix trie with an 8-bit stride: each node holds up to 256
+    children keyed by the next address byte, and prefixes that end inside
+    a byte are expanded over the byte values they cover. A lookup is at
+    most 4 dict probes for IPv4 and 16 for IPv6, whatever the table size.
+    """
+
+    __slots__ = ('root', 'size')
+
+    def __init__(self):
+        # node = (children, values); values maps a byte to (prefix length, label)
+        self.root: Tuple[Dict[int, Any], Dict[int, Tuple[int, Any]]] = ({}, {})
+        self.size = 0
+
+    def insert(self, network: bytes, prefixlen: int, label: Any) -> None:
+        """Insert a network given as packed address bytes and a prefix length."""
+        if prefixlen == 0:
+            # A default route covers every first byte
+            self._expand(self.root, 0, 0, 0, label)
+            self.size += 1
+            return
+        depth, bits = divmod(prefixlen - 1, 8)
+        node = self.root
+        for byte in network[:depth]:
+            children = node[0]
+            if byte not in children:
+                children[byte] = ({}, {})
+            node = children[byte]
+        self._expand(node, network[depth], bits + 1, prefixlen, label)
+        self.size += 1
+
+    @staticmethod
+    def _expand(node, byte: int, bits: int, prefixlen: int, label: Any) -> None:
+        values = node[1]
+        first = byte & (0xFF << (8 - bits)) & 0xFF
+        for key in range(first, first + (1 << (8 - bits))):
+            # A more specific prefix inserted earlier keeps its slot
+            current = values.get(key)
+            if current is None or current[0] <= prefixlen:
+                values[key] = (prefixlen, label)
+
+    def lookup(self, address: bytes) -> Any:
+        """Return the label of the longest matching prefix, or None."""
+        best = None
+        node = self.root
+        for byte in address:
+            value = node[1].get(byte)
+            if value is not None:
+                best = value
+            node = node[0].get(byte)
+            if node is None:
+                break
+        return best[1] if best is not None else None
+
+def pack_ip(ip: IPLike) -> Optional[bytes]:
+    """Pack an address (string, int or bytes) into 4 or 16 bytes; ints below 2**32 are IPv4."""
+    if isinstance(ip, str):
+        try:
+            if ':' in ip:
+                return socket.inet_pton(socket.AF_INET6, ip.split('%', 1)[0])
+            return socket.inet_aton(ip) if ip.count('.') == 3 else None
+        except OSError:
+            return None
+    if isinstance(ip, int):
+        if ip < 0:
+            return None
+        return ip.to_bytes(4, 'big') if ip <= 0xFFFFFFFF else ip.to_bytes(16, 'big')
+    if isinstance(ip, (bytes, bytearray)) and len(ip) in (4, 16):
+        return bytes(ip)
+    return None
+
+class NetworkClassifier:
+    """Classifies IP addresses by provider and local network.
+
+    Provider CIDR lists and local networks are compiled into two
+    ``CIDRTrie`` tables per address family. Every provider, local-address
+    and direction check in the capture paths goes through this class.
+    """
+
+    def __init__(self):
+        self.providers = {4: CIDRTrie(), 16: CIDRTrie()}
+        self.local = {4: CIDRTrie(), 16: CIDRTrie()}
+
+    def _insert(self, tables: Dict[int, CIDRTrie], cidr: str, label: str) -> bool:
+        try:
+            network = ipaddress.ip_network(cidr.strip(), strict=False)
+        except ValueError:
+            logger.warning(f"Ignoring invalid network {cidr!r}")
+            return False
+        packed = network.network_address.packed
+        tables[len(packed)].insert(packed, network.prefixlen, label)
+        return True
+
+    def add_provider_network(self, cidr: str, label: str) -> bool:
+        return self._insert(self.providers, cidr, label)
+
+    def add_local_network(self, cidr: str, label: str = 'Local Network') -> bool:
+        return self._insert(self.local, cidr, label)
+
+    def load_file(self, path: Union[str, Path]) -> int:
+        """Load provider networks from a file and return how many were added.
+
+        Accepts plain text (``<cidr> [label]`` per line, the label defaulting
+        to the file name), the AWS ``ip-ranges.json`` feed and the Google
+        ``goog.json``/``cloud.json`` feeds.
+        """
+        path = Path(path)
+        added = 0
+        if path.suffix == '.json':
+            with open(path) as f:
+                data = json.load(f)
+            for entry in data.get('prefixes', []) + data.get('ipv6_prefixes', []):
+                if 'ip_prefix' in entry or 'ipv6_prefix' in entry:
+                    cidr, label = entry.get('ip_prefix') or entry['ipv6_prefix'], 'AWS'
+                else:
+                    cidr = entry.get('ipv4Prefix') or entry.get('ipv6Prefix')
+                    label = 'Google Cloud' if 'scope' in entry else 'Google'
+                if cidr:
+                    added += self.add_provider_network(cidr, label)
+            return added
+
+        with open(path) as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                cidr, _, label = line.partition(' ')
+                added += self.add_provider_network(cidr, label.strip() or path.stem)
+        return added
+
+    def load_defaults(self) -> None:
+        """Load the local networks and the provider lists configured by environment."""
+        for cidr, label in DEFAULT_LOCAL_NETWORKS:
+            self.add_local_network(cidr, label)
+        for cidr in filter(None, os.getenv('LOCAL_NETWORKS', '').split(',')):
+            self.add_local_network(cidr)
+
+        path = Path(os.getenv('PROVIDER_NETWORKS_PATH', str(DEFAULT_PROVIDER_NETWORKS_PATH)))
+        files = sorted(p for p in path.iterdir() if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            try:
+                count = self.load_file(file)
+                logger.info(f"Loaded {count} provider networks from {file}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load provider networks from {file}: {e}")
+
+    def lookup(self, ip: IPLike) -> Optional[str]:
+        """Return the local-network or provider label of an address, or None."""
+        packed = pack_ip(ip)
+        if packed is None:
+            return None
+        return self.local[len(packed)].lookup(packed) or self.providers[len(packed)].lookup(packed)
+
+    def lookup_many(self, ips: Iterable[IPLike]) -> List[Optional[str]]:
+        """Batch form of ``lookup``."""
+        local, providers = self.local, self.providers
+        labels = []
+        for ip in ips:
+            packed = pack_ip(ip)
+            if packed is None:
+                labels.append(None)
+                continue
+            labels.append(local[len(packed)].lookup(packed) or providers[len(packed)].lookup(packed))
+        return labels
+
+    def is_local(self, ip: IPLike) -> bool:
+        packed = pack_ip(ip)
+        return packed is not None and self.local[len(packed)].lookup(packed) is not None
+
+    def is_local_many(self, ips: Iterable[IPLike]) -> List[bool]:
+        """Batch form of ``is_local``."""
+        local = self.local
+        flags = []
+        for ip in ips:
+            packed = pack_ip(ip)
+            flags.append(packed is not None and local[len(packed)].lookup(packed) is not None)
+        return flags
+
+    def direction(self, source_ip: IPLike, destination_ip: IPLike) -> str:
+        """'outgoing' from a local source, 'incoming' to a local destination, else 'unknown'."""
+        if self.is_local(source_ip):
+            return 'outgoing'
+        if self.is_local(destination_ip):
+            return 'incoming'
+        return 'unknown'
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {
+            'provider_networks_v4': self.providers[4].size,
+            'provider_networks_v6': self.providers[16].size,
+            'local_networks_v4': self.local[4].size,
+            'local_networks_v6': self.local[16].size,
+        }
+
+network_classifier = NetworkClassifier()
+network_classifier.load_defaults()
@@ -1,15 +1,20 @@
 from scapy.all import get_if_list, conf, sniff, IP, TCP, UDP
 import time
-import queue
 import logging
 import threading
 from typing import Dict, List, Optional, Callable, Any
 
+from .ring_buffer import RingBuffer
+from ..services.packet_parser import parse_frame
+from ..services.ring_capture import TPacketV3Ring
+
 logger = logging.getLogger(__name__)
 
+IP_PROTOCOL_NUMBERS = {'ICMP': 1, 'TCP': 6, 'UDP': 17}
+
 class PacketCapture:
     def __init__(self):
-        self.packet_queue = queue.Queue(maxsize=10000)
+        self.recent_packets = RingBuffer(10000)
         self.is_capturing = False
         self.capture_thread = None
         self.start_time = None
@@ -24,8 +29,17 @@ class PacketCapture:
             'interface': None,
             'filter': None,
             'promisc': True,
-            'monitor': False
+            'monitor': False,
+            'max_packets': 10000,  # Size of the recent-packets ring
+            'capture_backend': 'scapy',  # 'scapy' or 'tpacket_v3' (Linux mmap ring)
+            'tpacket': {
+                'block_size': 1 << 22,
+                'block_count': 64,
+                'frame_size': 2048,
+                'timeout_ms': 100
+            }
         }
+        self.ring: Optional[TPacketV3Ring] = None
 
     def get_settings(self):
         """Get current packet capture settings."""
@@ -37,6 +51,8 @@ class PacketCapture:
             for key, value in new_settings.items():
                 if key in self.settings and value is not None:
                     self.settings[key] = value
+            if new_settings.get('max_packets'):
+                self.recent_packets.resize(new_settings['max_packets'])
         return self.settings
 
     def start_capture(self, interface=None, settings=None):
@@ -53,6 +69,7 @@ class PacketCapture:
 
         self.is_capturing = True
         self.start_time = time.time()
+        self.ring = None
         self.packet_count = 0
         self.byte_count = 0
         self.packet_stats = {
@@ -82,6 +99,84 @@ class PacketCapture:
         logger.info("Stopped packet capture")
         return True
 
+    def _record_packet(self, packet_info: Dict[str, Any]) -> None:
+        """Classify the application, update counters and keep the packet in the ring."""
+        # Simple application protocol detection
+        if 'source_port' in packet_info or 'destination_port' in packet_info:
+            src_port = packet_info.get('source_port', 0)
+            dst_port = packet_info.get('destination_port', 0)
+            
+            if dst_port == 80 or src_port == 80:
+                packet_info['application'] = 'HTTP'
+            elif dst_port == 443 or src_port == 443:
+                packet_info['application'] = 'HTTPS'
+            elif dst_port == 53 or src_port == 53:
+                packet_info['application'] = 'DNS'
+            elif dst_port == 22 or src_port == 22:
+                packet_info['application'] = 'SSH'
+            elif dst_port == 25 or src_port == 25:
+                packet_info['application'] = 'SMTP'
+        
+        # Update counters
+        self.packet_count += 1
+        self.byte_count += packet_info['length']
+        
+        # Add to the recent-packets ring, overwriting the oldest if full
+        self.recent_packets.append(packet_info)
+
+    def _handle_frame(self, frame: bytes, timestamp: float) -> None:
+        """Build packet info from a raw frame read off the mmap ring."""
+        header = parse_frame(frame)
+        if header is None:
+            return
+        
+        protocol = header['protocol']
+        packet_info = {
+            'source': header['source_ip'],
+            'destination': header['destination_ip'],
+            'protocol': IP_PROTOCOL_NUMBERS.get(protocol, 0),
+            'length': len(frame),
+            'time': timestamp
+        }
+        if protocol in ('TCP', 'UDP'):
+            packet_info['source_port'] = header['source_port']
+            packet_info['destination_port'] = header['destination_port']
+            packet_info['protocol_name'] = protocol
+            self.packet_stats['tcp_packets' if protocol == 'TCP' else 'udp_packets'] += 1
+        else:
+            packet_info['protocol_name'] = 'Other'
+            if protocol == 'ICMP':
+                self.packet_stats['icmp_packets'] += 1
+        
+        self._record_packet(packet_info)
+
+    def _capture_ring(self, iface: Optional[str], filter_str: Optional[str]) -> bool:
+        """Capture from a TPACKET_V3 ring. Returns False if the ring could not be opened."""
+        ring_settings = self.settings['tpacket']
+        ring = TPacketV3Ring(
+            interface=iface,
+            block_size=ring_settings.get('block_size', 1 << 22),
+            block_count=ring_settings.get('block_count', 64),
+            frame_size=ring_settings.get('frame_size', 2048),
+            timeout_ms=ring_settings.get('timeout_ms', 100),
+            promisc=self.settings['promisc'],
+            bpf_filter=filter_str
+        )
+        try:
+            ring.open()
+        except (OSError, ValueError) as e:
+            logger.warning(f"TPACKET_V3 ring unavailable ({e}), falling back to scapy capture")
+            return False
+        
+        self.ring = ring
+        try:
+            while self.is_capturing:
+                for timestamp_ns, frame in ring.read_block(timeout=0.5):
+                    self._handle_frame(frame, timestamp_ns / 1e9)
+        finally:
+            ring.close()
+        return True
+
     def _capture_packets(self):
         """Packet capture thread function."""
         try:
@@ -117,42 +212,16 @@ class PacketCapture:
                         if packet[IP].proto == 1:  # ICMP
                             self.packet_stats['icmp_packets'] += 1
                     
-                    # Simple application protocol detection
-                    if 'source_port' in packet_info or 'destination_port' in packet_info:
-                        src_port = packet_info.get('source_port', 0)
-                        dst_port = packet_info.get('destination_port', 0)
-                        
-                        if dst_port == 80 or src_port == 80:
-                            packet_info['application'] = 'HTTP'
-                        elif dst_port == 443 or src_port == 443:
-                            packet_info['application'] = 'HTTPS'
-                        elif dst_port == 53 or src_port == 53:
-                            packet_info['application'] = 'DNS'
-                        elif dst_port == 22 or src_port == 22:
-                            packet_info['application'] = 'SSH'
-                        elif dst_port == 25 or src_port == 25:
-                            packet_info['application'] = 'SMTP'
-                    
-                    # Update counters
-                    self.packet_count += 1
-                    self.byte_count += len(packet)
-                    
-                    # Add to queue, dropping oldest if full
-                    if self.packet_queue.full():
-                        try:
-                            self.packet_queue.get_nowait()
-                        except queue.Empty:
-                            pass
-                    
-                    try:
-                        self.packet_queue.put_nowait(packet_info)
-                    except queue.Full:
-                        pass
+                    self._record_packet(packet_info)
 
             # Start packet capture
             iface = self.settings['interface'] if self.settings['interface'] not in [None, 'any'] else None
             filter_str = self.settings['filter']
             
+            # Prefer the memory-mapped ring when it is selected and available
+            if self.settings.get('capture_backend') == 'tpacket_v3' and self._capture_ring(iface, filter_str):
+                return
+            
             # Use small count values and loop to allow for clean shutdown
             while self.is_capturing:
                 try:
@@ -173,17 +242,9 @@ class PacketCapture:
             logger.error(f"Exception in capture thread: {e}")
             self.is_capturing = False
 
-    def get_recent_packets(self, limit: int = 100) -> List[Dict]:
-        """Get recent packets from the queue."""
-        packets = []
-        try:
-            for _ in range(min(limit, self.packet_queue.qsize())):
-                if not self.packet_queue.empty():
-                    packets.append(self.packet_queue.get_nowait())
-                else:
-                    break
-        except queue.Empty:
-            pass
+    def get_recent_packets(self, limit: int = 100, since: Optional[int] = None) -> List[Dict]:
+        """Get recent packets without consuming them, newer than ``since`` if given."""
+        packets = [{**packet_info, 'seq': seq} for seq, packet_info in self.recent_packets.snapshot(limit, since)]
         
         # Return packets in reverse order (newest first)
         return list(reversed(packets))
@@ -204,5 +265,8 @@ class PacketCapture:
             'bytes_received': self.byte_count,
             'packets_per_second': self.packet_count / duration,
             'bytes_per_second': self.byte_count / duration,
-            'is_capturing': self.is_capturing
+            'is_capturing': self.is_capturing,
+            'capture_backend': 'tpacket_v3' if self.ring else 'scapy',
+            'ring': self.ring.get_statistics() if self.ring else None,
+            'recent_packets': self.recent_packets.get_statistics()
         }
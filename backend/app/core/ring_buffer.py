@@ -0,0 +1,114 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+class RingBuffer:
+    """Fixed-capacity, preallocated ring of the most recent items.
+
+    Every appended item gets a monotonically increasing sequence number.
+    There is one writer; it never takes a lock, it only stores a
+    ``(seq, item)`` tuple into a preallocated slot and then advances
+    ``head``. Readers never remove anything: ``snapshot`` copies out the
+    slots it wants and drops any whose sequence number no longer matches,
+    because the writer lapped them during the read. Any number of readers
+    can therefore poll the same buffer, and ``since`` cursors let them
+    fetch only what is new.
+
+    ``resize`` and ``clear`` never copy or move items. Resizing starts
+    writing into a fresh slot array, and the old array stays readable until
+    the new one has filled. Clearing moves a floor so older items stop
+    being returned, and sequence numbers keep increasing so cursors remain
+    valid.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        # Current generation: (slots, capacity, first seq written into it)
+        self._generation: Tuple[List[Any], int, int] = ([None] * capacity, capacity, 0)
+        # Generation replaced by the last resize, readable until overwritten
+        self._previous: Optional[Tuple[List[Any], int, int]] = None
+        self._floor = 0
+        self.head = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._generation[1]
+
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the newest item, or -1 when nothing was appended yet."""
+        return self.head - 1
+
+    def append(self, item: Any) -> int:
+        """Store an item, overwriting the oldest when full, and return its sequence number."""
+        seq = self.head
+        slots, capacity, _base = self._generation
+        slots[seq % capacity] = (seq, item)
+        # Publish only after the slot is written
+        self.head = seq + 1
+        return seq
+
+    def _oldest(self, head: int) -> int:
+        slots, capacity, base = self._generation
+        oldest = head - capacity
+        previous = self._previous
+        if oldest < base and previous is not None:
+            # Items written before the resize may still be in the old slots
+            oldest = max(oldest, base - previous[1])
+        return max(oldest, self._floor, 0)
+
+    def __len__(self) -> int:
+        head = self.head
+        return head - self._oldest(head)
+
+    def snapshot(self, limit: Optional[int] = None, since: Optional[int] = None) -> List[Tuple[int, Any]]:
+        """Return ``(seq, item)`` pairs, oldest first, without consuming them.
+
+        Only items with a sequence number above ``since`` are returned, and
+        only the newest ``limit`` of those when ``limit`` is given.
+        """
+        head = self.head
+        start = self._oldest(head)
+        if since is not None:
+            start = max(start, since + 1)
+        if limit is not None:
+            start = max(start, head - limit)
+
+        slots, capacity, base = self._generation
+        previous = self._previous
+        entries = []
+        for seq in range(start, head):
+            if seq >= base:
+                entry = slots[seq % capacity]
+            elif previous is not None:
+                entry = previous[0][seq % previous[1]]
+            else:
+                continue
+            # The writer may have lapped this slot since head was read
+            if entry is not None and entry[0] == seq:
+                entries.append(entry)
+        return entries
+
+    def items(self, limit: Optional[int] = None, since: Optional[int] = None) -> List[Any]:
+        """Like ``snapshot`` but without the sequence numbers."""
+        return [item for _seq, item in self.snapshot(limit, since)]
+
+    def resize(self, capacity: int) -> None:
+        """Change the capacity without copying; items already stored stay readable."""
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if capacity == self.capacity:
+            return
+        self._previous = self._generation
+        self._generation = ([None] * capacity, capacity, self.head)
+
+    def clear(self) -> None:
+        """Forget all stored items; sequence numbers keep increasing."""
+        self._floor = self.head
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {
+            'capacity': self.capacity,
+            'size': len(self),
+            'head': self.head,
+            'oldest_seq': self._oldest(self.head),
+        }
@@ -0,0 +1,238 @@
+import asyncio
+import inspect
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class IntervalTrigger:
+    """Fires every ``seconds``, plus up to ``jitter`` seconds at random."""
+
+    def __init__(self, seconds: float, jitter: float = 0.0):
+        if seconds <= 0:
+            raise ValueError(f"Interval must be positive: {seconds}")
+        self.seconds = seconds
+        self.jitter = jitter
+
+    def next_run(self, after: datetime) -> datetime:
+        return after + timedelta(seconds=self.seconds + random.uniform(0, self.jitter))
+
+    def __str__(self) -> str:
+        return f"every {self.seconds}s"
+
+def _parse_field(field: str, low: int, high: int) -> Set[int]:
+    """Values matched by one cron field: ``*``, ``5``, ``1-5``, ``*/15``, ``10-50/20`` and lists of those."""
+    values = set()
+    for part in field.split(','):
+        span, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if span == '*':
+            start, end = low, high
+        elif '-' in span:
+            start, end = map(int, span.split('-', 1))
+        else:
+            start = int(span)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"Invalid cron field: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronTrigger:
+    """Fires on a five-field cron schedule in local time, plus up to ``jitter`` seconds.
+
+    Fields are minute, hour, day of month, month and day of week (0 or 7 is
+    Sunday). As in cron, when both day fields are restricted a day matching
+    either one fires.
+    """
+
+    def __init__(self, expression: str, jitter: float = 0.0):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        self.expression = expression
+        self.jitter = jitter
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        self.weekdays = {day % 7 for day in _parse_field(fields[4], 0, 7)}
+        self.either_day = fields[2] != '*' and fields[4] != '*'
+        # Fail now on schedules such as 30 February
+        self.next_run(datetime.now())
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        return day or weekday if self.either_day else day and weekday
+
+    def next_run(self, after: datetime) -> datetime:
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Every schedule that can fire does so within a leap-year cycle
+        limit = moment + timedelta(days=4 * 366)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment + timedelta(seconds=random.uniform(0, self.jitter))
+        raise ValueError(f"Cron expression never fires: {self.expression}")
+
+    def __str__(self) -> str:
+        return self.expression
+
+class Job:
+    """A function run by the scheduler, with its trigger and metrics."""
+
+    def __init__(self, name: str, func: Callable[[], Any], trigger):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.next_run: Optional[datetime] = None
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {
+            'runs': 0,
+            'failures': 0,
+            'rows': 0,
+            'seconds': 0.0,
+            'last_run': None,
+            'last_seconds': None,
+            'last_rows': None,
+            'last_error': None,
+        }
+
+class JobScheduler:
+    """Runs the app's background jobs on the API server's event loop.
+
+    Each job waits for its trigger, runs, and records how long it took and
+    how many rows it handled (when it returns a count). A job never
+    overlaps itself: a run that is due while the previous one is still
+    going waits for it. Jobs may be coroutine functions or plain functions;
+    plain ones run on the loop and must be quick.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self.loop is not None
+
+    def add_job(self, name: str, func: Callable[[], Any], trigger) -> Job:
+        """Add a job, replacing any job of the same name."""
+        previous = self.jobs.get(name)
+        if previous is not None and previous.task is not None:
+            previous.task.cancel()
+        job = self.jobs[name] = Job(name, func, trigger)
+        if self.is_running:
+            job.task = self.loop.create_task(self._schedule(job))
+        return job
+
+    def reschedule(self, name: str, trigger) -> None:
+        """Give a job a new trigger; a run in progress finishes first."""
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        job.trigger = trigger
+        if self.is_running and not job.running:
+            self.loop.call_soon_threadsafe(self._restart, job)
+
+    def run_now(self, name: str) -> None:
+        """Run a job as soon as possible, from any thread; its schedule carries on from there."""
+        job = self.jobs.get(name)
+        if job is not None and self.is_running:
+            self.loop.call_soon_threadsafe(self._restart, job, True)
+
+    def _restart(self, job: Job, immediately: bool = False) -> None:
+        if job.running:
+            return
+        if job.task is not None:
+            job.task.cancel()
+        job.task = self.loop.create_task(self._schedule(job, immediately))
+
+    def start(self) -> None:
+        """Start every job; call from the event loop that should run them."""
+        if self.is_running:
+            return
+        self.loop = asyncio.get_running_loop()
+        for job in self.jobs.values():
+            job.task = self.loop.create_task(self._schedule(job))
+        logger.info(f"Started job scheduler: {', '.join(f'{job.name} ({job.trigger})' for job in self.jobs.values())}")
+
+    async def stop(self) -> None:
+        """Cancel every job, waiting for runs in progress to be cancelled."""
+        if not self.is_running:
+            return
+        tasks = [job.task for job in self.jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self.jobs.values():
+            job.task = None
+            job.next_run = None
+        self.loop = None
+        logger.info("Stopped job scheduler")
+
+    async def _schedule(self, job: Job, immediately: bool = False) -> None:
+        if immediately:
+            await self.run_job(job)
+        while True:
+            job.next_run = job.trigger.next_run(datetime.now())
+            await asyncio.sleep(max((job.next_run - datetime.now()).total_seconds(), 0))
+            await self.run_job(job)
+
+    async def run_job(self, job: Job) -> Any:
+        """Run a job once and record its metrics."""
+        job.running = True
+        started = time.monotonic()
+        result = None
+        try:
+            result = job.func()
+            if inspect.isawaitable(result):
+                result = await result
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.stats['failures'] += 1
+            job.stats['last_error'] = str(e)
+            logger.error(f"Job {job.name} failed: {e}")
+        else:
+            job.stats['last_error'] = None
+        finally:
+            job.running = False
+            seconds = time.monotonic() - started
+            job.stats['runs'] += 1
+            job.stats['seconds'] += seconds
+            job.stats['last_seconds'] = seconds
+            job.stats['last_run'] = datetime.now().isoformat()
+        rows = result if isinstance(result, int) and not isinstance(result, bool) else None
+        job.stats['last_rows'] = rows
+        if rows is not None:
+            job.stats['rows'] += rows
+        return result
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            'is_running': self.is_running,
+            'jobs': {
+                job.name: {
+                    **job.stats,
+                    'trigger': str(job.trigger),
+                    'running': job.running,
+                    'next_run': job.next_run.isoformat() if job.next_run else None,
+                }
+                for job in self.jobs.values()
+            },
+        }
+
+scheduler = JobScheduler()
@@ -1,24 +1,169 @@
+from sqlalchemy import delete, event, func, inspect, or_, select, text, update
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 import os
+import threading
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 # Get database URL from environment or use SQLite as default
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
     f"sqlite+aiosqlite:///{Path(__file__).parent.parent}/nautscan.db"
 )
 
-# Create async engine
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=False,  # Set to True for SQL query logging
-    future=True
-)
+# SQLite tuning, chosen with SQLITE_PROFILE; pragmas are set on every new connection
+SQLITE_PROFILES = {
+    # SQLite's own defaults: rollback journal and an fsync on every commit
+    'stock': {
+        'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000},
+        'read_pool_size': 4,
+    },
+    # Default deployment, sized for a Raspberry Pi on an SD card. WAL lets
+    # readers run alongside the writer, and NORMAL only syncs at checkpoints
+    # (a power cut can lose the last commits but not corrupt the file).
+    # Checkpoints are made less often, so the WAL is written back in
+    # fewer, larger runs.
+    'default': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -16384,  # KiB of page cache per connection
+            'mmap_size': 134217728,  # bytes of the file read through a memory map
+            'temp_store': 'MEMORY',
+            'wal_autocheckpoint': 4000,  # pages written to the WAL before a checkpoint
+            'busy_timeout': 5000,
+        },
+        'read_pool_size': 2,
+    },
+    # As default, but every commit is synced, for boxes prone to power loss
+    'durable': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'FULL',
+            'cache_size': -16384,
+            'mmap_size': 134217728,
+            'temp_store': 'MEMORY',
+            'wal_autocheckpoint': 4000,
+            'busy_timeout': 5000,
+        },
+        'read_pool_size': 2,
+    },
+}
+
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "default")
+
+def _set_pragmas(pragmas: dict, read_only: bool = False):
+    """Connect listener that applies ``pragmas`` to each new SQLite connection."""
+    def on_connect(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            # The journal mode is stored in the file; only the writer sets it
+            if read_only and name == 'journal_mode':
+                continue
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+    return on_connect
+
+class WriterSessionFactory:
+    """Session factory that lets one writer session exist at a time.
+
+    SQLite allows one writer, and writers racing for its lock only wait
+    or fail with "database is locked". The lock here makes them queue
+    instead, across threads and event loops (the packet writer runs its
+    own). One connection stays checked in for all of them. Long chunked
+    writes call ``handoff`` between chunks so queued writers get a turn.
+    Without ``serialize`` (PostgreSQL) sessions are handed out as they are.
+    """
+
+    def __init__(self, factory: sessionmaker, serialize: bool):
+        self.factory = factory
+        self.lock = threading.Lock() if serialize else None
+
+    @asynccontextmanager
+    async def __call__(self):
+        if self.lock is None:
+            async with self.factory() as session:
+                yield session
+            return
+        await self._acquire()
+        session = None
+        try:
+            async with self.factory() as session:
+                session.info['writer'] = self
+                session.info['writer_lock_held'] = True
+                yield session
+        finally:
+            if session is None or session.info.get('writer_lock_held'):
+                self.lock.release()
+
+    async def _acquire(self) -> None:
+        # Polled rather than awaited in a thread, so a cancelled waiter never ends up holding it
+        while not self.lock.acquire(blocking=False):
+            await asyncio.sleep(0.002)
+
+    async def handoff(self, session: AsyncSession, pause: float = 0.0) -> None:
+        """Let queued writers in between two transactions of ``session``.
+
+        Call right after a commit, when the session's connection is back in
+        the pool. The lock is released for ``pause`` seconds (at least one
+        polling interval) and taken back before returning.
+        """
+        self.lock.release()
+        session.info['writer_lock_held'] = False
+        await asyncio.sleep(max(pause, 0.004))
+        await self._acquire()
+        session.info['writer_lock_held'] = True
+
+def create_engines(database_url: str = DATABASE_URL, profile: str = SQLITE_PROFILE):
+    """Create the writer and reader engines for ``database_url``.
+
+    A SQLite file gets the pragmas of ``profile``, one writer connection
+    and a separate pool of read-only connections. Other databases use
+    one engine for both.
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        engine = create_async_engine(database_url, echo=False, future=True)
+        return engine, engine
+
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile: {profile} (expected one of {', '.join(SQLITE_PROFILES)})")
+    settings = SQLITE_PROFILES[profile]
+    write_engine = create_async_engine(
+        database_url,
+        echo=False,  # Set to True for SQL query logging
+        pool_size=1,
+        max_overflow=0
+    )
+    event.listen(write_engine.sync_engine, "connect", _set_pragmas(settings['pragmas']))
+    read_engine = create_async_engine(
+        database_url,
+        echo=False,
+        pool_size=settings['read_pool_size'],
+        max_overflow=settings['read_pool_size']
+    )
+    event.listen(read_engine.sync_engine, "connect", _set_pragmas(settings['pragmas'], read_only=True))
+    logger.info(f"Using SQLite profile '{profile}' for {url.database}")
+    return write_engine, read_engine
 
-# Create async session factory
-AsyncSessionLocal = sessionmaker(
-    engine,
+# Writes go through ``engine``; reads can use ``read_engine`` (the same engine off SQLite)
+engine, read_engine = create_engines()
+
+# Create async session factories
+AsyncSessionLocal = WriterSessionFactory(
+    sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+    serialize=read_engine is not engine
+)
+AsyncReadSessionLocal = sessionmaker(
+    read_engine,
     class_=AsyncSession,
     expire_on_commit=False
 )
@@ -31,8 +176,87 @@ async def get_db():
         finally:
             await session.close()
 
+async def get_read_db():
+    """Dependency for a read-only session, which does not wait for writers"""
+    async with AsyncReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+def _add_missing_columns(connection) -> None:
+    """Add model columns missing from tables created by an older version.
+
+    ``create_all`` skips tables that already exist, so columns added to a
+    model since are added here. Scalar defaults become the column default,
+    which also fills existing rows.
+    """
+    from ..models.database import Base
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = (f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} "
+                   f"{column.type.compile(dialect=connection.dialect)}")
+            if column.default is not None and column.default.is_scalar:
+                ddl += f" DEFAULT {column.default.arg!r}"
+            logger.info(f"Adding column {table.name}.{column.name}")
+            connection.execute(text(ddl))
+
+def _create_indexes(connection) -> None:
+    """Create indexes added to the models after their tables already existed."""
+    from ..models.database import Base
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def _merge_duplicate_locations(connection) -> None:
+    """Fold duplicate places into one row, once, before their unique index is created."""
+    from ..models.database import LocationRecord, ConnectionRecord
+    if 'uq_locations_place' in {index['name'] for index in inspect(connection).get_indexes('locations')}:
+        return
+    locations = LocationRecord.__table__
+    connections = ConnectionRecord.__table__
+    place = (locations.c.latitude, locations.c.longitude, locations.c.city, locations.c.country)
+    connection.execute(
+        update(locations)
+        .where(or_(locations.c.city.is_(None), locations.c.country.is_(None)))
+        .values(city=func.coalesce(locations.c.city, ''), country=func.coalesce(locations.c.country, ''))
+    )
+    duplicated = connection.execute(
+        select(func.min(locations.c.id), *place).group_by(*place).having(func.count() > 1)
+    ).all()
+    for keep, latitude, longitude, city, country in duplicated:
+        others = select(locations.c.id).where(
+            locations.c.latitude == latitude, locations.c.longitude == longitude,
+            locations.c.city == city, locations.c.country == country, locations.c.id != keep
+        )
+        for column in (connections.c.source_id, connections.c.destination_id):
+            connection.execute(update(connections).where(column.in_(others)).values({column: keep}))
+        connection.execute(delete(locations).where(locations.c.id.in_(others)))
+
 async def init_db():
     """Initialize database tables"""
     from ..models.database import Base
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all) 
\ No newline at end of file
+    async with AsyncSessionLocal() as session:
+        connection = await session.connection()
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.run_sync(_add_missing_columns)
+        await connection.run_sync(_merge_duplicate_locations)
+        await connection.run_sync(_create_indexes)
+        await session.commit()
+
+        # Location ids for connection upserts, and the blocklist summary the first time
+        from ..services.database import DatabaseService
+        await DatabaseService(session).load_location_ids()
+        await DatabaseService(session).rebuild_malicious_ips(if_empty=True)
+
+        # SQLite keeps packets in day tables; move any stored before that
+        from ..services.packet_partitions import packet_partitions
+        await packet_partitions.migrate(session)
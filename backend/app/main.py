@@ -21,6 +21,18 @@ except ImportError as e:
     from fastapi import APIRouter
     packets_router = APIRouter(prefix="/packets", tags=["packets"])
 
+try:
+    from .api.traffic import router as traffic_router
+    logger.info("Successfully imported traffic router")
+except ImportError as e:
+    logger.error(f"Failed to import traffic router: {e}")
+    from fastapi import APIRouter
+    traffic_router = APIRouter(prefix="/traffic", tags=["traffic"])
+
+from .core.scheduler import scheduler
+from .db.session import init_db
+from .services.jobs import register_jobs
+
 # Create FastAPI application
 app = FastAPI(
     title="NautScan API",
@@ -37,6 +49,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Create tables and start background jobs (housekeeping, rollups, cache eviction, GeoIP reloads)
+@app.on_event("startup")
+async def startup():
+    try:
+        await init_db()
+    except Exception as e:
+        logger.error(f"Failed to initialize database: {e}")
+    register_jobs(scheduler)
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await scheduler.stop()
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -47,7 +73,13 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+# Background job metrics: runs, failures, durations and rows handled
+@app.get("/jobs")
+async def get_jobs():
+    return scheduler.get_statistics()
+
 # Include API routers
 app.include_router(packets_router, prefix="/api")
+app.include_router(traffic_router, prefix="/api")
 
-logger.info("API router initialized with prefix /api and packets router")
+logger.info("API routers initialized with prefix /api (packets, traffic)")
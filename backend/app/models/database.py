@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Boolean, Text, LargeBinary
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, JSON, Boolean, Text, LargeBinary, Index, Sequence
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
@@ -6,6 +6,10 @@ Base = declarative_base()
 
 class LocationRecord(Base):
     __tablename__ = "locations"
+    # One row per place, so locations can be upserted; unknown names are stored as ''
+    __table_args__ = (
+        Index("uq_locations_place", "latitude", "longitude", "city", "country", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     latitude = Column(Float)
@@ -19,38 +23,55 @@ class LocationRecord(Base):
 
 class ConnectionRecord(Base):
     __tablename__ = "connections"
+    # History lists a time range newest first, optionally for one protocol and application
+    __table_args__ = (
+        Index("ix_connections_timestamp_protocol_application", "timestamp", "protocol", "application"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     connection_id = Column(String, index=True)  # Composite identifier for the connection
     source_id = Column(Integer, ForeignKey("locations.id"))
     destination_id = Column(Integer, ForeignKey("locations.id"))
     protocol = Column(String)
+    source_ip = Column(String, nullable=True, index=True)
     source_port = Column(Integer)
+    destination_ip = Column(String, nullable=True, index=True)
     destination_port = Column(Integer)
-    bytes_sent = Column(Integer, default=0)
-    bytes_received = Column(Integer, default=0)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    bytes_sent = Column(BigInteger, default=0)
+    bytes_received = Column(BigInteger, default=0)
+    packets_sent = Column(BigInteger, default=0)
+    packets_received = Column(BigInteger, default=0)
+    timestamp = Column(DateTime, default=datetime.utcnow)  # First packet of the flow
+    last_seen = Column(DateTime, nullable=True)
     duration = Column(Float, nullable=True)
     application = Column(String, nullable=True)
+    tcp_state = Column(String, nullable=True)  # syn_sent, established, closing, closed, reset, ...
     status = Column(String, default="active")
 
     # Relationships
     source = relationship("LocationRecord", back_populates="source_connections", foreign_keys=[source_id])
     destination = relationship("LocationRecord", back_populates="destination_connections", foreign_keys=[destination_id])
 
-class TrafficStatsRecord(Base):
-    __tablename__ = "traffic_stats"
-
+class TrafficStatsColumns:
+    # Columns shared by the minute and hour traffic rollups
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
-    total_connections = Column(Integer, default=0)
-    active_connections = Column(Integer, default=0)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)  # Start of the bucket
+    total_connections = Column(Integer, default=0)  # Distinct connections seen in the bucket (estimate)
+    active_connections = Column(Integer, default=0)  # Most concurrent flows
     bytes_per_second = Column(Float, default=0.0)
-    total_bytes = Column(Integer, default=0)
-    connections_per_second = Column(Float, default=0.0)
+    total_bytes = Column(BigInteger, default=0)
+    total_packets = Column(BigInteger, default=0)
+    unique_hosts = Column(Integer, default=0)  # Distinct addresses seen in the bucket (estimate)
+    connections_per_second = Column(Float, default=0.0)  # Flows started per second
     top_protocols = Column(JSON)  # Store as JSON for flexibility
     top_applications = Column(JSON)  # Store as JSON for flexibility
 
+class TrafficStatsRecord(TrafficStatsColumns, Base):
+    __tablename__ = "traffic_stats"  # One row per minute
+
+class TrafficStatsHourlyRecord(TrafficStatsColumns, Base):
+    __tablename__ = "traffic_stats_hourly"  # One row per hour
+
 class Alert(Base):
     __tablename__ = "alerts"
 
@@ -62,22 +83,27 @@ class Alert(Base):
     details = Column(JSON, nullable=True)
     connection_id = Column(String, nullable=True)  # Reference to related connection if any
 
-class PacketRecord(Base):
-    __tablename__ = "packets"
+class MaliciousIpRecord(Base):
+    __tablename__ = "malicious_ips"  # Per-address summary of malicious packets, behind the blocklists
 
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
-    
+    ip = Column(String, primary_key=True)
+    occurrence_count = Column(BigInteger, default=0)  # Malicious packets with this address at either end
+    first_seen = Column(DateTime)  # Timestamps of the first and last of those packets
+    last_seen = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)  # Last time a packet was added
+
+class PacketColumns:
+    # Columns shared by the packets table and the malicious packet archive
     # Source and destination information
-    source_ip = Column(String, index=True)
+    source_ip = Column(String)
     source_port = Column(Integer, nullable=True) 
     source_device_name = Column(String, nullable=True)  # Local device name from nmap or hostname
-    destination_ip = Column(String, index=True)
+    destination_ip = Column(String)
     destination_port = Column(Integer, nullable=True)
     destination_device_name = Column(String, nullable=True)  # Remote device name or provider
     
     # Protocol information
-    protocol = Column(String, index=True)  # TCP, UDP, ICMP, etc.
+    protocol = Column(String)  # TCP, UDP, ICMP, etc.
     protocol_version = Column(String, nullable=True)  # IPv4, IPv6
     
     # Packet details
@@ -94,7 +120,7 @@ class PacketRecord(Base):
     packet_summary = Column(Text, nullable=True)  # Scapy summary of packet
     
     # Classification fields
-    is_malicious = Column(Boolean, default=False, index=True)
+    is_malicious = Column(Boolean, default=False)
     threat_category = Column(String, nullable=True)  # Type of threat if malicious
     confidence_score = Column(Float, nullable=True)  # Confidence of malicious classification (0-1)
     notes = Column(Text, nullable=True)  # Analyst notes
@@ -104,4 +130,31 @@ class PacketRecord(Base):
     
     # Timestamps for housekeeping
     created_at = Column(DateTime, default=datetime.utcnow)
-    expire_at = Column(DateTime, nullable=True, index=True)  # When to delete this record 
\ No newline at end of file
+    expire_at = Column(DateTime, nullable=True, index=True)  # When to delete this record
+
+class PacketRecord(PacketColumns, Base):
+    __tablename__ = "packets"
+    # Every listing is newest first on (timestamp, id); each filter gets that order
+    # behind it so a page is one index range scan, however deep
+    __table_args__ = (
+        Index("ix_packets_timestamp_id", "timestamp", "id"),
+        Index("ix_packets_protocol_timestamp", "protocol", "timestamp", "id"),
+        Index("ix_packets_source_ip_timestamp", "source_ip", "timestamp", "id"),
+        Index("ix_packets_destination_ip_timestamp", "destination_ip", "timestamp", "id"),
+        Index("ix_packets_is_malicious_timestamp", "is_malicious", "timestamp", "id"),
+        # One partition per day on PostgreSQL; SQLite gets a table per day instead (see packet_partitions)
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+    # The partition key has to be part of the primary key; every partition draws ids from one sequence
+    id = Column(Integer, Sequence("packets_id_seq"), primary_key=True)
+    timestamp = Column(DateTime, primary_key=True, default=datetime.utcnow)
+
+class MaliciousPacketRecord(PacketColumns, Base):
+    __tablename__ = "malicious_packets"  # Malicious packets kept after their day's partition is dropped
+    __table_args__ = (
+        Index("ix_malicious_packets_timestamp_id", "timestamp", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # The id it had in packets
+    timestamp = Column(DateTime, default=datetime.utcnow) 
\ No newline at end of file
@@ -27,6 +27,8 @@ class TrafficStats(BaseModel):
     active_connections: int = Field(0, description="Number of active connections")
     bytes_per_second: float = Field(0.0, description="Current traffic rate in bytes/second")
     total_bytes: int = Field(0, description="Total bytes transferred")
+    total_packets: int = Field(0, description="Total packets transferred")
+    unique_hosts: int = Field(0, description="Distinct host addresses seen")
     connections_per_second: float = Field(0.0, description="New connections per second")
     top_protocols: dict[str, int] = Field(default_factory=dict, description="Protocol distribution")
     top_applications: dict[str, int] = Field(default_factory=dict, description="Application distribution")
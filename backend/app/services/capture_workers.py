@@ -0,0 +1,236 @@
+import logging
+import multiprocessing
+import itertools
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .ring_capture import TPACKET_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+# PACKET_FANOUT modes (linux/if_packet.h)
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+
+# Counters that are summed across workers
+MERGED_COUNTERS = (
+    'total_packets',
+    'tcp_packets',
+    'udp_packets',
+    'icmp_packets',
+    'bytes_received',
+    'packets_per_second',
+    'bytes_per_second',
+)
+
+def _fanout_worker(index: int, interface: Optional[str], settings: Dict[str, Any],
+                   fanout_arg: int, cpu: Optional[int], report_interval: float,
+                   results: multiprocessing.Queue, stop_event) -> None:
+    """Capture worker process: parse, enrich and detect on its share of the flows."""
+    from .packet_capture import PacketCapture
+
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Capture worker {index} could not be pinned to CPU {cpu}: {e}")
+
+    capture = PacketCapture()
+    capture.update_settings({**settings, 'capture_backend': 'tpacket_v3'})
+    capture.fanout_arg = fanout_arg
+    # Give every worker its own id range so packet ids stay unique in the parent
+    capture.packet_ids = itertools.count((index + 1) << 40)
+    capture.flow_table.flow_ids = itertools.count((index + 1) << 40)
+
+    # Last completed second, heavy-hitter minute and sketch minute already forwarded to the parent
+    seconds_cursor = None
+    buckets_cursor = None
+    sketches_cursor = None
+
+    def report():
+        # Forward statistics, completed seconds and minutes, and up to 100 packets captured since the last report
+        nonlocal seconds_cursor, buckets_cursor, sketches_cursor
+        cursor = None
+        while not stop_event.wait(report_interval):
+            entries = capture.recent_packets.snapshot(limit=100, since=cursor)
+            if entries:
+                cursor = entries[-1][0]
+            recent = [packet for _seq, packet in entries]
+            seconds, next_cursor = capture.traffic_stats.seconds_since(seconds_cursor)
+            buckets, next_buckets_cursor = capture.heavy_hitters.buckets_since(buckets_cursor)
+            sketches, next_sketches_cursor = capture.cardinality.buckets_since(sketches_cursor)
+            try:
+                results.put_nowait((index, capture.get_statistics(), recent, seconds, buckets, sketches))
+                seconds_cursor = next_cursor
+                buckets_cursor = next_buckets_cursor
+                sketches_cursor = next_sketches_cursor
+            except queue.Full:
+                pass
+        capture.should_stop.set()
+
+    reporter = threading.Thread(target=report, daemon=True)
+    reporter.start()
+
+    if settings.get('save_to_database', True):
+        capture.packet_writer.start()
+    try:
+        capture._capture_packets(interface)
+    finally:
+        capture.resolver.stop()
+        capture.packet_writer.stop()
+        seconds, _cursor = capture.traffic_stats.seconds_since(seconds_cursor)
+        buckets, _cursor = capture.heavy_hitters.buckets_since(buckets_cursor, final=True)
+        sketches, _cursor = capture.cardinality.buckets_since(sketches_cursor, final=True)
+        results.put((index, capture.get_statistics(), [], seconds, buckets, sketches))
+
+class FanoutCapture:
+    """Capture with N worker processes sharing one interface through PACKET_FANOUT.
+
+    Every worker opens its own TPACKET_V3 ring and joins the same fan-out
+    group in hash mode, so the kernel keeps each flow on one worker and
+    flow state never has to be shared between processes.
+    """
+
+    def __init__(self,
+                 interface: Optional[str],
+                 settings: Dict[str, Any],
+                 workers: int = 0,
+                 pin_cpus: Any = False,
+                 report_interval: float = 1.0,
+                 on_packets=None,
+                 on_seconds=None,
+                 on_buckets=None,
+                 on_sketches=None):
+        self.interface = interface
+        self.settings = settings
+        self.workers = workers or os.cpu_count() or 1
+        self.pin_cpus = pin_cpus
+        self.report_interval = report_interval
+        # Called in the parent with each batch of recent packets from the workers
+        self.on_packets = on_packets
+        # Called with each batch of completed per-second traffic counters
+        self.on_seconds = on_seconds
+        # Called with each batch of closed heavy-hitter minutes
+        self.on_buckets = on_buckets
+        # Called with each batch of distinct-count sketches
+        self.on_sketches = on_sketches
+
+        self.context = multiprocessing.get_context('spawn')
+        self.processes: List[multiprocessing.Process] = []
+        self.results: Optional[multiprocessing.Queue] = None
+        self.stop_event = None
+        self.collector_thread: Optional[threading.Thread] = None
+        self.worker_stats: Dict[int, Dict[str, Any]] = {}
+        self.start_time: Optional[float] = None
+
+    @staticmethod
+    def is_available() -> bool:
+        return TPACKET_AVAILABLE
+
+    @property
+    def is_running(self) -> bool:
+        return any(process.is_alive() for process in self.processes)
+
+    def _worker_cpus(self) -> List[Optional[int]]:
+        """CPU for each worker: an explicit list, round-robin over usable CPUs, or no pinning."""
+        if not self.pin_cpus:
+            return [None] * self.workers
+        if isinstance(self.pin_cpus, (list, tuple)):
+            cpus = list(self.pin_cpus)
+        else:
+            cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+        return [cpus[i % len(cpus)] for i in range(self.workers)]
+
+    def start(self) -> None:
+        """Start the worker processes and the statistics collector."""
+        if self.is_running:
+            raise RuntimeError("Fan-out capture is already running")
+
+        # One fan-out group per capture; the id only has to be unique on this host
+        group_id = os.getpid() & 0xFFFF
+        fanout_arg = group_id | ((PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG) << 16)
+
+        self.results = self.context.Queue(maxsize=self.workers * 16)
+        self.stop_event = self.context.Event()
+        self.worker_stats = {}
+        self.start_time = time.time()
+        self.processes = []
+        for index, cpu in enumerate(self._worker_cpus()):
+            process = self.context.Process(
+                target=_fanout_worker,
+                args=(index, self.interface, self.settings, fanout_arg, cpu,
+                      self.report_interval, self.results, self.stop_event),
+                name=f"capture-worker-{index}",
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+
+        self.collector_thread = threading.Thread(target=self._collect, daemon=True)
+        self.collector_thread.start()
+        logger.info(f"Started {self.workers} fan-out capture workers on {self.interface or 'any'} (group {group_id})")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Signal the workers to stop and wait for their final statistics."""
+        if not self.processes:
+            return
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            process.join(timeout=max(0.1, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop gracefully, terminating")
+                process.terminate()
+        self.processes = []
+        if self.collector_thread:
+            self.collector_thread.join(timeout=2)
+            self.collector_thread = None
+        logger.info("Stopped fan-out capture workers")
+
+    def _collect(self) -> None:
+        """Receive per-worker statistics and recent packets in the parent."""
+        while self.processes or not self.results.empty():
+            try:
+                index, stats, recent, seconds, buckets, sketches = self.results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            self.worker_stats[index] = stats
+            if recent and self.on_packets:
+                self.on_packets(recent)
+            if seconds and self.on_seconds:
+                self.on_seconds(seconds)
+            if buckets and self.on_buckets:
+                self.on_buckets(buckets)
+            if sketches and self.on_sketches:
+                self.on_sketches(sketches)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Merge the latest statistics reported by every worker."""
+        merged: Dict[str, Any] = {key: 0 for key in MERGED_COUNTERS}
+        workers = []
+        for index in sorted(self.worker_stats):
+            stats = self.worker_stats[index]
+            for key in MERGED_COUNTERS:
+                merged[key] += stats.get(key, 0)
+            workers.append({
+                'worker': index,
+                'total_packets': stats.get('total_packets', 0),
+                'packets_per_second': stats.get('packets_per_second', 0),
+                'ring': stats.get('ring'),
+                'db_writer': stats.get('db_writer'),
+                'dns': stats.get('dns'),
+                'sampling': stats.get('sampling'),
+                'overload': stats.get('overload'),
+                'flows': stats.get('flows'),
+                'traffic': stats.get('traffic'),
+                'heavy_hitters': stats.get('heavy_hitters'),
+                'cardinality': stats.get('cardinality'),
+            })
+        merged['is_capturing'] = self.is_running
+        merged['workers'] = workers
+        return merged
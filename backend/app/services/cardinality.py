@@ -0,0 +1,389 @@
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.network_classifier import network_classifier
+
+# Distinct counts kept for all traffic, and for each local host
+DIMENSIONS = ('hosts', 'remote_ips', 'ports', 'peers', 'connections')
+HOSTS, REMOTE_IPS, PORTS, PEERS, CONNECTIONS = range(len(DIMENSIONS))
+HOST_DIMENSIONS = ('remote_ips', 'ports', 'peers')
+HOST_REMOTE_IPS, HOST_PORTS, HOST_PEERS = range(len(HOST_DIMENSIONS))
+
+# (seconds per bucket, buckets kept): an hour of minutes and a week of hours
+RESOLUTIONS = ((60, 60), (3600, 168))
+# Hours of per-host sketches kept
+HOST_HOURS = 24
+
+# 2^12 registers (about 1.6% standard error) for the global sketches, 2^8 (6.5%) per host
+PRECISION = 12
+HOST_PRECISION = 8
+DEFAULT_MAX_HOSTS = 1024
+
+# Distinct 5-tuples of the open minute are buffered and folded into the registers in batches of this size
+MAX_PENDING = 1 << 14
+# Locality of recently seen addresses
+MAX_CACHED_ADDRESSES = 1 << 16
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """MurmurHash3 64-bit finalizer over a uint64 array."""
+    values = values ^ (values >> np.uint64(33))
+    values = values * np.uint64(0xFF51AFD7ED558CCD)
+    values = values ^ (values >> np.uint64(33))
+    values = values * np.uint64(0xC4CEB9FE1A85EC53)
+    return values ^ (values >> np.uint64(33))
+
+def _fold(address: bytes) -> int:
+    """An address as a 64-bit integer; IPv6 halves are XORed together."""
+    value = int.from_bytes(address, 'big')
+    return value if len(address) == 4 else (value >> 64) ^ (value & 0xFFFFFFFFFFFFFFFF)
+
+def _positions(values: np.ndarray, precision: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Register index (top bits) and rank (leading zeros + 1 of the rest) of 64-bit hashes."""
+    bits = 64 - precision
+    index = (values >> np.uint64(bits)).astype(np.intp)
+    rest = values & np.uint64((1 << bits) - 1)
+    # frexp gives the bit length; float rounding can only matter within 2^-53 of a power of two
+    rank = bits - np.frexp(rest.astype(np.float64))[1] + 1
+    return index, rank.astype(np.uint8)
+
+def estimate(registers: np.ndarray) -> np.ndarray:
+    """HyperLogLog estimates for the last axis of a register array, with linear counting for small sets."""
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)), axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+def relative_error(precision: int) -> float:
+    """Standard error of a HyperLogLog estimate with 2^precision registers."""
+    return 1.04 / math.sqrt(1 << precision)
+
+class CardinalityTracker:
+    """Mergeable HyperLogLog distinct counts per minute, per hour and per local host.
+
+    For all traffic it counts distinct addresses, distinct remote (non-local)
+    addresses, distinct destination ports, distinct address pairs and
+    distinct connections (5-tuples, both directions as one). For each local
+    host it counts the remote addresses and peers it exchanged packets with
+    and the destination ports it sent to.
+
+    The capture path only adds each packet's 5-tuple to a set for the open
+    minute. The set is hashed and folded into the registers with NumPy
+    when it fills up, when the minute closes and before every read, so a
+    5-tuple costs one set lookup per packet and one hash per minute.
+    Closed minutes and hours are rows of preallocated register rings, and
+    a window is the register-wise maximum of the buckets it covers.
+
+    Memory is fixed: 5 sketches of 4 KB per bucket for 60 minutes and 168
+    hours, plus ``max_hosts`` local hosts with 3 sketches of 256 bytes for
+    each of their last 24 active hours.
+    """
+
+    def __init__(self,
+                 max_hosts: int = DEFAULT_MAX_HOSTS,
+                 precision: int = PRECISION,
+                 host_precision: int = HOST_PRECISION,
+                 resolutions=RESOLUTIONS,
+                 host_hours: int = HOST_HOURS):
+        self.max_hosts = max_hosts
+        self.precision = precision
+        self.host_precision = host_precision
+        self.host_hours = host_hours
+        (self.minute_seconds, minute_length), (self.hour_seconds, hour_length) = resolutions
+        self.lock = threading.Lock()
+
+        shape = (len(DIMENSIONS), 1 << precision)
+        self.minute_stamps = np.full(minute_length, -1, dtype=np.int64)
+        self.minute_rings = np.zeros((minute_length,) + shape, dtype=np.uint8)
+        self.hour_stamps = np.full(hour_length, -1, dtype=np.int64)
+        self.hour_rings = np.zeros((hour_length,) + shape, dtype=np.uint8)
+
+        # Open minute: buffered 5-tuples and the registers they have been folded into
+        self.second = 0
+        self.minute = -1
+        self.pending: set = set()
+        self.current = np.zeros(shape, dtype=np.uint8)
+        # Open hour of the local hosts: address -> row of ``host_current``
+        self.host_rows: Dict[bytes, int] = {}
+        self.host_current = np.zeros((max_hosts, len(HOST_DIMENSIONS), 1 << host_precision), dtype=np.uint8)
+        # Closed hours per host: address -> {hour: registers}
+        self.host_history: Dict[bytes, Dict[int, bytes]] = {}
+        # The last closed hours of per-host sketches, resent to a fan-out parent
+        self.closed_hours: List[Tuple[int, Dict[bytes, bytes]]] = []
+        self.locality: Dict[bytes, bool] = {}
+        self._clock_at = time.monotonic()
+        # Set once buckets arrive through ``merge``; the reporters then drive the clock
+        self.merged = False
+        self.stats = {'tuples': 0, 'flushes': 0, 'untracked_hosts': 0}
+
+    def add(self, timestamp_ns: int, proto: int, sport: Optional[int], dport: Optional[int],
+            src: bytes, dst: bytes) -> None:
+        """Count one packet's addresses, ports, pair and connection."""
+        second = timestamp_ns // 1000000000
+        with self.lock:
+            if second > self.second:
+                if second // self.minute_seconds != self.minute:
+                    self._roll(second)
+                self.second = second
+                self._clock_at = time.monotonic()
+            # Late packets are counted in the current minute
+            pending = self.pending
+            key = (src, dst, proto, sport, dport)
+            if key not in pending:
+                pending.add(key)
+                if len(pending) >= MAX_PENDING:
+                    self._flush()
+
+    def _is_local(self, address: bytes) -> bool:
+        """Locality of an address, cached."""
+        local = self.locality.get(address)
+        if local is None:
+            if len(self.locality) >= MAX_CACHED_ADDRESSES:
+                self.locality.clear()
+            local = self.locality[address] = network_classifier.is_local(address)
+        return local
+
+    def _flush(self) -> None:
+        """Hash the buffered 5-tuples and fold them into the open minute and the host sketches."""
+        if not self.pending:
+            return
+        tuples = list(self.pending)
+        self.pending = set()
+        self.stats['tuples'] += len(tuples)
+        self.stats['flushes'] += 1
+
+        is_local = self._is_local
+        src_hash = _mix(np.array([_fold(key[0]) for key in tuples], dtype=np.uint64))
+        dst_hash = _mix(np.array([_fold(key[1]) for key in tuples], dtype=np.uint64))
+        src_local = np.array([is_local(key[0]) for key in tuples], dtype=bool)
+        dst_local = np.array([is_local(key[1]) for key in tuples], dtype=bool)
+        proto = np.array([key[2] for key in tuples], dtype=np.uint64)
+        has_ports = np.array([key[4] is not None for key in tuples], dtype=bool)
+        sport = np.array([key[3] or 0 for key in tuples], dtype=np.uint64)
+        dport = np.array([key[4] or 0 for key in tuples], dtype=np.uint64)
+
+        port_hash = _mix((proto << np.uint64(16)) | dport)
+        forward = src_hash < dst_hash
+        low, high = np.where(forward, src_hash, dst_hash), np.where(forward, dst_hash, src_hash)
+        pair_hash = _mix(low ^ _mix(high))
+        ports = np.where(forward, (sport << np.uint64(16)) | dport, (dport << np.uint64(16)) | sport)
+        connection_hash = _mix(pair_hash ^ _mix((proto << np.uint64(32)) | ports))
+
+        registers = self.current
+        for dimension, values in (
+                (HOSTS, np.concatenate((src_hash, dst_hash))),
+                (REMOTE_IPS, np.concatenate((src_hash[~src_local], dst_hash[~dst_local]))),
+                (PORTS, port_hash[has_ports]),
+                (PEERS, pair_hash),
+                (CONNECTIONS, connection_hash)):
+            index, rank = _positions(values, self.precision)
+            np.maximum.at(registers[dimension], index, rank)
+
+        # Per-host sketches: peers either way, ports only for packets the host sent
+        rows, dimensions, values = [], [], []
+        for local, host_column, peer_hash, peer_local, sent in (
+                (src_local, 0, dst_hash, dst_local, True),
+                (dst_local, 1, src_hash, src_local, False)):
+            selected = np.flatnonzero(local)
+            if not len(selected):
+                continue
+            host_rows = np.array([self._host_row(tuples[i][host_column]) for i in selected.tolist()], dtype=np.intp)
+            tracked = host_rows >= 0
+            selected, host_rows = selected[tracked], host_rows[tracked]
+            rows.append(host_rows)
+            dimensions.append(np.full(len(selected), HOST_PEERS, dtype=np.intp))
+            values.append(peer_hash[selected])
+            remote = ~peer_local[selected]
+            rows.append(host_rows[remote])
+            dimensions.append(np.full(int(remote.sum()), HOST_REMOTE_IPS, dtype=np.intp))
+            values.append(peer_hash[selected][remote])
+            if sent:
+                with_ports = has_ports[selected]
+                rows.append(host_rows[with_ports])
+                dimensions.append(np.full(int(with_ports.sum()), HOST_PORTS, dtype=np.intp))
+                values.append(port_hash[selected][with_ports])
+        if rows:
+            index, rank = _positions(np.concatenate(values), self.host_precision)
+            np.maximum.at(self.host_current, (np.concatenate(rows), np.concatenate(dimensions), index), rank)
+
+    def _host_row(self, address: bytes) -> int:
+        """Row of a local host in ``host_current``, or -1 once ``max_hosts`` are tracked."""
+        row = self.host_rows.get(address)
+        if row is None:
+            if len(self.host_rows) >= self.max_hosts:
+                self.stats['untracked_hosts'] += 1
+                return -1
+            row = self.host_rows[address] = len(self.host_rows)
+        return row
+
+    def _open_hosts(self) -> Dict[bytes, bytes]:
+        return {address: self.host_current[row].tobytes() for address, row in self.host_rows.items()}
+
+    def _roll(self, second: int) -> None:
+        """Close the open minute (and hour, if it changed) and start the one holding ``second``."""
+        if self.minute >= 0:
+            self._flush()
+            self._store_minute(self.minute, self.current)
+            hour = self.minute * self.minute_seconds // self.hour_seconds
+            if second // self.hour_seconds != hour:
+                closed = self._open_hosts()
+                self._store_hosts(hour, closed)
+                self.closed_hours.append((hour, closed))
+                del self.closed_hours[:-self.host_hours]
+                self.host_current[:len(self.host_rows)] = 0
+                self.host_rows = {}
+        self.minute = second // self.minute_seconds
+        self.current = np.zeros_like(self.current)
+
+    def _store_minute(self, minute: int, registers: np.ndarray) -> None:
+        """Put a closed minute into the minute ring and fold it into its hour."""
+        registers = registers.reshape(self.minute_rings.shape[1:])
+        row = minute % len(self.minute_stamps)
+        if self.minute_stamps[row] == minute:
+            np.maximum(self.minute_rings[row], registers, out=self.minute_rings[row])
+        else:
+            self.minute_stamps[row] = minute
+            self.minute_rings[row] = registers
+        hour = minute * self.minute_seconds // self.hour_seconds
+        row = hour % len(self.hour_stamps)
+        if self.hour_stamps[row] != hour:
+            self.hour_stamps[row] = hour
+            self.hour_rings[row] = 0
+        np.maximum(self.hour_rings[row], registers, out=self.hour_rings[row])
+
+    def _store_hosts(self, hour: int, hosts: Dict[bytes, bytes]) -> None:
+        """Keep a closed hour of per-host sketches and drop hours older than ``host_hours``."""
+        for address, registers in hosts.items():
+            history = self.host_history.setdefault(address, {})
+            if hour in history:
+                registers = np.maximum(np.frombuffer(history[hour], dtype=np.uint8),
+                                       np.frombuffer(registers, dtype=np.uint8)).tobytes()
+            history[hour] = registers
+        oldest = hour - self.host_hours + 1
+        for address in list(self.host_history):
+            history = self.host_history[address]
+            for stale in [stored for stored in history if stored < oldest]:
+                del history[stale]
+            if not history:
+                del self.host_history[address]
+
+    def _now(self) -> int:
+        """Current second: last packet time plus the wall time since it."""
+        if self.merged:
+            return self.second
+        return self.second + int(time.monotonic() - self._clock_at)
+
+    def count(self, start: int, end: int) -> Optional[Dict[str, int]]:
+        """Distinct counts over the buckets overlapping seconds [start, end), or None if they are not kept.
+
+        Minute buckets are used while they reach back to ``start``; hour
+        buckets for spans of an hour or more after that.
+        """
+        with self.lock:
+            if not self.second:
+                return None
+            self._flush()
+            now = self._now()
+            minute_first = now // self.minute_seconds - len(self.minute_stamps) + 1
+            hour_first = now // self.hour_seconds - len(self.hour_stamps) + 1
+            if start // self.minute_seconds >= minute_first:
+                resolution, stamps, rings = self.minute_seconds, self.minute_stamps, self.minute_rings
+            elif end - start >= self.hour_seconds and start // self.hour_seconds >= hour_first:
+                resolution, stamps, rings = self.hour_seconds, self.hour_stamps, self.hour_rings
+            else:
+                return None
+            first, last = start // resolution, (end - 1) // resolution
+            rows = (stamps >= first) & (stamps <= last)
+            merged = rings[rows].max(axis=0) if rows.any() else np.zeros(rings.shape[1:], dtype=np.uint8)
+            # The open minute is not in either ring yet
+            if self.minute >= 0 and first <= self.minute * self.minute_seconds // resolution <= last:
+                merged = np.maximum(merged, self.current)
+        return {name: int(round(value)) for name, value in zip(DIMENSIONS, estimate(merged))}
+
+    def window(self, seconds: int) -> Optional[Dict[str, int]]:
+        """Distinct counts over the last ``seconds``, rounded out to whole minutes, or whole hours past an hour."""
+        if seconds > len(self.hour_stamps) * self.hour_seconds:
+            raise ValueError(f"Window is longer than the {len(self.hour_stamps)} hours kept")
+        now = self._now()
+        resolution = self.minute_seconds if seconds <= self.hour_seconds else self.hour_seconds
+        start = (now // resolution - (seconds + resolution - 1) // resolution + 1) * resolution
+        return self.count(start, now + 1)
+
+    def host_count(self, address: bytes, seconds: int) -> Optional[Dict[str, int]]:
+        """Distinct counts of one local host over the last ``seconds``, rounded out to whole hours.
+
+        Returns None for hosts not seen in that window.
+        """
+        if seconds > self.host_hours * self.hour_seconds:
+            raise ValueError(f"Window is longer than the {self.host_hours} hours kept per host")
+        with self.lock:
+            if not self.second:
+                return None
+            self._flush()
+            current_hour = self._now() // self.hour_seconds
+            first = current_hour - (seconds + self.hour_seconds - 1) // self.hour_seconds + 1
+            sketches = [np.frombuffer(registers, dtype=np.uint8)
+                        for hour, registers in self.host_history.get(address, {}).items()
+                        if first <= hour <= current_hour]
+            row = self.host_rows.get(address)
+            if row is not None and first <= self.minute * self.minute_seconds // self.hour_seconds:
+                sketches.append(self.host_current[row].ravel().copy())
+        if not sketches:
+            return None
+        merged = np.max(sketches, axis=0).reshape(len(HOST_DIMENSIONS), -1)
+        return {name: int(round(value)) for name, value in zip(HOST_DIMENSIONS, estimate(merged))}
+
+    def buckets_since(self, cursor: Optional[int] = None, final: bool = False) -> Tuple[List[tuple], Optional[int]]:
+        """Return minutes closed after ``cursor`` plus the open minute as plain tuples, and the new cursor.
+
+        Fan-out workers ship these to the parent, which folds them in with
+        ``merge``. Registers merge by maximum, so sending a bucket again is
+        harmless: the open minute goes along every time, and per-host
+        sketches of the recent hours whenever a minute has closed.
+        """
+        with self.lock:
+            if self.minute < 0:
+                return [], cursor
+            self._flush()
+            closed = sorted(minute for minute in self.minute_stamps.tolist()
+                            if minute >= 0 and (cursor is None or minute > cursor))
+            buckets = [('minute', minute, self.minute_rings[minute % len(self.minute_stamps)].tobytes())
+                       for minute in closed]
+            buckets.append(('minute', self.minute, self.current.tobytes()))
+            if closed or final:
+                first_hour = closed[0] * self.minute_seconds // self.hour_seconds if closed else self.minute
+                buckets.extend(('hour', hour, hosts) for hour, hosts in self.closed_hours if hour >= first_hour)
+                buckets.append(('hour', self.minute * self.minute_seconds // self.hour_seconds, self._open_hosts()))
+            return buckets, closed[-1] if closed else cursor
+
+    def merge(self, buckets: List[tuple]) -> None:
+        """Add minutes and host hours reported by another tracker."""
+        if not buckets:
+            return
+        with self.lock:
+            for kind, bucket, registers in buckets:
+                if kind == 'minute':
+                    self._store_minute(bucket, np.frombuffer(registers, dtype=np.uint8))
+                    self.second = max(self.second, (bucket + 1) * self.minute_seconds - 1)
+                else:
+                    self._store_hosts(bucket, registers)
+            self.merged = True
+
+    def get_statistics(self) -> Dict[str, Any]:
+        host_sketch = len(HOST_DIMENSIONS) << self.host_precision
+        return {
+            **self.stats,
+            'pending': len(self.pending),
+            'tracked_hosts': len(self.host_rows),
+            'hosts_with_history': len(self.host_history),
+            'relative_error': round(relative_error(self.precision), 4),
+            'host_relative_error': round(relative_error(self.host_precision), 4),
+            'memory_bytes': self.minute_rings.nbytes + self.hour_rings.nbytes + self.current.nbytes
+                            + self.host_current.nbytes
+                            + sum(len(history) for history in self.host_history.values()) * host_sketch,
+        }
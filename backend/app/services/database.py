@@ -1,60 +1,251 @@
-from typing import Optional, List, Dict, Any
+import asyncio
+import base64
+import ipaddress
+import json
+import logging
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
 from datetime import datetime, timedelta
-from sqlalchemy import select, and_, desc, delete, func
+from sqlalchemy import JSON, Table, event, select, insert, update, bindparam, and_, or_, desc, delete, func, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from ..models.database import LocationRecord, ConnectionRecord, TrafficStatsRecord, Alert, PacketRecord
+from sqlalchemy.orm import Session
+from ..core.cache import LRUCache
+from ..models.database import (
+    LocationRecord, ConnectionRecord, TrafficStatsRecord, TrafficStatsHourlyRecord, Alert, PacketRecord,
+    MaliciousIpRecord
+)
 from ..models.network import Connection, Location, TrafficStats
+from .packet_partitions import packet_partitions
+from .traffic_stats import interval_seconds
+
+logger = logging.getLogger(__name__)
+
+# Connection columns refreshed when a known flow is upserted again
+CONNECTION_UPDATE_FIELDS = (
+    'bytes_sent', 'bytes_received', 'packets_sent', 'packets_received',
+    'last_seen', 'duration', 'tcp_state', 'status',
+)
+
+# Location id by place (latitude, longitude, city, country), warmed from the locations table at startup
+_location_ids = LRUCache(maxsize=65536)
+
+# Ids upserted in a transaction wait in session.info and are cached once it
+# commits, so a rollback never leaves ids of rows that do not exist
+@event.listens_for(Session, "after_commit")
+def _cache_committed_location_ids(session) -> None:
+    for key, location_id in session.info.pop('location_ids', {}).items():
+        _location_ids.set(key, location_id)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back_location_ids(session, previous_transaction) -> None:
+    if not previous_transaction.nested:
+        session.info.pop('location_ids', None)
+
+# Blocklist bodies by (format, version of malicious_ips); a change to the summary is a new key
+_blocklists = LRUCache(maxsize=16)
+
+# Blocklist export formats
+BLOCKLIST_FORMATS = ('text', 'ipset', 'json')
+
+# ipset sets the ipset format fills, per address family
+BLOCKLIST_SETS = {4: 'nautscan-blocklist', 6: 'nautscan-blocklist6'}
+
+# Filtered packet counts served by estimate mode where the planner has no row estimates
+_packet_counts = LRUCache(maxsize=1024, default_ttl=60.0)
+
+def encode_packet_cursor(packet: PacketRecord) -> str:
+    """Opaque cursor for the page after ``packet`` in newest-first order."""
+    raw = f"{packet.timestamp.isoformat()}|{packet.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_packet_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Return the (timestamp, id) position of a cursor; raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, packet_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(packet_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def tally_malicious_ips(rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """[occurrences, first seen, last seen] per address of malicious packet rows, counting both ends"""
+    tally: Dict[str, List[Any]] = {}
+    for row in rows:
+        timestamp = row['timestamp']
+        for ip in (row['source_ip'], row['destination_ip']):
+            if not ip:
+                continue
+            entry = tally.get(ip)
+            if entry is None:
+                tally[ip] = [1, timestamp, timestamp]
+            else:
+                entry[0] += 1
+                entry[1] = min(entry[1], timestamp)
+                entry[2] = max(entry[2], timestamp)
+    return tally
+
+def render_blocklists(entries: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Every blocklist format for the summary ``entries``"""
+    addresses = []
+    for entry in entries:
+        try:
+            addresses.append(ipaddress.ip_address(entry['ip']))
+        except ValueError:
+            continue
+    ipset = []
+    for version, name in BLOCKLIST_SETS.items():
+        family = 'inet' if version == 4 else 'inet6'
+        ipset.append(f"create {name} hash:ip family {family} -exist")
+        ipset.append(f"flush {name}")
+        ipset.extend(f"add {name} {address} -exist" for address in addresses if address.version == version)
+    return {
+        'text': "".join(f"{address}\n" for address in addresses),
+        'ipset': "\n".join(ipset) + "\n",
+        'json': json.dumps([
+            {**entry,
+             'first_seen': entry['first_seen'].isoformat() if entry['first_seen'] else None,
+             'last_seen': entry['last_seen'].isoformat() if entry['last_seen'] else None}
+            for entry in entries
+        ]),
+    }
 
 class DatabaseService:
+    # Bulk inserts use binary COPY when the database is PostgreSQL on asyncpg
+    use_copy = True
+
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def get_or_create_location(self, location: Location) -> LocationRecord:
-        """Get existing location record or create new one"""
-        stmt = select(LocationRecord).where(
-            and_(
-                LocationRecord.latitude == location.lat,
-                LocationRecord.longitude == location.lng
-            )
+    def _upsert_insert(self):
+        """The dialect's INSERT with ON CONFLICT support, or None where there is none"""
+        dialect = self.session.bind.dialect.name
+        if dialect == 'postgresql':
+            return postgresql_insert
+        if dialect == 'sqlite':
+            return sqlite_insert
+        return None
+
+    @staticmethod
+    def location_key(location: Location) -> Tuple[float, float, str, str]:
+        """Key of a place in ``locations``; unknown names are stored as ''"""
+        return (location.lat, location.lng, location.city or '', location.country or '')
+
+    async def load_location_ids(self) -> int:
+        """Warm the location id cache with the newest locations; returns how many were loaded"""
+        locations = LocationRecord.__table__
+        result = await self.session.execute(
+            select(locations.c.id, locations.c.latitude, locations.c.longitude, locations.c.city, locations.c.country)
+            .order_by(desc(locations.c.id))
+            .limit(_location_ids.maxsize)
         )
-        result = await self.session.execute(stmt)
-        location_record = result.scalar_one_or_none()
-
-        if not location_record:
-            location_record = LocationRecord(
-                latitude=location.lat,
-                longitude=location.lng,
-                city=location.city,
-                country=location.country
+        rows = result.all()
+        # Oldest first, so the newest end up most recently used
+        for location_id, *key in reversed(rows):
+            _location_ids.set(tuple(key), location_id)
+        return len(rows)
+
+    async def get_location_ids(self, locations: List[Location]) -> Dict[Tuple[float, float, str, str], int]:
+        """Location ids by ``location_key``, creating the places not stored yet.
+
+        Known places come from an in-process cache; the rest are upserted
+        1,000 per ``INSERT ... ON CONFLICT ... RETURNING``, so the query count
+        does not grow with the number of connections. New rows are flushed,
+        not committed; the caller commits them with its own work.
+        """
+        ids: Dict[Tuple[float, float, str, str], int] = {}
+        pending = self.session.info.setdefault('location_ids', {})
+        missing = []
+        for key in dict.fromkeys(self.location_key(location) for location in locations):
+            location_id = pending.get(key) or _location_ids.get(key)
+            if location_id is None:
+                missing.append(key)
+            else:
+                ids[key] = location_id
+        if not missing:
+            return ids
+
+        upsert = self._upsert_insert()
+        if upsert is None:
+            for key in missing:
+                ids[key] = await self._get_or_create_location_id(key)
+        else:
+            locations_table = LocationRecord.__table__
+            place = ('latitude', 'longitude', 'city', 'country')
+            for start in range(0, len(missing), 1000):
+                statement = upsert(locations_table).values(
+                    [dict(zip(place, key)) for key in missing[start:start + 1000]]
+                )
+                # A no-op update on conflict, so existing places are returned too
+                statement = statement.on_conflict_do_update(
+                    index_elements=list(place), set_={'latitude': statement.excluded.latitude}
+                ).returning(locations_table.c.id, *[locations_table.c[column] for column in place])
+                result = await self.session.execute(statement)
+                for location_id, *key in result:
+                    ids[tuple(key)] = location_id
+        await self.session.flush()
+        for key in missing:
+            pending[key] = ids[key]
+        return ids
+
+    async def _get_or_create_location_id(self, key: Tuple[float, float, str, str]) -> int:
+        latitude, longitude, city, country = key
+        result = await self.session.execute(
+            select(LocationRecord.id).where(
+                and_(
+                    LocationRecord.latitude == latitude,
+                    LocationRecord.longitude == longitude,
+                    LocationRecord.city == city,
+                    LocationRecord.country == country
+                )
             )
+        )
+        location_id = result.scalar_one_or_none()
+        if location_id is None:
+            location_record = LocationRecord(latitude=latitude, longitude=longitude, city=city, country=country)
             self.session.add(location_record)
             await self.session.flush()
+            location_id = location_record.id
+        return location_id
 
-        return location_record
+    async def get_or_create_location(self, location: Location) -> LocationRecord:
+        """Get existing location record or create new one"""
+        ids = await self.get_location_ids([location])
+        return await self.session.get(LocationRecord, ids[self.location_key(location)])
 
     async def save_connection(self, connection: Connection):
         """Save connection to database"""
-        # Get or create location records
-        source_location = await self.get_or_create_location(connection.source)
-        dest_location = await self.get_or_create_location(connection.destination)
-
-        # Create connection record
-        connection_record = ConnectionRecord(
-            connection_id=connection.id,
-            source_id=source_location.id,
-            destination_id=dest_location.id,
-            protocol=connection.protocol,
-            source_port=connection.source_port,
-            destination_port=connection.destination_port,
-            bytes_sent=connection.bytes_sent,
-            bytes_received=connection.bytes_received,
-            timestamp=connection.timestamp,
-            duration=connection.duration,
-            application=connection.application,
-            status=connection.status
+        await self.save_connections([connection])
+
+    async def save_connections(self, connections: List[Connection]) -> int:
+        """Save a batch of connections with their locations in a constant number of queries"""
+        if not connections:
+            return 0
+
+        location_ids = await self.get_location_ids(
+            [connection.source for connection in connections] +
+            [connection.destination for connection in connections]
         )
-        self.session.add(connection_record)
+        rows = [
+            dict(
+                connection_id=connection.id,
+                source_id=location_ids[self.location_key(connection.source)],
+                destination_id=location_ids[self.location_key(connection.destination)],
+                protocol=connection.protocol,
+                source_port=connection.source_port,
+                destination_port=connection.destination_port,
+                bytes_sent=connection.bytes_sent,
+                bytes_received=connection.bytes_received,
+                timestamp=connection.timestamp,
+                duration=connection.duration,
+                application=connection.application,
+                status=connection.status
+            )
+            for connection in connections
+        ]
+        await self.bulk_insert(ConnectionRecord.__table__, rows)
         await self.session.commit()
+        return len(rows)
 
     async def save_traffic_stats(self, stats: TrafficStats):
         """Save traffic statistics to database"""
@@ -64,6 +255,8 @@ class DatabaseService:
             active_connections=stats.active_connections,
             bytes_per_second=stats.bytes_per_second,
             total_bytes=stats.total_bytes,
+            total_packets=stats.total_packets,
+            unique_hosts=stats.unique_hosts,
             connections_per_second=stats.connections_per_second,
             top_protocols=stats.top_protocols,
             top_applications=stats.top_applications
@@ -71,6 +264,60 @@ class DatabaseService:
         self.session.add(stats_record)
         await self.session.commit()
 
+    def _connection_history_query(self,
+                                  start_time: datetime,
+                                  end_time: datetime,
+                                  protocol: Optional[str] = None,
+                                  application: Optional[str] = None):
+        """Connections in a time range, newest first, with both locations joined in
+
+        Selects the connection columns plus ``source_*`` and ``destination_*``
+        location columns (``lat``, ``lng``, ``city``, ``country``), which are
+        NULL for flows stored without geolocation.
+        """
+        connections = ConnectionRecord.__table__
+        source = LocationRecord.__table__.alias('source')
+        destination = LocationRecord.__table__.alias('destination')
+        query = select(
+            *[column for column in connections.columns if column.name not in ('id', 'source_id', 'destination_id')],
+            *[location.c[column].label(f"{location.name}_{label}")
+              for location in (source, destination)
+              for label, column in (('lat', 'latitude'), ('lng', 'longitude'), ('city', 'city'), ('country', 'country'))]
+        ).select_from(
+            connections
+            .outerjoin(source, source.c.id == connections.c.source_id)
+            .outerjoin(destination, destination.c.id == connections.c.destination_id)
+        ).where(
+            and_(
+                connections.c.timestamp >= start_time,
+                connections.c.timestamp <= end_time
+            )
+        )
+
+        if protocol:
+            query = query.where(connections.c.protocol == protocol)
+        if application:
+            query = query.where(connections.c.application == application)
+
+        return query.order_by(desc(connections.c.timestamp))
+
+    async def stream_connection_history(self,
+                                        start_time: datetime,
+                                        end_time: datetime,
+                                        limit: Optional[int] = None,
+                                        protocol: Optional[str] = None,
+                                        application: Optional[str] = None,
+                                        chunk_size: int = 1000) -> AsyncIterator[List[Any]]:
+        """Yield historical connections newest first, ``chunk_size`` rows at a time
+
+        One statement joins both locations, and rows come from a
+        server-side cursor, so memory stays flat however long the range.
+        """
+        query = self._connection_history_query(start_time, end_time, protocol, application).limit(limit)
+        result = await self.session.stream(query.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            yield rows
+
     async def get_connection_history(
         self,
         start_time: datetime,
@@ -80,48 +327,37 @@ class DatabaseService:
         application: Optional[str] = None
     ) -> List[Connection]:
         """Get historical connection data"""
-        query = select(ConnectionRecord).where(
-            and_(
-                ConnectionRecord.timestamp >= start_time,
-                ConnectionRecord.timestamp <= end_time
-            )
-        )
-
-        if protocol:
-            query = query.where(ConnectionRecord.protocol == protocol)
-        if application:
-            query = query.where(ConnectionRecord.application == application)
-
-        query = query.order_by(desc(ConnectionRecord.timestamp)).limit(limit)
+        query = self._connection_history_query(start_time, end_time, protocol, application).limit(limit)
         result = await self.session.execute(query)
-        records = result.scalars().all()
 
         return [
             Connection(
-                id=record.connection_id,
+                id=row.connection_id,
                 source=Location(
-                    lat=record.source.latitude,
-                    lng=record.source.longitude,
-                    city=record.source.city,
-                    country=record.source.country
+                    lat=row.source_lat,
+                    lng=row.source_lng,
+                    city=row.source_city,
+                    country=row.source_country
                 ),
                 destination=Location(
-                    lat=record.destination.latitude,
-                    lng=record.destination.longitude,
-                    city=record.destination.city,
-                    country=record.destination.country
+                    lat=row.destination_lat,
+                    lng=row.destination_lng,
+                    city=row.destination_city,
+                    country=row.destination_country
                 ),
-                protocol=record.protocol,
-                source_port=record.source_port,
-                destination_port=record.destination_port,
-                bytes_sent=record.bytes_sent,
-                bytes_received=record.bytes_received,
-                timestamp=record.timestamp,
-                duration=record.duration,
-                application=record.application,
-                status=record.status
+                protocol=row.protocol,
+                source_port=row.source_port,
+                destination_port=row.destination_port,
+                bytes_sent=row.bytes_sent,
+                bytes_received=row.bytes_received,
+                timestamp=row.timestamp,
+                duration=row.duration,
+                application=row.application,
+                status=row.status
             )
-            for record in records
+            for row in result
+            # A Connection needs both locations; flows stored without geolocation are left out
+            if row.source_lat is not None and row.destination_lat is not None
         ]
 
     async def get_stats_history(
@@ -130,31 +366,89 @@ class DatabaseService:
         end_time: datetime,
         interval: str = "1m"
     ) -> List[TrafficStats]:
-        """Get historical traffic statistics"""
-        query = select(TrafficStatsRecord).where(
+        """Get historical traffic statistics, one point per interval
+
+        Reads the hourly rollup for intervals of an hour or more and the
+        minute rollup otherwise, then merges rows into interval points.
+        """
+        seconds = interval_seconds(interval)
+        model, resolution = (TrafficStatsHourlyRecord, 3600) if seconds >= 3600 else (TrafficStatsRecord, 60)
+        query = select(model).where(
             and_(
-                TrafficStatsRecord.timestamp >= start_time,
-                TrafficStatsRecord.timestamp <= end_time
+                model.timestamp >= start_time,
+                model.timestamp <= end_time
             )
-        ).order_by(TrafficStatsRecord.timestamp)
+        ).order_by(model.timestamp)
 
         result = await self.session.execute(query)
         records = result.scalars().all()
 
+        points: Dict[int, Dict[str, Any]] = {}
+        for record in records:
+            group = int(record.timestamp.timestamp()) // seconds
+            point = points.get(group)
+            if point is None:
+                point = points[group] = {
+                    'total_connections': 0, 'new_connections': 0.0, 'active_connections': 0, 'total_bytes': 0,
+                    'total_packets': 0, 'unique_hosts': 0, 'top_protocols': {}, 'top_applications': {},
+                }
+            # Connections seen in several rows are counted once per row, so the sum is an upper bound
+            point['total_connections'] += record.total_connections or 0
+            point['new_connections'] += (record.connections_per_second or 0) * resolution
+            point['total_bytes'] += record.total_bytes or 0
+            point['total_packets'] += record.total_packets or 0
+            point['active_connections'] = max(point['active_connections'], record.active_connections or 0)
+            # Distinct counts do not add up across rows; the busiest row is a lower bound
+            point['unique_hosts'] = max(point['unique_hosts'], record.unique_hosts or 0)
+            for field in ('top_protocols', 'top_applications'):
+                totals = point[field]
+                for name, count in (getattr(record, field) or {}).items():
+                    totals[name] = totals.get(name, 0) + count
+
         return [
             TrafficStats(
-                total_connections=record.total_connections,
-                active_connections=record.active_connections,
-                bytes_per_second=record.bytes_per_second,
-                total_bytes=record.total_bytes,
-                connections_per_second=record.connections_per_second,
-                top_protocols=record.top_protocols,
-                top_applications=record.top_applications,
-                timestamp=record.timestamp
+                total_connections=point['total_connections'],
+                active_connections=point['active_connections'],
+                bytes_per_second=point['total_bytes'] / seconds,
+                total_bytes=point['total_bytes'],
+                total_packets=point['total_packets'],
+                unique_hosts=point['unique_hosts'],
+                connections_per_second=point['new_connections'] / seconds,
+                top_protocols=dict(sorted(point['top_protocols'].items(), key=lambda item: item[1], reverse=True)),
+                top_applications=dict(sorted(point['top_applications'].items(), key=lambda item: item[1], reverse=True)),
+                timestamp=datetime.fromtimestamp(group * seconds)
             )
-            for record in records
+            for group, point in points.items()
         ]
 
+    async def upsert_traffic_rollups(self, model, rows: List[Dict[str, Any]]) -> int:
+        """Insert or replace rollup rows (TrafficStatsRecord or TrafficStatsHourlyRecord) by bucket timestamp"""
+        if not rows:
+            return 0
+
+        table = model.__table__
+        result = await self.session.execute(
+            select(table.c.timestamp).where(table.c.timestamp.in_([row['timestamp'] for row in rows]))
+        )
+        existing = set(result.scalars())
+        fields = [field for field in rows[0] if field != 'timestamp']
+        inserts = [row for row in rows if row['timestamp'] not in existing]
+        updates = [
+            {'key': row['timestamp'], **{f'new_{field}': row[field] for field in fields}}
+            for row in rows if row['timestamp'] in existing
+        ]
+        if inserts:
+            await self.session.execute(insert(model), inserts)
+        if updates:
+            await self.session.execute(
+                update(table)
+                .where(table.c.timestamp == bindparam('key'))
+                .values({field: bindparam(f'new_{field}') for field in fields}),
+                updates
+            )
+        await self.session.commit()
+        return len(rows)
+
     async def save_alert(
         self,
         level: str,
@@ -174,6 +468,12 @@ class DatabaseService:
         self.session.add(alert)
         await self.session.commit()
 
+    async def save_alerts(self, alerts: List[Dict[str, Any]]) -> int:
+        """Save a batch of alerts (dicts of ``Alert`` columns) in one bulk insert"""
+        written = await self.bulk_insert(Alert.__table__, alerts)
+        await self.session.commit()
+        return written
+
     async def get_alerts(
         self,
         start_time: Optional[datetime] = None,
@@ -201,15 +501,14 @@ class DatabaseService:
         result = await self.session.execute(query)
         return result.scalars().all()
 
-    async def save_packet(self, packet_data: Dict[str, Any], is_malicious: bool = False, 
-                          threat_category: Optional[str] = None, connection_id: Optional[str] = None) -> PacketRecord:
-        """Save a packet to the database"""
-        # Calculate expiration date - 7 days for normal packets, None (never expire) for malicious
-        expire_at = None if is_malicious else datetime.utcnow() + timedelta(days=7)
-        
-        # Create the packet record
-        packet_record = PacketRecord(
-            timestamp=packet_data.get('timestamp', datetime.utcnow()),
+    def _packet_row(self, packet_data: Dict[str, Any], is_malicious: bool = False,
+                    threat_category: Optional[str] = None, connection_id: Optional[str] = None) -> Dict[str, Any]:
+        """Build the column values for one packet row"""
+        # Calculate expiration date - retention days for normal packets, None (never expire) for malicious
+        expire_at = None if is_malicious else datetime.utcnow() + timedelta(days=packet_partitions.retention_days)
+
+        return dict(
+            timestamp=packet_data.get('timestamp') or datetime.utcnow(),
             source_ip=packet_data.get('source_ip'),
             source_port=packet_data.get('source_port'),
             source_device_name=packet_data.get('source_device_name'),
@@ -230,10 +529,213 @@ class DatabaseService:
             connection_id=connection_id,
             expire_at=expire_at
         )
-        
-        self.session.add(packet_record)
+
+    async def save_packet(self, packet_data: Dict[str, Any], is_malicious: bool = False, 
+                          threat_category: Optional[str] = None, connection_id: Optional[str] = None) -> PacketRecord:
+        """Save a packet to the database"""
+        row = self._packet_row(packet_data, is_malicious, threat_category, connection_id)
+        table = await packet_partitions.table_for(self.session, row['timestamp'].date())
+        result = await self.session.execute(insert(table).values(**row))
+        if is_malicious:
+            await self._record_malicious_ips(tally_malicious_ips([row]))
+        await self.session.commit()
+        return PacketRecord(id=result.inserted_primary_key[0], **row)
+
+    async def save_packets(self, packets: List[Dict[str, Any]]) -> int:
+        """Save a batch of packets with a single multi-row insert.
+
+        Each packet dict may carry ``is_malicious``, ``threat_category`` and
+        ``connection_id`` alongside the packet fields.
+        """
+        if not packets:
+            return 0
+
+        rows = [
+            self._packet_row(
+                packet_data,
+                is_malicious=packet_data.get('is_malicious', False),
+                threat_category=packet_data.get('threat_category'),
+                connection_id=packet_data.get('connection_id')
+            )
+            for packet_data in packets
+        ]
+        # One multi-row insert per day partition
+        days: Dict[Any, List[Dict[str, Any]]] = {}
+        for row in rows:
+            days.setdefault(row['timestamp'].date(), []).append(row)
+        for day, day_rows in days.items():
+            table = await packet_partitions.table_for(self.session, day)
+            await self.bulk_insert(table, day_rows)
+        malicious = [row for row in rows if row['is_malicious']]
+        if malicious:
+            await self._record_malicious_ips(tally_malicious_ips(malicious))
         await self.session.commit()
-        return packet_record
+        return len(rows)
+
+    async def bulk_insert(self, table: Table, rows: List[Dict[str, Any]]) -> int:
+        """Insert a batch of rows into ``table`` without committing; returns the rows written.
+
+        On PostgreSQL with asyncpg the rows go over one binary ``COPY``,
+        falling back to ``executemany`` if the copy fails. Elsewhere, and for
+        SQLite, it is a single ``executemany`` of one prepared INSERT.
+        """
+        if not rows:
+            return 0
+        dialect = self.session.bind.dialect
+        if self.use_copy and dialect.name == 'postgresql' and dialect.driver == 'asyncpg':
+            try:
+                async with self.session.begin_nested():
+                    return await self._copy_rows(table, rows)
+            except Exception as e:
+                logger.warning(f"COPY into {table.name} failed, inserting {len(rows)} rows instead: {e}")
+        await self.session.execute(insert(table), rows)
+        return len(rows)
+
+    async def _copy_rows(self, table: Table, rows: List[Dict[str, Any]]) -> int:
+        """Write rows with asyncpg's binary COPY, filling in the defaults an INSERT would apply"""
+        # COPY only applies server defaults, so client-side defaults and sequences are resolved here
+        columns = [column for column in table.columns if column.name in rows[0] or column.default is not None]
+        constants: Dict[str, Any] = {}
+        sequences: Dict[str, Any] = {}
+        for column in columns:
+            default = column.default
+            if column.name in rows[0]:
+                continue
+            if default.is_sequence:
+                result = await self.session.execute(
+                    text(f"SELECT nextval('{default.name}') FROM generate_series(1, :count)"),
+                    {'count': len(rows)}
+                )
+                sequences[column.name] = iter(result.scalars().all())
+            else:
+                constants[column.name] = default.arg(None) if default.is_callable else default.arg
+        # asyncpg takes JSON as text
+        encoded = {column.name for column in columns if isinstance(column.type, JSON)}
+
+        def value(row: Dict[str, Any], name: str) -> Any:
+            if name in sequences:
+                return next(sequences[name])
+            item = row[name] if name in row else constants[name]
+            return json.dumps(item) if name in encoded and item is not None else item
+
+        names = [column.name for column in columns]
+        records = [tuple(value(row, name) for name in names) for row in rows]
+        connection = await self.session.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(table.name, records=records, columns=names)
+        return len(records)
+
+    async def backfill_device_names(self, names: Dict[str, str]) -> int:
+        """Set device names resolved after their packets were stored.
+
+        Only rows without a name are touched. Returns the number of updated rows.
+        """
+        if not names:
+            return 0
+
+        params = [{'ip': ip, 'name': hostname} for ip, hostname in names.items()]
+        updated = 0
+        for packets in await packet_partitions.sources(self.session):
+            for ip_column, name_column in ((packets.c.source_ip, packets.c.source_device_name),
+                                           (packets.c.destination_ip, packets.c.destination_device_name)):
+                result = await self.session.execute(
+                    update(packets)
+                    .where(and_(ip_column == bindparam('ip'), name_column.is_(None)))
+                    .values({name_column: bindparam('name')}),
+                    params
+                )
+                updated += max(result.rowcount, 0)
+        await self.session.commit()
+        return updated
+
+    async def upsert_connections(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert or update aggregated flow rows, keyed by ``connection_id``.
+
+        Existing connections get their counters, last-seen time, state and
+        status refreshed; unknown ones are inserted. Returns the number of
+        rows written.
+        """
+        if not rows:
+            return 0
+
+        # A flow can appear twice in one batch (updated, then expired); the last row wins
+        latest = {row['connection_id']: row for row in rows}
+        connections = ConnectionRecord.__table__
+        existing = set()
+        ids = list(latest)
+        for start in range(0, len(ids), 500):
+            result = await self.session.execute(
+                select(connections.c.connection_id)
+                .where(connections.c.connection_id.in_(ids[start:start + 500]))
+            )
+            existing.update(result.scalars())
+
+        inserts = [row for connection_id, row in latest.items() if connection_id not in existing]
+        updates = [
+            {'key': connection_id, **{f'new_{field}': row[field] for field in CONNECTION_UPDATE_FIELDS}}
+            for connection_id, row in latest.items() if connection_id in existing
+        ]
+        if inserts:
+            await self.bulk_insert(connections, inserts)
+        if updates:
+            await self.session.execute(
+                update(connections)
+                .where(connections.c.connection_id == bindparam('key'))
+                .values({field: bindparam(f'new_{field}') for field in CONNECTION_UPDATE_FIELDS}),
+                updates
+            )
+        await self.session.commit()
+        return len(latest)
+
+    async def get_active_connections(
+        self,
+        limit: int = 25,
+        protocol: Optional[str] = None,
+        application: Optional[str] = None
+    ) -> List[ConnectionRecord]:
+        """Get the most recently active flows still marked active"""
+        query = select(ConnectionRecord).where(ConnectionRecord.status == 'active')
+        if protocol:
+            query = query.where(ConnectionRecord.protocol == protocol)
+        if application:
+            query = query.where(ConnectionRecord.application == application)
+        query = query.order_by(desc(ConnectionRecord.last_seen)).limit(limit)
+        result = await self.session.execute(query)
+        return list(result.scalars().all())
+
+    @staticmethod
+    def _filter_packets(query, packets,
+                        protocol: Optional[str] = None,
+                        source_ip: Optional[str] = None,
+                        destination_ip: Optional[str] = None,
+                        is_malicious: Optional[bool] = None,
+                        start_time: Optional[datetime] = None,
+                        end_time: Optional[datetime] = None,
+                        connection_id: Optional[str] = None):
+        """Apply the packet filters shared by listing and counting to the ``packets`` entity"""
+        if protocol:
+            query = query.where(packets.protocol == protocol)
+        if source_ip:
+            query = query.where(packets.source_ip == source_ip)
+        if destination_ip:
+            query = query.where(packets.destination_ip == destination_ip)
+        if is_malicious is not None:
+            query = query.where(packets.is_malicious == is_malicious)
+        if start_time:
+            query = query.where(packets.timestamp >= start_time)
+        if end_time:
+            query = query.where(packets.timestamp <= end_time)
+        if connection_id:
+            query = query.where(packets.connection_id == connection_id)
+        return query
+
+    async def _packet_sources(self, start_time: Optional[datetime], end_time: Optional[datetime],
+                              cursor: Optional[Tuple[datetime, int]] = None) -> List[Any]:
+        """Entities for the packet partitions a query can touch, newest first"""
+        if cursor is not None and (end_time is None or cursor[0] < end_time):
+            end_time = cursor[0]
+        tables = await packet_partitions.sources(self.session, start_time, end_time)
+        return [packet_partitions.entity(table) for table in tables]
 
     async def get_packets(self, 
                           limit: int = 100, 
@@ -244,36 +746,77 @@ class DatabaseService:
                           is_malicious: Optional[bool] = None,
                           start_time: Optional[datetime] = None,
                           end_time: Optional[datetime] = None,
-                          connection_id: Optional[str] = None) -> List[PacketRecord]:
-        """Get packets with filtering options"""
-        query = select(PacketRecord)
-        
-        # Apply filters
-        if protocol:
-            query = query.where(PacketRecord.protocol == protocol)
-        if source_ip:
-            query = query.where(PacketRecord.source_ip == source_ip)
-        if destination_ip:
-            query = query.where(PacketRecord.destination_ip == destination_ip)
-        if is_malicious is not None:
-            query = query.where(PacketRecord.is_malicious == is_malicious)
-        if start_time and end_time:
-            query = query.where(
-                and_(
-                    PacketRecord.timestamp >= start_time,
-                    PacketRecord.timestamp <= end_time
-                )
-            )
-        if connection_id:
-            query = query.where(PacketRecord.connection_id == connection_id)
+                          connection_id: Optional[str] = None,
+                          cursor: Optional[Tuple[datetime, int]] = None) -> List[PacketRecord]:
+        """Get packets with filtering options, newest first
+
+        Pass the (timestamp, id) of the last packet of a page as ``cursor``
+        (see ``decode_packet_cursor``) to get the next one. Pages after a
+        cursor are an index range scan on (timestamp, id), so they cost the
+        same at any depth; ``offset`` still works but reads every skipped row.
+        Partitions are read newest first until the page is full.
+        """
+        filters = (protocol, source_ip, destination_ip, is_malicious, start_time, end_time, connection_id)
+        wanted = offset + limit
+        packets = []
+        for entity in await self._packet_sources(start_time, end_time, cursor):
+            query = self._filter_packets(select(entity), entity, *filters)
+            if cursor is not None:
+                query = query.where(tuple_(entity.timestamp, entity.id) < tuple_(*cursor))
+            query = query.order_by(desc(entity.timestamp), desc(entity.id)).limit(wanted - len(packets))
             
-        # Apply pagination
-        query = query.order_by(desc(PacketRecord.timestamp)).offset(offset).limit(limit)
-        
-        # Execute query
-        result = await self.session.execute(query)
-        return result.scalars().all()
-    
+            # Execute query
+            result = await self.session.execute(query)
+            packets.extend(result.scalars().all())
+            if len(packets) >= wanted:
+                break
+        return packets[offset:]
+
+    async def get_packet(self, packet_id: int) -> Optional[PacketRecord]:
+        """Get a single packet by ID"""
+        for entity in await self._packet_sources(None, None):
+            result = await self.session.execute(select(entity).where(entity.id == packet_id))
+            packet = result.scalars().first()
+            if packet is not None:
+                return packet
+        return None
+
+    async def stream_packets(self,
+                             columns: List[Any],
+                             limit: Optional[int] = None,
+                             protocol: Optional[str] = None,
+                             source_ip: Optional[str] = None,
+                             destination_ip: Optional[str] = None,
+                             is_malicious: Optional[bool] = None,
+                             start_time: Optional[datetime] = None,
+                             end_time: Optional[datetime] = None,
+                             connection_id: Optional[str] = None,
+                             cursor: Optional[Tuple[datetime, int]] = None,
+                             chunk_size: int = 1000) -> AsyncIterator[List[Any]]:
+        """Yield matching packets newest first as lists of rows of ``PacketRecord`` ``columns``
+
+        Rows come from a server-side cursor ``chunk_size`` at a time, so
+        memory stays flat however many packets match and the first chunk
+        is ready as soon as the database returns it.
+        """
+        filters = (protocol, source_ip, destination_ip, is_malicious, start_time, end_time, connection_id)
+        remaining = limit
+        for entity in await self._packet_sources(start_time, end_time, cursor):
+            query = self._filter_packets(
+                select(*[getattr(entity, column.key) for column in columns]), entity, *filters
+            )
+            if cursor is not None:
+                query = query.where(tuple_(entity.timestamp, entity.id) < tuple_(*cursor))
+            query = query.order_by(desc(entity.timestamp), desc(entity.id)).limit(remaining)
+
+            result = await self.session.stream(query.execution_options(yield_per=chunk_size))
+            async for rows in result.partitions():
+                yield rows
+                if remaining is not None:
+                    remaining -= len(rows)
+            if remaining is not None and remaining <= 0:
+                return
+
     async def count_packets(self,
                            protocol: Optional[str] = None,
                            source_ip: Optional[str] = None,
@@ -281,100 +824,310 @@ class DatabaseService:
                            is_malicious: Optional[bool] = None,
                            start_time: Optional[datetime] = None,
                            end_time: Optional[datetime] = None,
-                           connection_id: Optional[str] = None) -> int:
-        """Count packets with filtering options"""
-        query = select(func.count(PacketRecord.id))
-        
-        # Apply filters
-        if protocol:
-            query = query.where(PacketRecord.protocol == protocol)
-        if source_ip:
-            query = query.where(PacketRecord.source_ip == source_ip)
-        if destination_ip:
-            query = query.where(PacketRecord.destination_ip == destination_ip)
-        if is_malicious is not None:
-            query = query.where(PacketRecord.is_malicious == is_malicious)
-        if start_time and end_time:
-            query = query.where(
-                and_(
-                    PacketRecord.timestamp >= start_time,
-                    PacketRecord.timestamp <= end_time
+                           connection_id: Optional[str] = None,
+                           estimate: bool = False) -> int:
+        """Count packets with filtering options
+
+        With ``estimate`` the count comes from the PostgreSQL planner's row
+        estimate. Other databases get the id span for an unfiltered count and
+        an exact count cached for a minute otherwise.
+        """
+        filters = (protocol, source_ip, destination_ip, is_malicious, start_time, end_time, connection_id)
+        filtered = any(value is not None for value in filters)
+        postgresql = self.session.bind.dialect.name == 'postgresql'
+        if estimate and filtered and not postgresql:
+            count = _packet_counts.get(filters)
+            if count is not None:
+                return count
+
+        count = 0
+        tables = await packet_partitions.sources(self.session, start_time, end_time)
+        for position, table in enumerate(tables):
+            entity = packet_partitions.entity(table)
+            if estimate and postgresql:
+                count += await self._planner_rows(self._filter_packets(select(entity.id), entity, *filters))
+            elif estimate and not filtered and position == 0:
+                # The newest partition takes nearly every insert, so its id span is close to its size
+                result = await self.session.execute(select(func.max(entity.id) - func.min(entity.id) + 1))
+                count += result.scalar_one() or 0
+            elif estimate and not filtered:
+                # Older partitions only gain the odd late packet; their counts are kept for an hour
+                rows = _packet_counts.get(table.name)
+                if rows is None:
+                    result = await self.session.execute(select(func.count(entity.id)))
+                    rows = result.scalar_one()
+                    _packet_counts.set(table.name, rows, ttl=3600.0)
+                count += rows
+            else:
+                result = await self.session.execute(
+                    self._filter_packets(select(func.count(entity.id)), entity, *filters)
                 )
-            )
-        if connection_id:
-            query = query.where(PacketRecord.connection_id == connection_id)
-            
-        # Execute query
-        result = await self.session.execute(query)
-        return result.scalar_one()
+                count += result.scalar_one()
+        if estimate and filtered and not postgresql:
+            _packet_counts.set(filters, count)
+        return count
+
+    async def _planner_rows(self, query) -> int:
+        """Rows PostgreSQL expects a query to return, from EXPLAIN without running it"""
+        compiled = query.compile()
+        result = await self.session.execute(
+            text(f"EXPLAIN (FORMAT JSON) {compiled}").bindparams(**compiled.params)
+        )
+        plan = result.scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
     
     async def mark_packet_as_malicious(self, packet_id: int, 
                                        threat_category: Optional[str] = None,
                                        confidence_score: Optional[float] = None,
                                        notes: Optional[str] = None) -> PacketRecord:
         """Mark a packet as malicious and update its expiration date"""
-        # Get the packet
-        packet = await self.session.get(PacketRecord, packet_id)
-        if not packet:
-            raise ValueError(f"Packet with ID {packet_id} not found")
-            
-        # Update the packet
-        packet.is_malicious = True
-        packet.threat_category = threat_category
-        packet.confidence_score = confidence_score
-        packet.notes = notes
-        packet.expire_at = None  # Never expire malicious packets
-        
-        await self.session.commit()
-        return packet
-    
-    async def run_housekeeping(self) -> int:
-        """Delete expired packets"""
-        now = datetime.utcnow()
-        query = delete(PacketRecord).where(
-            and_(
-                PacketRecord.expire_at.isnot(None),
-                PacketRecord.expire_at <= now
+        values = dict(
+            is_malicious=True,
+            threat_category=threat_category,
+            confidence_score=confidence_score,
+            notes=notes,
+            expire_at=None  # Never expire malicious packets
+        )
+        # Update the packet in whichever partition holds it
+        for packets in await packet_partitions.sources(self.session):
+            result = await self.session.execute(
+                select(packets.c.source_ip, packets.c.destination_ip, packets.c.timestamp, packets.c.is_malicious)
+                .where(packets.c.id == packet_id)
+            )
+            previous = result.first()
+            if previous is None:
+                continue
+            await self.session.execute(
+                update(packets).where(packets.c.id == packet_id).values(**values)
+            )
+            # Re-marking only updates the details; the packet is counted once
+            if not previous.is_malicious:
+                await self._record_malicious_ips(tally_malicious_ips([previous._asdict()]))
+            await self.session.commit()
+            entity = packet_partitions.entity(packets)
+            result = await self.session.execute(
+                select(entity).where(entity.id == packet_id).execution_options(populate_existing=True)
             )
+            return result.scalars().first()
+        raise ValueError(f"Packet with ID {packet_id} not found")
+
+    async def mark_packets_as_malicious(self,
+                                        threat_category: Optional[str] = None,
+                                        confidence_score: Optional[float] = None,
+                                        notes: Optional[str] = None,
+                                        protocol: Optional[str] = None,
+                                        source_ip: Optional[str] = None,
+                                        destination_ip: Optional[str] = None,
+                                        ip: Optional[str] = None,
+                                        start_time: Optional[datetime] = None,
+                                        end_time: Optional[datetime] = None,
+                                        connection_id: Optional[str] = None,
+                                        chunk_size: int = 5000,
+                                        pause: float = 0.0) -> int:
+        """Mark every packet matching the filters as malicious; returns the packets updated
+
+        Takes the ``get_packets`` filters, plus ``ip`` for either end. Rows
+        are walked in (timestamp, id) order along the filter's index and
+        updated ``chunk_size`` at a time, each chunk committed with its
+        ``malicious_ips`` additions, so millions of matches never make one
+        long transaction. Packets marked before get the new details but
+        are not counted again.
+        """
+        if not any((protocol, source_ip, destination_ip, ip, start_time, end_time, connection_id)):
+            raise ValueError("Marking packets as malicious needs at least one filter")
+
+        values = dict(
+            is_malicious=True,
+            expire_at=None  # Never expire malicious packets
         )
-        result = await self.session.execute(query)
+        # Details left out keep what is already stored
+        for name, value in (('threat_category', threat_category), ('confidence_score', confidence_score),
+                            ('notes', notes)):
+            if value is not None:
+                values[name] = value
+
+        updated = 0
+        for packets in await packet_partitions.sources(self.session, start_time, end_time):
+            query = self._filter_packets(
+                select(packets.c.timestamp, packets.c.id, packets.c.source_ip, packets.c.destination_ip,
+                       packets.c.is_malicious),
+                packets.c, protocol, source_ip, destination_ip, None, start_time, end_time, connection_id
+            )
+            if ip:
+                query = query.where(or_(packets.c.source_ip == ip, packets.c.destination_ip == ip))
+            query = query.order_by(packets.c.timestamp, packets.c.id).limit(chunk_size)
+
+            last = None
+            while True:
+                chunk = query if last is None else query.where(tuple_(packets.c.timestamp, packets.c.id) > tuple_(*last))
+                rows = (await self.session.execute(chunk)).all()
+                if not rows:
+                    break
+                result = await self.session.execute(
+                    update(packets).where(packets.c.id.in_([row.id for row in rows])).values(**values)
+                )
+                updated += max(result.rowcount, 0)
+                await self._record_malicious_ips(
+                    tally_malicious_ips([row._asdict() for row in rows if not row.is_malicious])
+                )
+                await self.session.commit()
+                last = (rows[-1].timestamp, rows[-1].id)
+                await self._yield_writer(pause)
+        logger.info(f"Marked {updated} packets as malicious ({threat_category})")
+        return updated
+
+    async def _yield_writer(self, pause: float = 0.0) -> None:
+        """Between two committed chunks, pause and let other writers take the SQLite writer"""
+        writer = self.session.info.get('writer')
+        if writer is not None:
+            await writer.handoff(self.session, pause)
+        elif pause:
+            await asyncio.sleep(pause)
+
+    async def run_housekeeping(self, chunk_size: int = 5000, pause: float = 0.05) -> int:
+        """Remove expired packets
+
+        Partitioned storage drops whole days (and creates tomorrow's ahead of
+        time); a single packets table deletes its expired rows in id ranges of
+        ``chunk_size``, committing and pausing for ``pause`` seconds between
+        them so capture writes are not held up behind one long delete.
+        """
+        if await packet_partitions.prepare(self.session) != 'single':
+            today = datetime.now().date()
+            for day in (today, today + timedelta(days=1)):
+                await packet_partitions.table_for(self.session, day)
+            await self.session.commit()
+            return await packet_partitions.drop_expired(self.session)
+
+        now = datetime.utcnow()
+        expired = and_(
+            PacketRecord.expire_at.isnot(None),
+            PacketRecord.expire_at <= now
+        )
+        result = await self.session.execute(
+            select(func.min(PacketRecord.id), func.max(PacketRecord.id)).where(expired)
+        )
+        first_id, last_id = result.one()
+        if first_id is None:
+            return 0
+
+        deleted = 0
+        for start in range(first_id, last_id + 1, chunk_size):
+            result = await self.session.execute(
+                delete(PacketRecord).where(
+                    expired,
+                    PacketRecord.id >= start,
+                    PacketRecord.id < start + chunk_size
+                )
+            )
+            await self.session.commit()
+            deleted += max(result.rowcount, 0)
+            await self._yield_writer(pause)
+        return deleted  # Return number of deleted rows
+
+    async def _record_malicious_ips(self, tally: Dict[str, List[Any]]) -> None:
+        """Add a ``tally_malicious_ips`` result to the ``malicious_ips`` summary (not committed)"""
+        if not tally:
+            return
+        now = datetime.utcnow()
+        values = [
+            dict(ip=ip, occurrence_count=count, first_seen=first_seen, last_seen=last_seen, updated_at=now)
+            for ip, (count, first_seen, last_seen) in tally.items()
+        ]
+        upsert = self._upsert_insert()
+        if upsert is None:
+            for value in values:
+                record = await self.session.get(MaliciousIpRecord, value['ip'])
+                if record is None:
+                    self.session.add(MaliciousIpRecord(**value))
+                    continue
+                record.occurrence_count += value['occurrence_count']
+                record.first_seen = min(record.first_seen or value['first_seen'], value['first_seen'])
+                record.last_seen = max(record.last_seen or value['last_seen'], value['last_seen'])
+                record.updated_at = now
+            await self.session.flush()
+            return
+
+        table = MaliciousIpRecord.__table__
+        # SQLite's two-argument min() and max() are PostgreSQL's least() and greatest()
+        least, greatest = (func.least, func.greatest) if upsert is postgresql_insert else (func.min, func.max)
+        for start in range(0, len(values), 1000):
+            statement = upsert(table).values(values[start:start + 1000])
+            excluded = statement.excluded
+            await self.session.execute(statement.on_conflict_do_update(
+                index_elements=['ip'],
+                set_={
+                    'occurrence_count': table.c.occurrence_count + excluded.occurrence_count,
+                    'first_seen': least(func.coalesce(table.c.first_seen, excluded.first_seen), excluded.first_seen),
+                    'last_seen': greatest(func.coalesce(table.c.last_seen, excluded.last_seen), excluded.last_seen),
+                    'updated_at': excluded.updated_at,
+                }
+            ))
+
+    async def rebuild_malicious_ips(self, if_empty: bool = False) -> int:
+        """Recount the ``malicious_ips`` summary from the stored packets; returns the addresses in it
+
+        With ``if_empty`` an existing summary is left alone, so this can
+        run at every startup and only fills the table the first time.
+        """
+        table = MaliciousIpRecord.__table__
+        if if_empty:
+            result = await self.session.execute(select(table.c.ip).limit(1))
+            if result.first() is not None:
+                return 0
+
+        tally: Dict[str, List[Any]] = {}
+        for packets in await self._packet_sources(None, None):
+            # Source and destination IPs, combined and deduplicated
+            for ip_column in (packets.source_ip, packets.destination_ip):
+                result = await self.session.execute(
+                    select(ip_column, func.count(), func.min(packets.timestamp), func.max(packets.timestamp))
+                    .where(packets.is_malicious == True, ip_column.isnot(None))
+                    .group_by(ip_column)
+                )
+                for ip, count, first_seen, last_seen in result:
+                    entry = tally.get(ip)
+                    if entry is None:
+                        tally[ip] = [count, first_seen, last_seen]
+                    else:
+                        entry[0] += count
+                        entry[1] = min(entry[1], first_seen)
+                        entry[2] = max(entry[2], last_seen)
+
+        await self.session.execute(delete(table))
+        await self._record_malicious_ips(tally)
         await self.session.commit()
-        return result.rowcount  # Return number of deleted rows
-        
+        return len(tally)
+
     async def get_malicious_ip_list(self) -> List[Dict[str, Any]]:
-        """Get a list of malicious IPs for blocklist generation"""
-        # First get source IPs
-        source_query = select(
-            PacketRecord.source_ip.label('ip'),
-            func.count(PacketRecord.id).label('occurrence_count')
-        ).where(
-            PacketRecord.is_malicious == True
-        ).group_by(
-            PacketRecord.source_ip
+        """Get a list of malicious IPs for blocklist generation, most frequent first"""
+        table = MaliciousIpRecord.__table__
+        result = await self.session.execute(
+            select(table.c.ip, table.c.occurrence_count, table.c.first_seen, table.c.last_seen)
+            .order_by(desc(table.c.occurrence_count), table.c.ip)
         )
-        
-        # Then get destination IPs
-        dest_query = select(
-            PacketRecord.destination_ip.label('ip'),
-            func.count(PacketRecord.id).label('occurrence_count')
-        ).where(
-            PacketRecord.is_malicious == True
-        ).group_by(
-            PacketRecord.destination_ip
+        return [dict(row._mapping) for row in result]
+
+    async def get_blocklist(self, blocklist_format: str) -> str:
+        """A blocklist in one of ``BLOCKLIST_FORMATS``
+
+        All formats are rendered together and cached until the summary
+        changes; checking that costs one aggregate over ``malicious_ips``.
+        """
+        if blocklist_format not in BLOCKLIST_FORMATS:
+            raise ValueError(f"Invalid blocklist format: {blocklist_format}")
+        table = MaliciousIpRecord.__table__
+        # Packets are only ever added, so the total count grows with every change
+        result = await self.session.execute(
+            select(func.count(), func.sum(table.c.occurrence_count), func.max(table.c.updated_at))
         )
-        
-        source_result = await self.session.execute(source_query)
-        dest_result = await self.session.execute(dest_query)
-        
-        # Combine and deduplicate results
-        ip_counts = {}
-        for row in source_result:
-            ip_counts[row.ip] = row.occurrence_count
-            
-        for row in dest_result:
-            if row.ip in ip_counts:
-                ip_counts[row.ip] += row.occurrence_count
-            else:
-                ip_counts[row.ip] = row.occurrence_count
-                
-        return [{'ip': ip, 'occurrence_count': count} for ip, count in ip_counts.items()] 
\ No newline at end of file
+        version = tuple(result.one())
+        body = _blocklists.get((blocklist_format, version))
+        if body is None:
+            bodies = render_blocklists(await self.get_malicious_ip_list())
+            for name, rendered in bodies.items():
+                _blocklists.set((name, version), rendered)
+            body = bodies[blocklist_format]
+        return body
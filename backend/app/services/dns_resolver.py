@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from ..core.cache import LRUCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+class ReverseResolver:
+    """Non-blocking reverse-DNS (PTR) resolver for the capture pipeline.
+
+    ``lookup`` never blocks: it answers from a bounded LRU cache and, on a
+    miss, schedules a PTR query on the resolver's own event loop and returns
+    None straight away. Concurrent queries are capped by a semaphore, a
+    second miss for an address already in flight is not queried again, and
+    successful and failed answers are cached with separate TTLs. Listeners
+    added with ``add_listener`` are told about every name that resolves so
+    packets emitted before the answer can be backfilled.
+    """
+
+    def __init__(self,
+                 concurrency: int = 16,
+                 timeout: float = 2.0,
+                 positive_ttl: float = 3600.0,
+                 negative_ttl: float = 300.0,
+                 cache_size: int = 65536,
+                 max_pending: int = 4096):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        # Misses beyond this many unanswered queries are not queued at all
+        self.max_pending = max_pending
+        self.cache = LRUCache(maxsize=cache_size)
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.resolver_thread: Optional[threading.Thread] = None
+        self.in_flight: Set[str] = set()
+        self.listeners: List[Callable[[str, str], None]] = []
+        self._start_lock = threading.Lock()
+        self.stats = {
+            'queries': 0,
+            'resolved': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'deduplicated': 0,
+            'shed': 0,
+            'total_query_time': 0.0,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self.resolver_thread is not None and self.resolver_thread.is_alive()
+
+    def start(self) -> None:
+        """Start the resolver event loop thread."""
+        with self._start_lock:
+            if self.is_running:
+                return
+            self.loop = asyncio.new_event_loop()
+            # gethostbyaddr blocks, so it runs on a pool sized to the concurrency limit
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="rdns")
+            self.resolver_thread = threading.Thread(target=self._run, name="reverse-dns", daemon=True)
+            self.resolver_thread.start()
+
+    def stop(self) -> None:
+        """Stop the event loop; queries still in flight are abandoned."""
+        if not self.is_running:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.resolver_thread.join(timeout=2)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.resolver_thread = None
+        self.in_flight.clear()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def add_listener(self, listener: Callable[[str, str], None]) -> None:
+        """Call ``listener(ip, hostname)`` whenever a PTR query resolves."""
+        self.listeners.append(listener)
+
+    def lookup(self, ip_address: str) -> Optional[str]:
+        """Return the cached hostname, scheduling a PTR query on a miss. Never blocks."""
+        hostname = self.cache.lookup(ip_address)
+        if hostname is not MISSING:
+            return hostname
+
+        if ip_address in self.in_flight:
+            self.stats['deduplicated'] += 1
+            return None
+        if len(self.in_flight) >= self.max_pending:
+            self.stats['shed'] += 1
+            return None
+        if not self.is_running:
+            self.start()
+        self.in_flight.add(ip_address)
+        self.loop.call_soon_threadsafe(self._schedule, ip_address)
+        return None
+
+    def _schedule(self, ip_address: str) -> None:
+        self.loop.create_task(self._resolve(ip_address))
+
+    async def _resolve(self, ip_address: str) -> None:
+        hostname = None
+        try:
+            async with self.semaphore:
+                self.stats['queries'] += 1
+                started = time.perf_counter()
+                try:
+                    hostname = (await asyncio.wait_for(
+                        self.loop.run_in_executor(self.executor, socket.gethostbyaddr, ip_address),
+                        timeout=self.timeout
+                    ))[0]
+                except asyncio.TimeoutError:
+                    self.stats['timeouts'] += 1
+                except (socket.herror, socket.gaierror, OSError):
+                    pass
+                self.stats['total_query_time'] += time.perf_counter() - started
+        finally:
+            self.in_flight.discard(ip_address)
+
+        if hostname:
+            self.stats['resolved'] += 1
+            self.cache.set(ip_address, hostname, ttl=self.positive_ttl)
+            for listener in self.listeners:
+                try:
+                    listener(ip_address, hostname)
+                except Exception as e:
+                    logger.error(f"Error in reverse DNS listener: {e}")
+        else:
+            self.stats['failed'] += 1
+            self.cache.set(ip_address, None, ttl=self.negative_ttl)
+
+    @property
+    def load(self) -> float:
+        """Fraction of the pending-query budget in use."""
+        return len(self.in_flight) / self.max_pending
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get resolver and cache metrics."""
+        queries = self.stats['queries']
+        return {
+            **self.stats,
+            'in_flight': len(self.in_flight),
+            'avg_query_time': self.stats['total_query_time'] / queries if queries else 0.0,
+            'cache': self.cache.get_statistics(),
+        }
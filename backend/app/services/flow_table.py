@@ -0,0 +1,429 @@
+import heapq
+import itertools
+import socket
+import threading
+import time
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .packet_parser import IPPROTO_TCP, PROTOCOL_NAMES, application_for
+
+# TCP flag bits as reported by parse_headers
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# Flow states; non-TCP flows only use NEW and ESTABLISHED (a reply was seen)
+STATE_NEW = 0
+STATE_SYN_SENT = 1
+STATE_SYN_RECEIVED = 2
+STATE_ESTABLISHED = 3
+STATE_CLOSING = 4
+STATE_CLOSED = 5
+STATE_RESET = 6
+
+STATE_NAMES = ('new', 'syn_sent', 'syn_received', 'established', 'closing', 'closed', 'reset')
+
+def _zeros(typecode: str, length: int) -> array:
+    return array(typecode, bytes(array(typecode).itemsize * length))
+
+class FlowTable:
+    """Bidirectional 5-tuple flow table with timing-wheel expiry.
+
+    A flow is keyed by its protocol and its two (address, port) endpoints
+    in sorted order, so both directions of a conversation land in the same
+    slot. The endpoint that sent the first packet is the originator:
+    ``sent`` counters belong to it and ``received`` counters to the other
+    side. Per-flow counters live in preallocated typed arrays indexed by
+    slot, and the only per-flow Python objects are the key bytes and one
+    dict entry, so a million flows take about 200 MB.
+
+    Expiry uses a timing wheel with one-second buckets. Updating a flow
+    never touches the wheel; when a bucket comes due each flow in it is
+    either expired or moved to the bucket of its new deadline. The deadline
+    depends on the state: established TCP flows idle out after
+    ``tcp_timeout``, handshakes and half-closed flows after
+    ``handshake_timeout``, other protocols after ``udp_timeout``, and flows
+    closed by FIN in both directions or by RST after ``closed_timeout``.
+
+    ``collect`` returns row dicts for every flow that changed since the
+    previous call plus the flows that expired, ready to be upserted into
+    ``connections``.
+    """
+
+    def __init__(self,
+                 capacity: int = 1 << 20,
+                 tcp_timeout: int = 300,
+                 udp_timeout: int = 60,
+                 handshake_timeout: int = 30,
+                 closed_timeout: int = 10):
+        self.capacity = capacity
+        self.timeouts = (
+            udp_timeout,        # new
+            handshake_timeout,  # syn_sent
+            handshake_timeout,  # syn_received
+            tcp_timeout,        # established
+            handshake_timeout,  # closing
+            closed_timeout,     # closed
+            closed_timeout,     # reset
+        )
+        self.udp_timeout = udp_timeout
+        self.lock = threading.Lock()
+
+        # key bytes -> slot, and slot -> key bytes (the same object)
+        self.index: Dict[bytes, int] = {}
+        self.keys: List[Optional[bytes]] = [None] * capacity
+        self.free_slots: List[int] = []
+        self.next_slot = 0
+        self.flow_ids = itertools.count(1)
+
+        self.flow_id = _zeros('Q', capacity)
+        self.packets_sent = _zeros('Q', capacity)
+        self.packets_received = _zeros('Q', capacity)
+        self.bytes_sent = _zeros('Q', capacity)
+        self.bytes_received = _zeros('Q', capacity)
+        self.first_seen = _zeros('q', capacity)  # epoch nanoseconds
+        self.last_seen = _zeros('q', capacity)
+        self.state = _zeros('B', capacity)
+        # 1 when the originator is the lower endpoint of the key
+        self.originator_low = _zeros('B', capacity)
+        # TCP flags seen from each side, OR-ed together
+        self.flags_sent = _zeros('B', capacity)
+        self.flags_received = _zeros('B', capacity)
+        # Wheel tick a slot is currently scheduled at; older wheel entries are stale
+        self.scheduled = _zeros('q', capacity)
+
+        wheel_size = 1
+        while wheel_size < max(self.timeouts) + 2:
+            wheel_size <<= 1
+        self.wheel_mask = wheel_size - 1
+        self.wheel: List[List[int]] = [[] for _ in range(wheel_size)]
+        self.tick = 0
+        # Flow clock: last packet time plus wall time elapsed since, so replayed captures expire correctly
+        self._clock_ns = 0
+        self._clock_at = time.monotonic()
+
+        # Slot the last ``update`` counted its packet in (-1 when the table was full); see ``connection_id``
+        self.last_slot = -1
+        self.dirty: set = set()
+        # Snapshots of expired flows waiting for collect
+        self.expired: List[tuple] = []
+        self.stats = {
+            'created': 0,
+            'expired': 0,
+            'closed': 0,
+            'table_full': 0,
+            'unreported': 0,
+            'max_active': 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def update(self, src: bytes, dst: bytes, proto: int, sport: Optional[int],
+               dport: Optional[int], length: int, tcp_flags: Optional[int],
+               timestamp_ns: int) -> bool:
+        """Account one packet to its flow; returns True when the packet started a new flow."""
+        a = src + (sport or 0).to_bytes(2, 'big')
+        b = dst + (dport or 0).to_bytes(2, 'big')
+        from_low = a <= b
+        key = bytes((proto,)) + (a + b if from_low else b + a)
+
+        with self.lock:
+            if timestamp_ns > self._clock_ns:
+                self._clock_ns = timestamp_ns
+                self._clock_at = time.monotonic()
+                if timestamp_ns // 1000000000 > self.tick:
+                    self._advance(timestamp_ns // 1000000000)
+
+            slot = self.index.get(key)
+            if slot is None:
+                slot = self._create(key, from_low, proto, length, tcp_flags, timestamp_ns)
+                self.last_slot = -1 if slot is None else slot
+                return slot is not None
+            self.last_slot = slot
+
+            forward = from_low == bool(self.originator_low[slot])
+            if forward:
+                self.packets_sent[slot] += 1
+                self.bytes_sent[slot] += length
+            else:
+                self.packets_received[slot] += 1
+                self.bytes_received[slot] += length
+            if timestamp_ns > self.last_seen[slot]:
+                self.last_seen[slot] = timestamp_ns
+            self._transition(slot, proto, tcp_flags, forward, timestamp_ns)
+            self.dirty.add(slot)
+            return False
+
+    def _create(self, key: bytes, from_low: bool, proto: int, length: int,
+                tcp_flags: Optional[int], timestamp_ns: int) -> Optional[int]:
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        elif self.next_slot < self.capacity:
+            slot = self.next_slot
+            self.next_slot += 1
+        else:
+            self.stats['table_full'] += 1
+            return None
+
+        self.index[key] = slot
+        self.keys[slot] = key
+        self.flow_id[slot] = next(self.flow_ids)
+        self.packets_sent[slot] = 1
+        self.bytes_sent[slot] = length
+        self.packets_received[slot] = 0
+        self.bytes_received[slot] = 0
+        self.first_seen[slot] = timestamp_ns
+        self.last_seen[slot] = timestamp_ns
+        self.originator_low[slot] = from_low
+        self.flags_sent[slot] = tcp_flags or 0
+        self.flags_received[slot] = 0
+        if proto == IPPROTO_TCP:
+            flags = tcp_flags or 0
+            if flags & TCP_RST:
+                self.state[slot] = STATE_RESET
+            elif flags & TCP_SYN and not flags & TCP_ACK:
+                self.state[slot] = STATE_SYN_SENT
+            else:
+                # Picked up mid-stream
+                self.state[slot] = STATE_ESTABLISHED
+        else:
+            self.state[slot] = STATE_NEW
+        self._schedule(slot, timestamp_ns // 1000000000 + self._timeout(slot))
+        self.dirty.add(slot)
+
+        self.stats['created'] += 1
+        if len(self.index) > self.stats['max_active']:
+            self.stats['max_active'] = len(self.index)
+        return slot
+
+    def _transition(self, slot: int, proto: int, tcp_flags: Optional[int], forward: bool,
+                    timestamp_ns: int) -> None:
+        """Advance the flow state for one packet and shorten its deadline when it closes."""
+        state = self.state[slot]
+        if proto != IPPROTO_TCP:
+            if state == STATE_NEW and not forward:
+                self.state[slot] = STATE_ESTABLISHED
+            return
+
+        flags = tcp_flags or 0
+        if forward:
+            self.flags_sent[slot] |= flags
+        else:
+            self.flags_received[slot] |= flags
+        if state >= STATE_CLOSED:
+            return
+
+        if flags & TCP_RST:
+            new_state = STATE_RESET
+        elif flags & TCP_FIN or state == STATE_CLOSING:
+            both = self.flags_sent[slot] & self.flags_received[slot] & TCP_FIN
+            new_state = STATE_CLOSED if both else STATE_CLOSING
+        elif state == STATE_SYN_SENT and not forward:
+            new_state = STATE_SYN_RECEIVED if flags & TCP_SYN else STATE_ESTABLISHED
+        elif state == STATE_SYN_RECEIVED and forward and flags & TCP_ACK:
+            new_state = STATE_ESTABLISHED
+        else:
+            return
+
+        if new_state != state:
+            self.state[slot] = new_state
+            if new_state >= STATE_CLOSING:
+                # Closing flows get a shorter deadline than the one they are scheduled at
+                self._schedule(slot, timestamp_ns // 1000000000 + self.timeouts[new_state])
+
+    def _timeout(self, slot: int) -> int:
+        state = self.state[slot]
+        if state == STATE_ESTABLISHED and self.keys[slot][0] != IPPROTO_TCP:
+            return self.udp_timeout
+        return self.timeouts[state]
+
+    def _schedule(self, slot: int, deadline: int) -> None:
+        # Deadlines never reach further than one turn of the wheel
+        deadline = max(deadline, self.tick + 1)
+        deadline = min(deadline, self.tick + self.wheel_mask)
+        self.scheduled[slot] = deadline
+        self.wheel[deadline & self.wheel_mask].append(slot)
+
+    def _advance(self, now: int) -> None:
+        """Run every wheel bucket up to ``now`` (epoch seconds)."""
+        if self.tick == 0 or now - self.tick > self.wheel_mask:
+            # First packet, or idle for longer than one turn: visit each bucket once
+            start = max(self.tick + 1, now - self.wheel_mask)
+        else:
+            start = self.tick + 1
+        for tick in range(start, now + 1):
+            self.tick = tick
+            bucket = self.wheel[tick & self.wheel_mask]
+            if not bucket:
+                continue
+            self.wheel[tick & self.wheel_mask] = []
+            for slot in bucket:
+                scheduled = self.scheduled[slot]
+                # Skip freed slots and entries left behind by a reschedule
+                if self.keys[slot] is None or scheduled > tick or scheduled & self.wheel_mask != tick & self.wheel_mask:
+                    continue
+                deadline = self.last_seen[slot] // 1000000000 + self._timeout(slot)
+                if deadline > tick and self.state[slot] < STATE_CLOSED:
+                    self._schedule(slot, deadline)
+                else:
+                    self._expire(slot)
+        self.tick = now
+
+    def _expire(self, slot: int) -> None:
+        state = self.state[slot]
+        # Bounded in case nothing collects, e.g. with database saving off
+        if len(self.expired) < self.capacity:
+            self.expired.append(self._snapshot(slot))
+        else:
+            self.stats['unreported'] += 1
+        self.stats['expired'] += 1
+        if state >= STATE_CLOSED:
+            self.stats['closed'] += 1
+        del self.index[self.keys[slot]]
+        self.keys[slot] = None
+        self.scheduled[slot] = 0
+        self.dirty.discard(slot)
+        self.free_slots.append(slot)
+
+    def _snapshot(self, slot: int) -> tuple:
+        """Copy out a slot's raw fields; cheap enough to do under the lock."""
+        return (self.keys[slot], self.originator_low[slot], self.flow_id[slot],
+                self.bytes_sent[slot], self.bytes_received[slot],
+                self.packets_sent[slot], self.packets_received[slot],
+                self.first_seen[slot], self.last_seen[slot], self.state[slot])
+
+    @staticmethod
+    def _connection_id(first_seen: int, flow_id: int) -> str:
+        return f"{first_seen:x}-{flow_id:x}"
+
+    def connection_id(self, slot: int) -> Optional[str]:
+        """``connection_id`` of the flow in ``slot``, e.g. ``last_slot`` right after an ``update``.
+
+        Call it from the thread that updates the table: a slot is only
+        reused by ``update``, so its flow cannot change in between.
+        """
+        if slot < 0:
+            return None
+        return self._connection_id(self.first_seen[slot], self.flow_id[slot])
+
+    @staticmethod
+    def _row(snapshot: tuple, status: Optional[str] = None) -> Dict[str, Any]:
+        """Build the connection row from a slot snapshot."""
+        (key, originator_low, flow_id, bytes_sent, bytes_received,
+         packets_sent, packets_received, first_seen, last_seen, state) = snapshot
+        proto = key[0]
+        width = (len(key) - 5) // 2
+        family = socket.AF_INET if width == 4 else socket.AF_INET6
+        low = (socket.inet_ntop(family, key[1:1 + width]),
+               int.from_bytes(key[1 + width:3 + width], 'big'))
+        high = (socket.inet_ntop(family, key[3 + width:3 + 2 * width]),
+                int.from_bytes(key[3 + 2 * width:], 'big'))
+        (source_ip, source_port), (destination_ip, destination_port) = (low, high) if originator_low else (high, low)
+        has_ports = source_port or destination_port
+        return {
+            'connection_id': FlowTable._connection_id(first_seen, flow_id),
+            'protocol': PROTOCOL_NAMES.get(proto, 'Unknown'),
+            'source_ip': source_ip,
+            'destination_ip': destination_ip,
+            'source_port': source_port if has_ports else None,
+            'destination_port': destination_port if has_ports else None,
+            'bytes_sent': bytes_sent,
+            'bytes_received': bytes_received,
+            'packets_sent': packets_sent,
+            'packets_received': packets_received,
+            'timestamp': datetime.fromtimestamp(first_seen / 1e9),
+            'last_seen': datetime.fromtimestamp(last_seen / 1e9),
+            'duration': (last_seen - first_seen) / 1e9,
+            'application': application_for(proto, source_port, destination_port) if has_ports else None,
+            'tcp_state': STATE_NAMES[state] if proto == IPPROTO_TCP else None,
+            'status': status or ('closed' if state >= STATE_CLOSED else 'active'),
+        }
+
+    def expire(self, now_ns: Optional[int] = None) -> None:
+        """Advance the wheel to the flow clock (or ``now_ns``) without a packet arriving."""
+        with self.lock:
+            if now_ns is None:
+                if not self._clock_ns:
+                    return
+                now_ns = self._clock_ns + int((time.monotonic() - self._clock_at) * 1e9)
+            if now_ns // 1000000000 > self.tick:
+                self._advance(now_ns // 1000000000)
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """Return rows for flows changed since the last call and for flows that expired."""
+        self.expire()
+        with self.lock:
+            changed = [self._snapshot(slot) for slot in self.dirty]
+            self.dirty = set()
+            expired, self.expired = self.expired, []
+        # Formatting happens outside the lock so the capture path is not held up
+        return [self._row(snapshot) for snapshot in changed] + [self._row(snapshot, 'closed') for snapshot in expired]
+
+    def active(self, limit: int = 25, protocol: Optional[str] = None,
+               application: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` live flows, most recently active first."""
+        with self.lock:
+            slots = list(self.index.values())
+        if protocol:
+            slots = [slot for slot in slots
+                     if self.keys[slot] is not None
+                     and PROTOCOL_NAMES.get(self.keys[slot][0]) == protocol]
+        if not application:
+            slots = heapq.nlargest(limit, slots, key=self.last_seen.__getitem__)
+        else:
+            slots = sorted(slots, key=self.last_seen.__getitem__, reverse=True)
+
+        rows = []
+        for slot in slots:
+            with self.lock:
+                if self.keys[slot] is None:
+                    continue
+                snapshot = self._snapshot(slot)
+            row = self._row(snapshot)
+            if application and row['application'] != application:
+                continue
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Forget every flow, returning rows that report them all as closed.
+
+        For a table about to be replaced: flows still live are reported
+        along with the expired ones ``collect`` has not returned yet.
+        """
+        with self.lock:
+            live = [self._snapshot(slot) for slot in self.index.values()]
+            expired = self.expired
+            self._reset()
+        return [self._row(snapshot, 'closed') for snapshot in live + expired]
+
+    def clear(self) -> None:
+        """Forget every flow without reporting them."""
+        with self.lock:
+            self._reset()
+
+    def _reset(self) -> None:
+        self.index.clear()
+        self.keys = [None] * self.capacity
+        self.free_slots = []
+        self.next_slot = 0
+        self.last_slot = -1
+        self.wheel = [[] for _ in self.wheel]
+        self.tick = 0
+        self._clock_ns = 0
+        self.dirty = set()
+        self.expired = []
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'active': len(self.index),
+            'capacity': self.capacity,
+            'pending_rows': len(self.dirty) + len(self.expired),
+        }
@@ -0,0 +1,256 @@
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .packet_parser import IPPROTO_TCP, IPPROTO_UDP, PROTOCOL_NAMES, TCP_APPLICATIONS, UDP_APPLICATIONS
+
+# Keys counted per bucket, each weighted by bytes
+DIMENSIONS = ('protocols', 'applications', 'sources', 'destinations', 'ports', 'conversations')
+PROTOCOLS, APPLICATIONS, SOURCES, DESTINATIONS, PORTS, CONVERSATIONS = range(len(DIMENSIONS))
+
+# (seconds per bucket, buckets kept): an hour of minutes and a week of hours
+RESOLUTIONS = ((60, 60), (3600, 168))
+
+# Counters kept per dimension and bucket; estimates are within total bytes / (capacity + 1)
+DEFAULT_CAPACITY = 128
+
+class HitterBucket:
+    """One Misra-Gries summary per dimension for a single time bucket.
+
+    ``counts[d]`` maps a key to its estimated bytes, which never exceed the
+    true count and fall short of it by at most ``errors[d]``. Pruning
+    subtracts the (capacity + 1)-th largest count from every counter and
+    drops those that reach zero; at least capacity + 1 counters give up that
+    much each time, so ``errors[d]`` stays within ``total / (capacity + 1)``.
+    Summaries merge by adding counters and errors, which keeps the bound.
+    """
+
+    __slots__ = ('bucket', 'total', 'counts', 'errors')
+
+    def __init__(self, bucket: int = -1):
+        self.bucket = bucket
+        self.total = 0
+        self.counts: List[Dict[Any, int]] = [{} for _ in DIMENSIONS]
+        self.errors = [0] * len(DIMENSIONS)
+
+    def prune(self, dimension: int, capacity: int) -> None:
+        """Shrink one summary to at most ``capacity`` counters."""
+        counts = self.counts[dimension]
+        if len(counts) <= capacity:
+            return
+        cut = sorted(counts.values(), reverse=True)[capacity]
+        self.errors[dimension] += cut
+        self.counts[dimension] = {key: count - cut for key, count in counts.items() if count > cut}
+
+    def merge(self, other: 'HitterBucket', capacity: Optional[int] = None) -> None:
+        """Add another bucket's summaries, pruning back to ``capacity`` when given."""
+        self.total += other.total
+        for dimension, other_counts in enumerate(other.counts):
+            counts = self.counts[dimension]
+            for key, count in other_counts.items():
+                counts[key] = counts.get(key, 0) + count
+            self.errors[dimension] += other.errors[dimension]
+            if capacity is not None:
+                self.prune(dimension, capacity)
+
+    def to_tuple(self) -> tuple:
+        return self.bucket, self.total, self.counts, self.errors
+
+    @classmethod
+    def from_tuple(cls, values: tuple) -> 'HitterBucket':
+        bucket = cls(values[0])
+        bucket.total = values[1]
+        bucket.counts = [dict(counts) for counts in values[2]]
+        bucket.errors = list(values[3])
+        return bucket
+
+class HeavyHitters:
+    """Top protocols, applications, hosts, ports and conversations by bytes.
+
+    Every packet updates the summaries of the current minute. When the
+    minute closes it is pruned to ``capacity`` counters per dimension,
+    stored in the minute ring and merged into its hour in the hour ring, so
+    memory is fixed at (60 + 168) buckets of at most ``capacity`` counters
+    for each dimension. ``top`` answers a window by merging the minute
+    buckets it covers, or the hour buckets for windows over an hour.
+
+    Like the traffic counters, the clock follows packet time and keeps
+    running on wall time between packets.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, resolutions=RESOLUTIONS):
+        self.capacity = capacity
+        # Counters allowed to accumulate in the open bucket before it is pruned
+        self.limit = capacity * 2
+        (self.minute_seconds, minute_length), (self.hour_seconds, hour_length) = resolutions
+        self.minutes = [HitterBucket() for _ in range(minute_length)]
+        self.hours = [HitterBucket() for _ in range(hour_length)]
+        self.lock = threading.Lock()
+        self.applications = {IPPROTO_TCP: TCP_APPLICATIONS, IPPROTO_UDP: UDP_APPLICATIONS}
+
+        self.second = 0
+        self.current = HitterBucket()
+        self._clock_at = time.monotonic()
+        # Set once buckets arrive through ``merge``; the reporters then drive the clock
+        self.merged = False
+        self.stats = {'prunes': 0}
+
+    def add(self, timestamp_ns: int, length: int, proto: int, sport: Optional[int],
+            dport: Optional[int], src: bytes, dst: bytes) -> None:
+        """Count one packet's bytes against each of its keys."""
+        second = timestamp_ns // 1000000000
+        with self.lock:
+            if second > self.second:
+                if second // self.minute_seconds != self.second // self.minute_seconds:
+                    self._roll(second // self.minute_seconds)
+                self.second = second
+                self._clock_at = time.monotonic()
+            # Late packets are counted in the current minute
+            bucket = self.current
+            bucket.total += length
+            protocols, applications, sources, destinations, ports, conversations = bucket.counts
+            # Protocol and application names are a handful of keys and never need pruning
+            key = PROTOCOL_NAMES.get(proto, 'Other')
+            protocols[key] = protocols.get(key, 0) + length
+            if sport is not None:
+                names = self.applications.get(proto)
+                if names is not None:
+                    key = names.get(dport) or names.get(sport)
+                    if key is not None:
+                        applications[key] = applications.get(key, 0) + length
+                # The lower port is taken as the service port
+                key = (proto << 16) | (sport if sport < dport else dport)
+                ports[key] = ports.get(key, 0) + length
+            sources[src] = sources.get(src, 0) + length
+            destinations[dst] = destinations.get(dst, 0) + length
+            key = src + dst if src < dst else dst + src
+            conversations[key] = conversations.get(key, 0) + length
+            limit = self.limit
+            if len(conversations) > limit or len(sources) > limit or len(destinations) > limit or len(ports) > limit:
+                for dimension in (SOURCES, DESTINATIONS, PORTS, CONVERSATIONS):
+                    if len(bucket.counts[dimension]) > limit:
+                        bucket.prune(dimension, self.capacity)
+                        self.stats['prunes'] += 1
+
+    def _roll(self, minute: int) -> None:
+        """Store the open minute and start ``minute``."""
+        if self.second:
+            self._store(self.current)
+        self.current = HitterBucket(minute)
+
+    def _store(self, bucket: HitterBucket) -> None:
+        """Put a closed minute into the minute ring and add it to its hour."""
+        for dimension in range(len(DIMENSIONS)):
+            bucket.prune(dimension, self.capacity)
+        minute_slot = bucket.bucket % len(self.minutes)
+        stored = self.minutes[minute_slot]
+        if stored.bucket == bucket.bucket:
+            stored.merge(bucket, self.capacity)
+        else:
+            self.minutes[minute_slot] = bucket
+        hour = bucket.bucket * self.minute_seconds // self.hour_seconds
+        hour_slot = hour % len(self.hours)
+        if self.hours[hour_slot].bucket != hour:
+            self.hours[hour_slot] = HitterBucket(hour)
+        self.hours[hour_slot].merge(bucket, self.capacity)
+
+    def _now(self) -> int:
+        """Current second: last packet time plus the wall time since it."""
+        if self.merged:
+            return self.second
+        return self.second + int(time.monotonic() - self._clock_at)
+
+    def top(self, dimension: str, seconds: int, limit: int = 10) -> Tuple[List[Tuple[Any, int, int]], int]:
+        """Return the ``limit`` largest keys of the last ``seconds`` and the window's byte total.
+
+        Each key comes as ``(key, bytes, max_bytes)``: its true byte count
+        lies between the two. Any key not listed sent at most the smallest
+        ``max_bytes`` - ``bytes`` gap. The window is rounded out to whole
+        buckets, minutes up to an hour and hours beyond that.
+        """
+        index = DIMENSIONS.index(dimension)
+        if seconds > self.hour_seconds * len(self.hours):
+            raise ValueError(f"Window is longer than the {len(self.hours)} hours kept")
+        with self.lock:
+            if not self.second:
+                return [], 0
+            now = self._now()
+            if seconds <= self.hour_seconds:
+                resolution, ring = self.minute_seconds, self.minutes
+            else:
+                resolution, ring = self.hour_seconds, self.hours
+            last = now // resolution
+            first = last - (seconds + resolution - 1) // resolution + 1
+            merged = HitterBucket()
+            for bucket in ring:
+                if first <= bucket.bucket <= last:
+                    merged.total += bucket.total
+                    merged.errors[index] += bucket.errors[index]
+                    counts = merged.counts[index]
+                    for key, count in bucket.counts[index].items():
+                        counts[key] = counts.get(key, 0) + count
+            # The open minute is not in either ring yet
+            if first <= self.current.bucket * self.minute_seconds // resolution <= last:
+                merged.total += self.current.total
+                merged.errors[index] += self.current.errors[index]
+                counts = merged.counts[index]
+                for key, count in self.current.counts[index].items():
+                    counts[key] = counts.get(key, 0) + count
+
+        error = merged.errors[index]
+        largest = sorted(merged.counts[index].items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(_format_key(index, key), count, count + error) for key, count in largest], merged.total
+
+    def buckets_since(self, cursor: Optional[int] = None, final: bool = False) -> Tuple[List[tuple], Optional[int]]:
+        """Return closed minutes after ``cursor`` as plain tuples, and the new cursor.
+
+        Fan-out workers ship these to the parent, which folds them in with
+        ``merge``. With ``final`` the open minute is included as well.
+        """
+        with self.lock:
+            buckets = sorted((bucket for bucket in self.minutes
+                              if bucket.bucket >= 0 and (cursor is None or bucket.bucket > cursor)),
+                             key=lambda bucket: bucket.bucket)
+            result = [bucket.to_tuple() for bucket in buckets]
+            if final and self.current.total:
+                result.append(self.current.to_tuple())
+            return result, buckets[-1].bucket if buckets else cursor
+
+    def merge(self, buckets: List[tuple]) -> None:
+        """Add closed minutes reported by another instance."""
+        if not buckets:
+            return
+        with self.lock:
+            for values in buckets:
+                self._store(HitterBucket.from_tuple(values))
+            self.merged = True
+            latest = max(values[0] for values in buckets)
+            self.second = max(self.second, (latest + 1) * self.minute_seconds)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self.lock:
+            counters = sum(len(counts) for bucket in self.minutes + self.hours + [self.current]
+                           for counts in bucket.counts)
+        return {
+            **self.stats,
+            'capacity': self.capacity,
+            'counters': counters,
+            'max_counters': (len(self.minutes) + len(self.hours)) * self.capacity * len(DIMENSIONS)
+                            + self.limit * len(DIMENSIONS),
+        }
+
+def _address(address: bytes) -> str:
+    return socket.inet_ntop(socket.AF_INET if len(address) == 4 else socket.AF_INET6, address)
+
+def _format_key(dimension: int, key: Any) -> Any:
+    """Turn a stored key into what the API returns."""
+    if dimension in (SOURCES, DESTINATIONS):
+        return _address(key)
+    if dimension == CONVERSATIONS:
+        width = len(key) // 2
+        return _address(key[:width]), _address(key[width:])
+    if dimension == PORTS:
+        proto, port = key >> 16, key & 0xFFFF
+        return f"{PROTOCOL_NAMES.get(proto, 'Other')}/{port}"
+    return key
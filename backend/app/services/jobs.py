@@ -0,0 +1,38 @@
+import logging
+
+from ..core.cache import purge_expired_caches
+from ..core.scheduler import JobScheduler, CronTrigger, IntervalTrigger
+from ..db.session import AsyncSessionLocal
+from .database import DatabaseService
+from .packet_capture import packet_capture
+
+logger = logging.getLogger(__name__)
+
+async def run_housekeeping() -> int:
+    """Remove expired packets in throttled chunks; returns the packets removed."""
+    settings = packet_capture.settings['housekeeping']
+    async with AsyncSessionLocal() as session:
+        deleted_count = await DatabaseService(session).run_housekeeping(
+            chunk_size=settings.get('chunk_size', 5000),
+            pause=settings.get('pause', 0.05)
+        )
+    logger.info(f"Housekeeping complete: {deleted_count} expired packets deleted")
+    return deleted_count
+
+def register_jobs(scheduler: JobScheduler) -> None:
+    """Add the app's background jobs to ``scheduler``."""
+    housekeeping = packet_capture.settings['housekeeping']
+    scheduler.add_job('housekeeping', run_housekeeping,
+                      CronTrigger(housekeeping.get('schedule', '30 3 * * *'),
+                                  jitter=housekeeping.get('jitter', 600)))
+    scheduler.add_job('traffic_rollup', packet_capture.run_rollup,
+                      IntervalTrigger(packet_capture.rollup.interval))
+    scheduler.add_job('cache_eviction', purge_expired_caches, IntervalTrigger(60, jitter=5))
+
+    # GeoIP lookups need the optional geoip2 package
+    try:
+        from ..core.geo import geoip
+    except ImportError:
+        logger.info("geoip2 is not installed, not scheduling GeoIP reloads")
+    else:
+        scheduler.add_job('geoip_reload', geoip.reload, CronTrigger('15 * * * *', jitter=60))
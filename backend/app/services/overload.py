@@ -0,0 +1,104 @@
+import logging
+import time
+from typing import Any, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Degradation levels, from full processing down to flow-only
+LEVEL_FULL = 0
+LEVEL_NO_PAYLOAD = 1
+LEVEL_NO_REVERSE_DNS = 2
+LEVEL_FLOW_ONLY = 3
+
+LEVEL_NAMES = ('full', 'no_payload', 'no_reverse_dns', 'flow_only')
+
+# Sampling modes for PacketCapture.settings['sampling']['mode']
+SAMPLING_MODES = ('all', 'one_in_n', 'flow_hash', 'headers_only')
+
+class DegradationLadder:
+    """Steps capture processing down under load and back up when it subsides.
+
+    ``update`` is fed a pressure figure between 0 and 1 (the fullest of the
+    writer and enrichment queues). At or above ``high_water`` the ladder
+    drops one level, at most once per ``step_interval`` seconds. Once
+    pressure has stayed at or below ``low_water`` for ``recover_after``
+    seconds it climbs back one level. Each step is logged and counted.
+    """
+
+    def __init__(self,
+                 high_water: float = 0.8,
+                 low_water: float = 0.3,
+                 step_interval: float = 2.0,
+                 recover_after: float = 10.0,
+                 max_level: int = LEVEL_FLOW_ONLY,
+                 names: Sequence[str] = LEVEL_NAMES):
+        self.high_water = high_water
+        self.low_water = low_water
+        self.step_interval = step_interval
+        self.recover_after = recover_after
+        self.max_level = max_level
+        self.names = names
+
+        self.level = LEVEL_FULL
+        self.pressure = 0.0
+        self.last_change = time.monotonic()
+        self.calm_since: Optional[float] = None
+        self.time_in_level = [0.0] * (max_level + 1)
+        self.stats = {
+            'step_downs': 0,
+            'step_ups': 0,
+            'max_pressure': 0.0,
+        }
+
+    @property
+    def level_name(self) -> str:
+        return self.names[self.level]
+
+    def update(self, pressure: float, now: Optional[float] = None) -> int:
+        """Record the current pressure and return the (possibly changed) level."""
+        now = time.monotonic() if now is None else now
+        self.pressure = pressure
+        self.stats['max_pressure'] = max(self.stats['max_pressure'], pressure)
+
+        if pressure <= self.low_water:
+            if self.calm_since is None:
+                self.calm_since = now
+        else:
+            self.calm_since = None
+
+        if pressure >= self.high_water and self.level < self.max_level:
+            if now - self.last_change >= self.step_interval or self.level == LEVEL_FULL:
+                self._set_level(self.level + 1, now)
+                self.stats['step_downs'] += 1
+                logger.warning(f"Capture overloaded (pressure {pressure:.0%}), degrading to level "
+                               f"{self.level} ({self.level_name})")
+        elif self.level > LEVEL_FULL and self.calm_since is not None:
+            if now - max(self.calm_since, self.last_change) >= self.recover_after:
+                self._set_level(self.level - 1, now)
+                self.stats['step_ups'] += 1
+                logger.info(f"Capture load subsided (pressure {pressure:.0%}), recovering to level "
+                            f"{self.level} ({self.level_name})")
+        return self.level
+
+    def _set_level(self, level: int, now: float) -> None:
+        self.time_in_level[self.level] += now - self.last_change
+        self.level = level
+        self.last_change = now
+
+    def reset(self) -> None:
+        self._set_level(LEVEL_FULL, time.monotonic())
+        self.calm_since = None
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get the current level, pressure and per-level time."""
+        now = time.monotonic()
+        time_in_level = list(self.time_in_level)
+        time_in_level[self.level] += now - self.last_change
+        return {
+            **self.stats,
+            'level': self.level,
+            'level_name': self.level_name,
+            'pressure': self.pressure,
+            'seconds_in_level': now - self.last_change,
+            'time_in_level': dict(zip(self.names, time_in_level)),
+        }
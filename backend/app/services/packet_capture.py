@@ -1,17 +1,31 @@
-from scapy.all import sniff, IP, TCP, UDP, ICMP, IPv6
-from typing import List, Dict, Optional, Callable, Any
+from scapy.all import sniff, conf, IP
+from typing import List, Dict, Optional, Callable, Any, Union
+import itertools
+import socket
 import threading
-import queue
 import logging
 import time
-import binascii
+import select
 from datetime import datetime, timedelta
 import json
-from uuid import uuid4
-import socket
-import re
+import zlib
 
-from ..db.session import AsyncSessionLocal
+from .packet_writer import PacketWriter
+from .dns_resolver import ReverseResolver
+from ..core.cache import LRUCache, MISSING
+from ..core.ring_buffer import RingBuffer
+from ..core.scheduler import scheduler, CronTrigger, IntervalTrigger
+from ..core.network_classifier import network_classifier
+from .ring_capture import TPacketV3Ring
+from .capture_workers import FanoutCapture
+from .packet_parser import LINKTYPE_ETHERNET, IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP, IPPROTO_ICMPV6, parse_headers, dissect_frame
+from .packet_record import CapturedPacket, PAYLOAD_EXCERPT_BYTES
+from .flow_table import FlowTable
+from .traffic_stats import TrafficStatsAggregator
+from .traffic_rollup import TrafficRollup
+from .heavy_hitters import HeavyHitters, DEFAULT_CAPACITY
+from .cardinality import CardinalityTracker, DEFAULT_MAX_HOSTS
+from .overload import DegradationLadder, LEVEL_NO_PAYLOAD, LEVEL_NO_REVERSE_DNS, LEVEL_FLOW_ONLY, SAMPLING_MODES
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +34,7 @@ class PacketCapture:
         """Initialize the packet capture service."""
         self.capture_thread: Optional[threading.Thread] = None
         self.should_stop = threading.Event()
-        self.packet_queue = queue.Queue(maxsize=1000)  # Buffer last 1000 packets
+        self.recent_packets = RingBuffer(1000)  # Last 1000 packets, read without consuming
         self.callbacks: List[Callable] = []
         self.packet_stats = {
             'total_packets': 0,
@@ -37,18 +51,8 @@ class PacketCapture:
         self.packet_count = 0
         self.byte_count = 0
         
-        # IP to hostname cache to avoid repeated lookups
-        self.hostname_cache = {}
-        # Known provider networks (simplified example)
-        self.known_providers = {
-            '8.8.8.8': 'Google DNS',
-            '8.8.4.4': 'Google DNS',
-            '1.1.1.1': 'Cloudflare DNS',
-            '1.0.0.1': 'Cloudflare DNS',
-            '208.67.222.222': 'OpenDNS',
-            '208.67.220.220': 'OpenDNS'
-        }
-        
+        # Bounded cache of provider labels; PTR answers are cached by the resolver
+        self.hostname_cache = LRUCache(maxsize=65536)
         # Default settings
         self.settings = {
             'interface': None,  # Default to all interfaces
@@ -63,221 +67,394 @@ class PacketCapture:
                 'duration': 300  # seconds
             },
             'store_raw_packets': False,
-            'save_to_database': True
+            'save_to_database': True,
+            'fast_path': True,  # Parse raw frames instead of dissecting with scapy
+            'capture_backend': 'scapy',  # 'scapy' or 'tpacket_v3' (Linux mmap ring)
+            'fanout': {
+                'workers': 0,  # > 1 starts that many PACKET_FANOUT worker processes
+                'pin_cpus': False  # True pins workers round-robin, or give a list of CPU ids
+            },
+            'tpacket': {
+                'block_size': 1 << 22,  # 4 MiB, multiple of the page size
+                'block_count': 64,
+                'frame_size': 2048,
+                'timeout_ms': 100  # Retire partially filled blocks after this long
+            },
+            'db_writer': {
+                'queue_size': 50000,
+                'batch_size': 5000,
+                'flush_interval': 0.2  # seconds
+            },
+            'reverse_dns': {
+                'enabled': True,
+                'concurrency': 16,  # Maximum PTR queries in flight
+                'timeout': 2.0,  # seconds per query
+                'positive_ttl': 3600,  # seconds to cache a resolved name
+                'negative_ttl': 300,  # seconds to cache a failed lookup
+                'cache_size': 65536,
+                'max_pending': 4096  # Unanswered queries before new misses are shed
+            },
+            'sampling': {
+                'mode': 'all',  # 'all', 'one_in_n', 'flow_hash' (whole flows) or 'headers_only'
+                'rate': 10  # N for the one_in_n and flow_hash modes
+            },
+            'overload': {
+                'enabled': True,
+                'high_water': 0.8,  # Queue fill that steps processing down a level
+                'low_water': 0.3,  # Queue fill that counts as calm
+                'step_interval': 2.0,  # seconds between two step-downs
+                'recover_after': 10.0,  # seconds of calm before stepping back up
+                'check_interval': 0.5  # seconds between load checks
+            },
+            'flows': {
+                'enabled': True,
+                'capacity': 1 << 20,  # Concurrent flows; new flows are not tracked when full
+                'tcp_timeout': 300,  # seconds an established TCP flow may stay idle
+                'udp_timeout': 60,  # seconds for UDP, ICMP and other flows
+                'handshake_timeout': 30,  # seconds for unanswered SYNs and half-closed flows
+                'closed_timeout': 10,  # seconds a flow is kept after FIN in both directions or RST
+                'flush_interval': 5.0  # seconds between upserts into the connections table
+            },
+            'rollup': {
+                'enabled': True,
+                'interval': 30.0  # seconds between writes of the minute and hour rollup tables
+            },
+            'housekeeping': {
+                'schedule': '30 3 * * *',  # cron schedule (local time) for removing expired packets
+                'jitter': 600,  # seconds of random delay added to each run
+                'chunk_size': 5000,  # packet ids per delete statement
+                'pause': 0.05  # seconds between delete statements
+            },
+            'heavy_hitters': {
+                'enabled': True,
+                'capacity': DEFAULT_CAPACITY  # counters per dimension and bucket; bounds memory and error
+            },
+            'cardinality': {
+                'enabled': True,
+                'max_hosts': DEFAULT_MAX_HOSTS  # local hosts with their own distinct-count sketches
+            }
         }
-
-    def _resolve_hostname(self, ip_address: str) -> str:
-        """Resolve an IP address to a hostname or identify provider."""
-        # Check cache first
-        if ip_address in self.hostname_cache:
-            return self.hostname_cache[ip_address]
-            
-        # Check known providers
-        if ip_address in self.known_providers:
-            self.hostname_cache[ip_address] = self.known_providers[ip_address]
-            return self.known_providers[ip_address]
-            
-        # Check provider patterns
-        provider_patterns = [
-            (r'^13\.', 'AWS'),
-            (r'^104\.', 'Akamai'),
-            (r'^34\.', 'Google Cloud'),
-            (r'^52\.', 'AWS'),
-            (r'^172\.217\.', 'Google'),
-            (r'^31\.13\.', 'Facebook'),
-            (r'^192\.168\.', 'Private Network')
-        ]
         
-        for pattern, provider in provider_patterns:
-            if re.match(pattern, ip_address):
-                self.hostname_cache[ip_address] = provider
-                return provider
+        # Memory-mapped ring, only set while the tpacket_v3 backend is capturing
+        self.ring: Optional[TPacketV3Ring] = None
+        # PACKET_FANOUT group argument when running inside a fan-out worker
+        self.fanout_arg: Optional[int] = None
+        # Worker processes when capturing in fan-out mode
+        self.fanout: Optional[FanoutCapture] = None
         
-        # Try to resolve hostname (with timeout to avoid blocking)
-        try:
-            socket.setdefaulttimeout(1)
-            hostname = socket.gethostbyaddr(ip_address)[0]
-            self.hostname_cache[ip_address] = hostname
+        # Monotonic packet ids; fan-out workers start from their own offset
+        self.packet_ids = itertools.count(1)
+        
+        # Bidirectional 5-tuple flows, upserted into the connections table by the writer
+        self.flow_table = self._create_flow_table()
+        # Rows of replaced flow tables, handed to the writer with the next collection
+        self._retired_flows: List[List[Dict[str, Any]]] = []
+        # HyperLogLog distinct counts of hosts, ports, peers and connections, overall and per local host
+        self.cardinality = self._create_cardinality()
+        # Per-second counters at 1s/1m/1h resolution behind /stats/current and /stats/history
+        self.traffic_stats = self._create_traffic_stats()
+        # Persists minute and hour aggregates of traffic_stats for long-range history
+        self.rollup = self._create_rollup()
+        # Per-minute and per-hour top-N summaries behind the /top endpoints
+        self.heavy_hitters = self._create_heavy_hitters()
+        
+        # Single batched writer for packet persistence
+        self.packet_writer = self._create_packet_writer()
+        # Asynchronous PTR lookups; names that arrive late are backfilled by the writer
+        self.resolver = self._create_resolver()
+        
+        # Load shedding: steps down to no payload, no reverse DNS, then flow-only
+        self.degradation = self._create_degradation_ladder()
+        self._next_load_check = 0.0
+        self.sampling_stats = {'sampled_out': 0}
+
+    def _create_degradation_ladder(self) -> DegradationLadder:
+        """Create the overload ladder from the current settings."""
+        overload_settings = self.settings['overload']
+        return DegradationLadder(
+            high_water=overload_settings.get('high_water', 0.8),
+            low_water=overload_settings.get('low_water', 0.3),
+            step_interval=overload_settings.get('step_interval', 2.0),
+            recover_after=overload_settings.get('recover_after', 10.0)
+        )
+
+    def _check_load(self, now: float) -> int:
+        """Feed writer and resolver queue fill to the degradation ladder."""
+        overload_settings = self.settings['overload']
+        self._next_load_check = now + overload_settings.get('check_interval', 0.5)
+        if not overload_settings.get('enabled', True):
+            return self.degradation.level
+        pressure = max(self.packet_writer.load, self.resolver.load)
+        return self.degradation.update(pressure, now)
+
+    def _sampled_out(self, sampling: Dict[str, Any], src: bytes, dst: bytes,
+                     proto: int, sport: Optional[int], dport: Optional[int]) -> bool:
+        """Return True when the sampling mode skips this packet."""
+        mode = sampling['mode']
+        if mode == 'one_in_n':
+            return self.packet_count % max(sampling.get('rate', 1), 1) != 0
+        if mode == 'flow_hash':
+            # Order the endpoints so both directions of a flow hash alike. CRC-32
+            # rather than hash(), which is salted per process, so every worker
+            # and every restart keeps the same flows.
+            a = src + (sport or 0).to_bytes(2, 'big')
+            b = dst + (dport or 0).to_bytes(2, 'big')
+            key = bytes([proto]) + (a + b if a <= b else b + a)
+            return zlib.crc32(key) % max(sampling.get('rate', 1), 1) != 0
+        return False
+
+    def _create_flow_table(self) -> FlowTable:
+        """Create the flow table from the current settings."""
+        flow_settings = self.settings['flows']
+        return FlowTable(
+            capacity=flow_settings.get('capacity', 1 << 20),
+            tcp_timeout=flow_settings.get('tcp_timeout', 300),
+            udp_timeout=flow_settings.get('udp_timeout', 60),
+            handshake_timeout=flow_settings.get('handshake_timeout', 30),
+            closed_timeout=flow_settings.get('closed_timeout', 10)
+        )
+
+    def _collect_flows(self) -> List[Dict[str, Any]]:
+        """Hand changed and expired flows to the writer."""
+        rows = []
+        while self._retired_flows:
+            rows.extend(self._retired_flows.pop())
+        if self.settings['flows'].get('enabled', True):
+            rows.extend(self.flow_table.collect())
+        return rows
+
+    def _retire_flow_table(self) -> None:
+        """Start a new flow table; the old one's flows are reported as closed."""
+        flow_table, self.flow_table = self.flow_table, self._create_flow_table()
+        self._retired_flows.append(flow_table.drain())
+
+    def _create_rollup(self) -> TrafficRollup:
+        """Create the rollup job from the current settings."""
+        return TrafficRollup(
+            source=self._current_traffic_stats,
+            interval=self.settings['rollup'].get('interval', 30.0)
+        )
+
+    def _current_traffic_stats(self) -> TrafficStatsAggregator:
+        return self.traffic_stats
+
+    async def run_rollup(self) -> int:
+        """Write one rollup pass when rollups are enabled; returns the rows written."""
+        if not self.settings.get('save_to_database', True) or not self.settings['rollup'].get('enabled', True):
+            return 0
+        return await self.rollup.run_once()
+
+    def _active_flows(self) -> int:
+        return len(self.flow_table)
+
+    def _merge_worker_seconds(self, seconds: List[tuple]) -> None:
+        """Fold per-second counters reported by the fan-out workers into the parent's rings."""
+        self.traffic_stats.merge(seconds)
+
+    def _create_heavy_hitters(self) -> HeavyHitters:
+        """Create the heavy-hitter summaries from the current settings."""
+        return HeavyHitters(capacity=self.settings['heavy_hitters'].get('capacity', DEFAULT_CAPACITY))
+
+    def _merge_worker_buckets(self, buckets: List[tuple]) -> None:
+        """Fold closed heavy-hitter minutes reported by the fan-out workers into the parent's rings."""
+        self.heavy_hitters.merge(buckets)
+
+    def _create_cardinality(self) -> CardinalityTracker:
+        """Create the distinct-count sketches from the current settings."""
+        return CardinalityTracker(max_hosts=self.settings['cardinality'].get('max_hosts', DEFAULT_MAX_HOSTS))
+
+    def _create_traffic_stats(self) -> TrafficStatsAggregator:
+        return TrafficStatsAggregator(active_source=self._active_flows, distinct_source=self._distinct_counts)
+
+    def _distinct_counts(self, start: int, end: int) -> Optional[Dict[str, int]]:
+        if not self.settings['cardinality'].get('enabled', True):
+            return None
+        return self.cardinality.count(start, end)
+
+    def _merge_worker_sketches(self, buckets: List[tuple]) -> None:
+        """Fold distinct-count sketches reported by the fan-out workers into the parent's."""
+        self.cardinality.merge(buckets)
+
+    def _create_resolver(self) -> ReverseResolver:
+        """Create the reverse-DNS resolver from the current settings."""
+        dns_settings = self.settings['reverse_dns']
+        resolver = ReverseResolver(
+            concurrency=dns_settings.get('concurrency', 16),
+            timeout=dns_settings.get('timeout', 2.0),
+            positive_ttl=dns_settings.get('positive_ttl', 3600),
+            negative_ttl=dns_settings.get('negative_ttl', 300),
+            cache_size=dns_settings.get('cache_size', 65536),
+            max_pending=dns_settings.get('max_pending', 4096)
+        )
+        resolver.add_listener(self._on_hostname_resolved)
+        return resolver
+
+    def _on_hostname_resolved(self, ip_address: str, hostname: str) -> None:
+        """Backfill a late PTR answer into packets that were emitted without it."""
+        if self.settings['save_to_database']:
+            self.packet_writer.submit_backfill(ip_address, hostname)
+
+    def _create_packet_writer(self) -> PacketWriter:
+        """Create the database writer from the current settings."""
+        writer_settings = self.settings['db_writer']
+        return PacketWriter(
+            max_queue_size=writer_settings.get('queue_size', 50000),
+            max_batch_size=writer_settings.get('batch_size', 5000),
+            flush_interval=writer_settings.get('flush_interval', 0.2),
+            connection_source=self._collect_flows,
+            connection_interval=self.settings['flows'].get('flush_interval', 5.0)
+        )
+
+    def _resolve_hostname(self, ip_address: Union[str, bytes], reverse_dns: bool = True) -> Optional[str]:
+        """Identify the provider of an IP address or return its cached hostname.
+
+        Accepts a string or packed address bytes. Never blocks: unknown
+        addresses are queued for an asynchronous PTR lookup and None is
+        returned until the answer is cached.
+        """
+        hostname = self.hostname_cache.lookup(ip_address)
+        if hostname is not MISSING:
             return hostname
-        except (socket.herror, socket.timeout):
-            # No hostname found, check if it's local
-            if ip_address.startswith('127.') or ip_address == '::1':
-                self.hostname_cache[ip_address] = 'localhost'
-                return 'localhost'
-            else:
-                self.hostname_cache[ip_address] = None
-                return None
+            
+        # Local networks and provider CIDR ranges
+        label = network_classifier.lookup(ip_address)
+        if label is not None:
+            self.hostname_cache.set(ip_address, label)
+            return label
+        
+        if not reverse_dns or not self.settings['reverse_dns'].get('enabled', True):
+            return None
+        if isinstance(ip_address, bytes):
+            family = socket.AF_INET if len(ip_address) == 4 else socket.AF_INET6
+            hostname = self.resolver.lookup(socket.inet_ntop(family, ip_address))
+        else:
+            hostname = self.resolver.lookup(ip_address)
+        if hostname is not None:
+            self.hostname_cache.set(ip_address, hostname, ttl=self.resolver.positive_ttl)
+        return hostname
 
     def _packet_callback(self, packet):
-        """Process captured packet."""
-        if IP in packet or IPv6 in packet:
-            is_ipv6 = IPv6 in packet
-            ip_layer = packet[IPv6] if is_ipv6 else packet[IP]
-            protocol_version = "IPv6" if is_ipv6 else "IPv4"
-            
-            # Extract basic packet info
-            packet_info = {
-                'id': str(uuid4()),
-                'timestamp': datetime.now().isoformat(),
-                'source_ip': ip_layer.src,
-                'destination_ip': ip_layer.dst,
-                'protocol': 'Unknown',
-                'protocol_version': protocol_version,
-                'length': len(packet),
-                'ttl': getattr(ip_layer, 'hlim' if is_ipv6 else 'ttl', None),
-                'flags': None,
-                'raw_packet': bytes(packet) if self.settings.get('store_raw_packets', False) else None,
-                'packet_summary': packet.summary()
-            }
-            
-            # Add device names using hostname resolution
-            packet_info['source_device_name'] = self._resolve_hostname(ip_layer.src)
-            packet_info['destination_device_name'] = self._resolve_hostname(ip_layer.dst)
-            
-            # Update statistics
-            self.packet_count += 1
-            self.byte_count += len(packet)
+        """Process a packet delivered by scapy.sniff."""
+        frame = getattr(packet, 'original', None) or bytes(packet)
+        linktype = conf.l2types.layer2num.get(type(packet), LINKTYPE_ETHERNET)
+        # packet.time is a Decimal for nanosecond pcaps, so this keeps full precision
+        self._process_frame(frame, int(packet.time * 1000000000), linktype)
 
-            # Process based on transport protocol
-            if TCP in packet:
-                packet_info['protocol'] = 'TCP'
-                packet_info['source_port'] = packet[TCP].sport
-                packet_info['destination_port'] = packet[TCP].dport
-                packet_info['flags'] = self._get_tcp_flags(packet[TCP])
-                self.packet_stats['tcp_packets'] += 1
-                
-                # Detect application layer protocol
-                if packet_info['destination_port'] == 80 or packet_info['source_port'] == 80:
-                    packet_info['application_protocol'] = 'HTTP'
-                elif packet_info['destination_port'] == 443 or packet_info['source_port'] == 443:
-                    packet_info['application_protocol'] = 'HTTPS'
-                elif packet_info['destination_port'] == 22 or packet_info['source_port'] == 22:
-                    packet_info['application_protocol'] = 'SSH'
-                    
-            elif UDP in packet:
-                packet_info['protocol'] = 'UDP'
-                packet_info['source_port'] = packet[UDP].sport
-                packet_info['destination_port'] = packet[UDP].dport
-                self.packet_stats['udp_packets'] += 1
+    def _process_frame(self, frame: bytes, timestamp_ns: Optional[int] = None,
+                       linktype: int = LINKTYPE_ETHERNET):
+        """Process a captured frame from its raw bytes."""
+        headers = parse_headers(frame, linktype)
+        if headers is None:
+            return
+        version, src, dst, ttl, proto, sport, dport, flags, payload_offset = headers
+        length = len(frame)
+        timestamp_ns = timestamp_ns or time.time_ns()
+        
+        # Update statistics for every packet, sampled or not
+        self.packet_count += 1
+        self.byte_count += length
+        
+        if proto == IPPROTO_TCP:
+            self.packet_stats['tcp_packets'] += 1
+        elif proto == IPPROTO_UDP:
+            self.packet_stats['udp_packets'] += 1
+        elif proto == IPPROTO_ICMP or proto == IPPROTO_ICMPV6:
+            self.packet_stats['icmp_packets'] += 1
+        else:
+            self.packet_stats['other_packets'] += 1
+
+        self.packet_stats['total_packets'] += 1
+        self.packet_stats['bytes_received'] += length
+        
+        # Flows and traffic counters see every packet, whatever the sampling mode or overload level
+        new_flow = False
+        if self.settings['flows'].get('enabled', True):
+            new_flow = self.flow_table.update(src, dst, proto, sport, dport, length, flags, timestamp_ns)
+        self.traffic_stats.add(timestamp_ns, length, proto, sport, dport, new_flow)
+        if self.settings['heavy_hitters'].get('enabled', True):
+            self.heavy_hitters.add(timestamp_ns, length, proto, sport, dport, src, dst)
+        if self.settings['cardinality'].get('enabled', True):
+            self.cardinality.add(timestamp_ns, proto, sport, dport, src, dst)
+        
+        sampling = self.settings['sampling']
+        if sampling['mode'] != 'all' and self._sampled_out(sampling, src, dst, proto, sport, dport):
+            self.sampling_stats['sampled_out'] += 1
+            return
+        
+        now = time.monotonic()
+        level = self._check_load(now) if now >= self._next_load_check else self.degradation.level
+        keep_payload = level < LEVEL_NO_PAYLOAD and sampling['mode'] != 'headers_only'
+        
+        packet = CapturedPacket(
+            id=next(self.packet_ids),
+            timestamp_ns=timestamp_ns,
+            version=version,
+            src=int.from_bytes(src, 'big'),
+            dst=int.from_bytes(dst, 'big'),
+            proto=proto,
+            ttl=ttl,
+            length=length,
+            source_port=sport,
+            destination_port=dport,
+            tcp_flags=flags,
+            # Keep the first bytes above the IP layer; hex is produced on serialization
+            payload=frame[payload_offset:payload_offset + PAYLOAD_EXCERPT_BYTES] if keep_payload and length > payload_offset else None,
+            raw_packet=frame if keep_payload and self.settings.get('store_raw_packets', False) else None
+        )
+        
+        if self.settings['flows'].get('enabled', True):
+            packet.connection_id = self.flow_table.connection_id(self.flow_table.last_slot)
+        
+        # Add device names: provider labels always, PTR lookups unless shedding load
+        reverse_dns = level < LEVEL_NO_REVERSE_DNS
+        packet.source_device_name = self._resolve_hostname(src, reverse_dns)
+        packet.destination_device_name = self._resolve_hostname(dst, reverse_dns)
+        
+        # Add to the in-memory ring for immediate access
+        self._enqueue_packet(packet)
                 
-                # Detect application layer protocol
-                if packet_info['destination_port'] == 53 or packet_info['source_port'] == 53:
-                    packet_info['application_protocol'] = 'DNS'
-                    
-            elif ICMP in packet:
-                packet_info['protocol'] = 'ICMP'
-                self.packet_stats['icmp_packets'] += 1
-            else:
-                self.packet_stats['other_packets'] += 1
+        # Save to database asynchronously, unless only flows are being kept
+        if level < LEVEL_FLOW_ONLY:
+            self._save_packet_to_db(packet)
 
-            self.packet_stats['total_packets'] += 1
-            self.packet_stats['bytes_received'] += len(packet)
-            
-            # Extract payload excerpt if available
-            if hasattr(packet, 'payload') and hasattr(packet.payload, 'payload'):
-                try:
-                    payload = bytes(packet.payload.payload)
-                    if payload:
-                        # Take first 100 bytes max and convert to hex
-                        excerpt = payload[:100]
-                        packet_info['payload_excerpt'] = binascii.hexlify(excerpt).decode('utf-8')
-                except Exception as e:
-                    logger.debug(f"Error extracting payload: {e}")
-            
-            # Add to in-memory queue for immediate access
-            try:
-                self.packet_queue.put(packet_info, block=False)
-            except queue.Full:
-                # Queue is full, remove oldest packet
-                try:
-                    self.packet_queue.get_nowait()
-                    self.packet_queue.put(packet_info, block=False)
-                except queue.Empty:
-                    pass
-                    
-            # Save to database asynchronously
-            self._save_packet_to_db(packet_info)
-            
-    def _get_tcp_flags(self, tcp_layer):
-        """Extract TCP flags as a string."""
-        flags = []
-        if tcp_layer.flags & 0x01:  # FIN
-            flags.append('FIN')
-        if tcp_layer.flags & 0x02:  # SYN
-            flags.append('SYN')
-        if tcp_layer.flags & 0x04:  # RST
-            flags.append('RST')
-        if tcp_layer.flags & 0x08:  # PSH
-            flags.append('PSH')
-        if tcp_layer.flags & 0x10:  # ACK
-            flags.append('ACK')
-        if tcp_layer.flags & 0x20:  # URG
-            flags.append('URG')
-        return ','.join(flags)
+    def _enqueue_packet(self, packet: CapturedPacket):
+        """Add a packet to the recent-packets ring, overwriting the oldest when full."""
+        self.recent_packets.append(packet)
+
+    def _enqueue_worker_packets(self, packets: List[CapturedPacket]):
+        """Receive recent packets forwarded by the fan-out workers."""
+        for packet in packets:
+            self._enqueue_packet(packet)
+
+    def dissect_packet(self, packet: CapturedPacket):
+        """Fully dissect a captured packet with scapy (on demand only)."""
+        if not packet.raw_packet:
+            return None
+        return dissect_frame(packet.raw_packet)
         
-    def _save_packet_to_db(self, packet_info: Dict[str, Any]):
-        """Save packet to database asynchronously."""
+    def _save_packet_to_db(self, packet: CapturedPacket):
+        """Hand the packet to the batched database writer."""
         if not self.settings.get('save_to_database', True):
             return  # Skip if database saving is disabled
             
-        # This launches a background task to save the packet
-        threading.Thread(
-            target=self._db_save_worker,
-            args=(packet_info,),
-            daemon=True
-        ).start()
-        
-    def _db_save_worker(self, packet_info: Dict[str, Any]):
-        """Worker function to save packet to database."""
-        import asyncio
-        from ..services.database import DatabaseService
-        
-        async def save_to_db():
-            try:
-                async with AsyncSessionLocal() as session:
-                    db_service = DatabaseService(session)
-                    
-                    # Parse timestamp if it's a string
-                    if isinstance(packet_info.get('timestamp'), str):
-                        try:
-                            packet_info['timestamp'] = datetime.fromisoformat(packet_info['timestamp'])
-                        except ValueError:
-                            packet_info['timestamp'] = datetime.utcnow()
-                    
-                    # Check for malicious indicators (example implementation)
-                    is_malicious = self._check_if_malicious(packet_info)
-                    threat_category = "suspicious_traffic" if is_malicious else None
-                    
-                    # Save to database
-                    await db_service.save_packet(
-                        packet_data=packet_info,
-                        is_malicious=is_malicious,
-                        threat_category=threat_category,
-                        connection_id=packet_info.get('id')
-                    )
-            except Exception as e:
-                logger.error(f"Error saving packet to database: {e}")
-        
-        # Run the async function in a new event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(save_to_db())
-        finally:
-            loop.close()
+        # Check for malicious indicators (example implementation)
+        if self._check_if_malicious(packet):
+            packet.is_malicious = True
+            packet.threat_category = "suspicious_traffic"
+        self.packet_writer.submit(packet)
             
-    def _check_if_malicious(self, packet_info: Dict[str, Any]) -> bool:
+    def _check_if_malicious(self, packet: CapturedPacket) -> bool:
         """Simple check for malicious indicators - extend with actual logic."""
         # Example implementation - replace with real detection logic
         suspicious_ports = [4444, 31337, 8080]  # Example suspicious ports
-        suspicious_flags = ['RST,ACK', 'SYN,RST']  # Unusual flag combinations
+        suspicious_flags = [0x14, 0x06]  # Unusual flag combinations: RST+ACK, SYN+RST
         
         # Check for suspicious ports
-        if packet_info.get('source_port') in suspicious_ports or packet_info.get('destination_port') in suspicious_ports:
+        if packet.source_port in suspicious_ports or packet.destination_port in suspicious_ports:
             return True
             
         # Check for suspicious flag combinations
-        if packet_info.get('flags') in suspicious_flags:
+        if packet.tcp_flags in suspicious_flags:
             return True
             
         # Could add checks for known malicious IPs, payload patterns, etc.
@@ -288,25 +465,80 @@ class PacketCapture:
         try:
             self.is_capturing = True
             self.start_time = time.time()
+            self.ring = None
             
             # Apply settings
             iface = interface or self.settings['interface']
             filter_str = self.settings['filter'] if self.settings['filter'] else None
             
             # Set up packet capture
-            sniff(
-                iface=iface,
-                prn=self._packet_callback,
-                filter=filter_str,
-                store=0,
-                promisc=self.settings['promisc'],
-                stop_filter=lambda _: self.should_stop.is_set() or self._check_capture_limits()
-            )
+            if self.settings.get('capture_backend') == 'tpacket_v3' and self._open_ring(iface, filter_str):
+                self._capture_ring()
+            elif self.fanout_arg is not None:
+                # Every worker would see every packet without the fan-out group
+                logger.error("Fan-out worker could not open its TPACKET_V3 ring, not capturing")
+            elif self.settings.get('fast_path', True):
+                self._capture_raw(iface, filter_str)
+            else:
+                sniff(
+                    iface=iface,
+                    prn=self._packet_callback,
+                    filter=filter_str,
+                    store=0,
+                    promisc=self.settings['promisc'],
+                    stop_filter=lambda _: self.should_stop.is_set() or self._check_capture_limits()
+                )
         except Exception as e:
             logger.error(f"Error in packet capture: {e}")
         finally:
             self.is_capturing = False
     
+    def _open_ring(self, iface: Optional[str], filter_str: Optional[str]) -> bool:
+        """Open the TPACKET_V3 ring, returning False when we have to fall back to scapy."""
+        ring_settings = self.settings['tpacket']
+        ring = TPacketV3Ring(
+            interface=iface,
+            block_size=ring_settings.get('block_size', 1 << 22),
+            block_count=ring_settings.get('block_count', 64),
+            frame_size=ring_settings.get('frame_size', 2048),
+            timeout_ms=ring_settings.get('timeout_ms', 100),
+            promisc=self.settings['promisc'],
+            bpf_filter=filter_str,
+            fanout=self.fanout_arg
+        )
+        try:
+            ring.open()
+        except (OSError, ValueError) as e:
+            logger.warning(f"TPACKET_V3 ring unavailable ({e}), falling back to scapy capture")
+            return False
+        self.ring = ring
+        return True
+
+    def _capture_ring(self):
+        """Read frames block by block from the memory-mapped ring."""
+        try:
+            while not self.should_stop.is_set() and not self._check_capture_limits():
+                for timestamp_ns, frame in self.ring.read_block(timeout=0.5):
+                    self._process_frame(frame, timestamp_ns)
+        finally:
+            self.ring.close()
+
+    def _capture_raw(self, iface: Optional[str], filter_str: Optional[str]):
+        """Read raw frames from a layer 2 socket and parse them without scapy dissection."""
+        sock = conf.L2listen(iface=iface, filter=filter_str, promisc=self.settings['promisc'])
+        try:
+            while not self.should_stop.is_set() and not self._check_capture_limits():
+                ready, _, _ = select.select([sock], [], [], 0.5)
+                if not ready:
+                    continue
+                layer, frame, timestamp = sock.recv_raw()
+                if frame is None:
+                    continue
+                self._process_frame(frame, int(timestamp * 1000000000) if timestamp else None,
+                                    conf.l2types.layer2num.get(layer, LINKTYPE_ETHERNET))
+        finally:
+            sock.close()
+    
     def _check_capture_limits(self) -> bool:
         """Check if capture limits have been reached."""
         if not self.settings['capture_limit']['enabled']:
@@ -341,6 +573,20 @@ class PacketCapture:
             
         self.should_stop.clear()
         self.packet_stats['start_time'] = datetime.now()
+        # Overload seen by the previous capture says nothing about this one
+        self.degradation.reset()
+        
+        # Multi-process capture: the workers parse, enrich, detect and persist
+        fanout_settings = self.settings['fanout']
+        if fanout_settings.get('workers', 0) > 1:
+            if FanoutCapture.is_available():
+                self._start_fanout(interface, fanout_settings)
+                return
+            logger.warning("PACKET_FANOUT needs Linux AF_PACKET sockets, capturing in a single thread instead")
+        self.fanout = None
+        
+        if self.settings.get('save_to_database', True):
+            self.packet_writer.start()
         self.capture_thread = threading.Thread(
             target=self._capture_packets,
             args=(interface,),
@@ -349,29 +595,70 @@ class PacketCapture:
         self.capture_thread.start()
         logger.info(f"Started packet capture on interface: {interface or 'any'} with filter: {self.settings['filter'] or 'none'}")
     
+    def _start_fanout(self, interface: Optional[str], fanout_settings: dict) -> None:
+        """Start the PACKET_FANOUT worker processes."""
+        worker_settings = {key: value for key, value in self.settings.items() if key != 'fanout'}
+        self.fanout = FanoutCapture(
+            interface=interface,
+            settings=worker_settings,
+            workers=fanout_settings['workers'],
+            pin_cpus=fanout_settings.get('pin_cpus', False),
+            on_packets=self._enqueue_worker_packets,
+            on_seconds=self._merge_worker_seconds,
+            on_buckets=self._merge_worker_buckets,
+            on_sketches=self._merge_worker_sketches
+        )
+        self.fanout.start()
+        self.is_capturing = True
+        self.start_time = time.time()
+    
     def update_settings(self, settings: dict) -> None:
         """Update packet capture settings."""
+        sampling = settings.get('sampling')
+        if sampling is not None and sampling.get('mode') not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode: {sampling.get('mode')} (expected one of {', '.join(SAMPLING_MODES)})")
         # Update settings with new values, keeping existing ones for any missing keys
         for key, value in settings.items():
             if key in self.settings:
                 self.settings[key] = value
                 
-        # Update queue size if max_packets changed
-        if 'max_packets' in settings and settings['max_packets'] != self.packet_queue.maxsize:
-            # Create a new queue with the updated size
-            old_queue = self.packet_queue
-            self.packet_queue = queue.Queue(maxsize=settings['max_packets'])
+        # Resize the recent-packets ring if max_packets changed
+        if 'max_packets' in settings:
+            self.recent_packets.resize(settings['max_packets'])
+                
+        # Rebuild the writer if its settings changed; a running writer is drained first
+        if 'db_writer' in settings:
+            was_running = self.packet_writer.is_running
+            self.packet_writer.stop()
+            self.packet_writer = self._create_packet_writer()
+            if was_running:
+                self.packet_writer.start()
+                
+        if 'reverse_dns' in settings:
+            self.resolver.stop()
+            self.resolver = self._create_resolver()
+            
+        if 'overload' in settings:
+            self.degradation = self._create_degradation_ladder()
+            
+        if 'flows' in settings:
+            self._retire_flow_table()
+            self.packet_writer.connection_interval = self.settings['flows'].get('flush_interval', 5.0)
+            
+        if 'rollup' in settings:
+            self.rollup = self._create_rollup()
+            scheduler.reschedule('traffic_rollup', IntervalTrigger(self.rollup.interval))
+            
+        if 'housekeeping' in settings:
+            housekeeping = self.settings['housekeeping']
+            scheduler.reschedule('housekeeping', CronTrigger(housekeeping.get('schedule', '30 3 * * *'),
+                                                             jitter=housekeeping.get('jitter', 600)))
+                
+        if 'heavy_hitters' in settings:
+            self.heavy_hitters = self._create_heavy_hitters()
             
-            # Transfer items from old queue to new queue if possible
-            try:
-                while not old_queue.empty():
-                    item = old_queue.get_nowait()
-                    try:
-                        self.packet_queue.put_nowait(item)
-                    except queue.Full:
-                        break  # Stop if new queue is full
-            except queue.Empty:
-                pass
+        if 'cardinality' in settings:
+            self.cardinality = self._create_cardinality()
                 
         logger.info(f"Updated packet capture settings: {self.settings}")
     
@@ -381,6 +668,8 @@ class PacketCapture:
 
     def stop_capture(self) -> None:
         """Stop packet capture."""
+        if self.fanout:
+            self.fanout.stop()
         if self.capture_thread and self.capture_thread.is_alive():
             self.should_stop.set()
             self.capture_thread.join(timeout=5)
@@ -388,20 +677,25 @@ class PacketCapture:
                 logger.warning("Packet capture thread did not stop gracefully")
             self.capture_thread = None
         self.is_capturing = False
+        self.resolver.stop()
+        self.packet_writer.stop()
+        # Persist the traffic seen since the last rollup pass
+        scheduler.run_now('traffic_rollup')
         logger.info("Stopped packet capture")
 
-    def get_recent_packets(self, limit: int = 100) -> List[Dict]:
-        """Get recent packets from the queue."""
-        packets = []
-        try:
-            while len(packets) < limit and not self.packet_queue.empty():
-                packets.append(self.packet_queue.get_nowait())
-        except queue.Empty:
-            pass
-        return packets
+    def get_recent_packets(self, limit: int = 100, since: Optional[int] = None) -> List[Dict]:
+        """Get up to ``limit`` recent packets (oldest first) without consuming them.
+
+        Each packet carries its ring sequence number as ``seq``; pass the last
+        one seen as ``since`` to get only newer packets.
+        """
+        return [{**packet.to_dict(), 'seq': seq} for seq, packet in self.recent_packets.snapshot(limit, since)]
 
     def get_statistics(self) -> Dict:
         """Get packet capture statistics."""
+        if self.fanout:
+            return {**self.fanout.get_statistics(), 'capture_backend': 'fanout'}
+            
         current_time = time.time()
         duration = current_time - (self.start_time or current_time)
         
@@ -413,7 +707,19 @@ class PacketCapture:
             'bytes_received': self.byte_count,
             'packets_per_second': self.packet_count / duration if duration > 0 else 0,
             'bytes_per_second': self.byte_count / duration if duration > 0 else 0,
-            'is_capturing': self.is_capturing
+            'is_capturing': self.is_capturing,
+            'capture_backend': 'tpacket_v3' if self.ring else 'scapy',
+            'ring': self.ring.get_statistics() if self.ring else None,
+            'recent_packets': self.recent_packets.get_statistics(),
+            'db_writer': self.packet_writer.get_statistics(),
+            'dns': self.resolver.get_statistics(),
+            'sampling': {**self.sampling_stats, 'mode': self.settings['sampling']['mode']},
+            'overload': self.degradation.get_statistics(),
+            'flows': self.flow_table.get_statistics(),
+            'traffic': self.traffic_stats.get_statistics(),
+            'rollup': self.rollup.get_statistics(),
+            'heavy_hitters': self.heavy_hitters.get_statistics(),
+            'cardinality': self.cardinality.get_statistics()
         }
 
     def add_callback(self, callback: Callable[[Dict], None]) -> None:
@@ -464,50 +770,11 @@ class PacketCapture:
             'bytes_received': 0,
             'start_time': None,
         }
-
-    def run_housekeeping(self):
-        """Run database housekeeping to remove expired packets."""
-        import asyncio
-        from ..services.database import DatabaseService
-        
-        async def housekeeping_task():
-            try:
-                async with AsyncSessionLocal() as session:
-                    db_service = DatabaseService(session)
-                    deleted_count = await db_service.run_housekeeping()
-                    logger.info(f"Housekeeping complete: {deleted_count} expired packets deleted")
-            except Exception as e:
-                logger.error(f"Error running housekeeping: {e}")
-                
-        # Run the async function in a new event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(housekeeping_task())
-        finally:
-            loop.close()
-        
-    def start_scheduled_housekeeping(self, interval_hours: int = 24):
-        """Start scheduled housekeeping task."""
-        def housekeeping_worker():
-            while not self.should_stop.is_set():
-                # Sleep first, then run housekeeping
-                for _ in range(interval_hours * 60 * 60):  # Convert hours to seconds
-                    if self.should_stop.is_set():
-                        break
-                    time.sleep(1)
-                    
-                if not self.should_stop.is_set():
-                    logger.info("Running scheduled housekeeping")
-                    self.run_housekeeping()
-        
-        # Start the housekeeping thread
-        housekeeping_thread = threading.Thread(
-            target=housekeeping_worker,
-            daemon=True
-        )
-        housekeeping_thread.start()
-        logger.info(f"Scheduled housekeeping started with {interval_hours} hour interval")
+        self.sampling_stats = {'sampled_out': 0}
+        self._retire_flow_table()
+        self.traffic_stats = self._create_traffic_stats()
+        self.heavy_hitters = self._create_heavy_hitters()
+        self.cardinality = self._create_cardinality()
 
 # Create a singleton instance
 packet_capture = PacketCapture() 
\ No newline at end of file
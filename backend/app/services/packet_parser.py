@@ -0,0 +1,230 @@
+import socket
+import struct
+from typing import Any, Dict, Optional, Tuple
+
+# pcap link-layer header types (see https://www.tcpdump.org/linktypes.html)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_8021Q = 0x8100
+ETH_P_8021AD = 0x88A8
+ETH_P_QINQ = 0x9100
+
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_ICMPV6 = 58
+
+# IPv6 extension headers that are walked to reach the transport header
+IPV6_EXTENSION_HEADERS = {0, 43, 60, 51}
+
+TCP_FLAG_NAMES = (
+    (0x01, 'FIN'),
+    (0x02, 'SYN'),
+    (0x04, 'RST'),
+    (0x08, 'PSH'),
+    (0x10, 'ACK'),
+    (0x20, 'URG'),
+)
+
+# Protocol names as stored in packet_info, keyed by IP protocol number
+PROTOCOL_NAMES = {
+    IPPROTO_TCP: 'TCP',
+    IPPROTO_UDP: 'UDP',
+    IPPROTO_ICMP: 'ICMP',
+    IPPROTO_ICMPV6: 'ICMP',
+}
+PROTOCOL_VERSIONS = {4: 'IPv4', 6: 'IPv6'}
+
+# Same port heuristics as the scapy-based callback
+TCP_APPLICATIONS = {80: 'HTTP', 443: 'HTTPS', 22: 'SSH'}
+UDP_APPLICATIONS = {53: 'DNS'}
+
+_unpack_ethertype = struct.Struct('!H').unpack_from
+_unpack_ports = struct.Struct('!HH').unpack_from
+_unpack_ipv4 = struct.Struct('!BBHHHBBH4s4s').unpack_from
+_unpack_ipv6 = struct.Struct('!IHBB16s16s').unpack_from
+
+# Flag strings are interned once instead of being rebuilt for every segment
+_TCP_FLAGS = tuple(
+    ','.join(name for bit, name in TCP_FLAG_NAMES if value & bit)
+    for value in range(64)
+)
+
+def tcp_flags_to_str(flags: int) -> str:
+    """Render TCP flag bits the same way the scapy callback does (e.g. 'SYN,ACK')."""
+    return _TCP_FLAGS[flags & 0x3F]
+
+def _ipv4_to_str(address: bytes) -> str:
+    return '%d.%d.%d.%d' % (address[0], address[1], address[2], address[3])
+
+def _ipv6_to_str(address: bytes) -> str:
+    return socket.inet_ntop(socket.AF_INET6, address)
+
+def _network_offset(frame: memoryview, linktype: int):
+    """Return (ethertype, offset of the network header) for a link-layer frame."""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14:
+            return None, 0
+        ethertype = _unpack_ethertype(frame, 12)[0]
+        offset = 14
+        # Skip any number of stacked 802.1Q / 802.1ad tags
+        while ethertype in (ETH_P_8021Q, ETH_P_8021AD, ETH_P_QINQ):
+            if len(frame) < offset + 4:
+                return None, 0
+            ethertype = _unpack_ethertype(frame, offset + 2)[0]
+            offset += 4
+        return ethertype, offset
+
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(frame) < 16:
+            return None, 0
+        return _unpack_ethertype(frame, 14)[0], 16
+
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if len(frame) < 20:
+            return None, 0
+        return _unpack_ethertype(frame, 0)[0], 20
+
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        # 4-byte address family, IP version tells us the rest
+        offset = 4
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        offset = 0
+    else:
+        return None, 0
+
+    if len(frame) <= offset:
+        return None, 0
+    version = frame[offset] >> 4
+    if version == 4:
+        return ETH_P_IP, offset
+    if version == 6:
+        return ETH_P_IPV6, offset
+    return None, 0
+
+def parse_headers(frame: bytes, linktype: int = LINKTYPE_ETHERNET) -> Optional[Tuple]:
+    """Parse the headers of a raw frame into a plain tuple.
+
+    Returns ``(version, source, destination, ttl, protocol, source_port,
+    destination_port, tcp_flags, payload_offset)`` with packed address bytes
+    and the IP protocol number (0 when the transport header was not parsed),
+    or None for non-IP and truncated frames. Ports and flags are None when
+    they do not apply.
+    """
+    view = memoryview(frame)
+    ethertype, offset = _network_offset(view, linktype)
+
+    if ethertype == ETH_P_IP:
+        if len(view) < offset + 20:
+            return None
+        (version_ihl, _tos, _total_length, _ident, fragment,
+         ttl, proto, _checksum, src, dst) = _unpack_ipv4(view, offset)
+        if version_ihl >> 4 != 4:
+            return None
+        version = 4
+        offset += (version_ihl & 0x0F) * 4
+        # Only the first fragment carries the transport header
+        if fragment & 0x1FFF:
+            proto = None
+
+    elif ethertype == ETH_P_IPV6:
+        if len(view) < offset + 40:
+            return None
+        _vtc_flow, _payload_length, proto, ttl, src, dst = _unpack_ipv6(view, offset)
+        version = 6
+        offset += 40
+        while proto in IPV6_EXTENSION_HEADERS and len(view) >= offset + 8:
+            next_header, ext_length = view[offset], view[offset + 1]
+            if proto == 51:  # AH counts in 4-byte units
+                offset += (ext_length + 2) * 4
+            else:
+                offset += (ext_length + 1) * 8
+            proto = next_header
+        if proto == 44:  # Fragment header
+            if len(view) < offset + 8:
+                return None
+            fragment_offset = _unpack_ethertype(view, offset + 2)[0] >> 3
+            proto = view[offset] if fragment_offset == 0 else None
+            offset += 8
+
+    else:
+        return None
+
+    sport = dport = flags = None
+    if proto == IPPROTO_TCP and len(view) >= offset + 14:
+        sport, dport = _unpack_ports(view, offset)
+        flags = view[offset + 13] & 0x3F
+    elif proto == IPPROTO_UDP and len(view) >= offset + 8:
+        sport, dport = _unpack_ports(view, offset)
+    elif proto not in (IPPROTO_ICMP, IPPROTO_ICMPV6):
+        proto = 0
+    return version, bytes(src), bytes(dst), ttl, proto or 0, sport, dport, flags, offset
+
+def application_for(protocol: int, source_port: Optional[int], destination_port: Optional[int]) -> Optional[str]:
+    """Guess the application protocol from well-known ports."""
+    if protocol == IPPROTO_TCP:
+        return TCP_APPLICATIONS.get(destination_port) or TCP_APPLICATIONS.get(source_port)
+    if protocol == IPPROTO_UDP:
+        return UDP_APPLICATIONS.get(destination_port) or UDP_APPLICATIONS.get(source_port)
+    return None
+
+def parse_frame(frame: bytes, linktype: int = LINKTYPE_ETHERNET) -> Optional[Dict[str, Any]]:
+    """Parse the headers of a raw frame without building scapy objects.
+
+    Returns a dict with the packet_info header fields (``source_ip``,
+    ``destination_ip``, ``protocol``, ``protocol_version``, ``ttl``,
+    ``flags``, ports and ``application_protocol``) plus ``payload_offset``,
+    the offset of the transport header, or None for non-IP and truncated
+    frames.
+    """
+    headers = parse_headers(frame, linktype)
+    if headers is None:
+        return None
+    version, src, dst, ttl, proto, sport, dport, flags, offset = headers
+
+    info = {
+        'source_ip': _ipv4_to_str(src) if version == 4 else _ipv6_to_str(src),
+        'destination_ip': _ipv4_to_str(dst) if version == 4 else _ipv6_to_str(dst),
+        'protocol_version': PROTOCOL_VERSIONS[version],
+        'ttl': ttl,
+        'protocol': PROTOCOL_NAMES.get(proto, 'Unknown'),
+        'flags': _TCP_FLAGS[flags] if flags is not None else None,
+        'payload_offset': offset,
+    }
+    if sport is not None:
+        info['source_port'] = sport
+        info['destination_port'] = dport
+        application = application_for(proto, sport, dport)
+        if application:
+            info['application_protocol'] = application
+    return info
+
+def summarize(info: Dict[str, Any]) -> str:
+    """Build a short one-line summary from parsed header fields."""
+    protocol = info.get('protocol')
+    if 'source_port' in info:
+        summary = (f"{info['protocol_version']} / {protocol} "
+                   f"{info['source_ip']}:{info['source_port']} > "
+                   f"{info['destination_ip']}:{info['destination_port']}")
+        if info.get('flags'):
+            summary += f" {info['flags']}"
+        return summary
+    return f"{info['protocol_version']} / {protocol} {info['source_ip']} > {info['destination_ip']}"
+
+def dissect_frame(frame: bytes, linktype: int = LINKTYPE_ETHERNET):
+    """Fully dissect a frame with scapy. Only call this on demand."""
+    from scapy.all import conf, Raw
+
+    layer = conf.l2types.get(linktype)
+    if layer is None:
+        return Raw(frame)
+    return layer(frame)
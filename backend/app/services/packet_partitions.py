@@ -0,0 +1,223 @@
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, insert, select, text
+from sqlalchemy.orm import aliased
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from ..models.database import PacketRecord, MaliciousPacketRecord
+
+logger = logging.getLogger(__name__)
+
+# Days a packet is kept unless it never expires (marked malicious)
+RETENTION_DAYS = 7
+
+# Partitions are named after their day: packets_20250131
+PARTITION_NAME = re.compile(r'^packets_(\d{8})$')
+
+class PacketPartitions:
+    """Daily partitions of the packets table.
+
+    On PostgreSQL ``packets`` is declared ``PARTITION BY RANGE (timestamp)``
+    with one partition per day, and the planner skips the days a time
+    filter rules out. SQLite has no partitioning, so each day is a table of
+    its own with the packets columns and indexes, and reads visit only the
+    days their time range covers. Ids stay unique across days: PostgreSQL
+    partitions share the parent's sequence, and before every insert a SQLite
+    day table's AUTOINCREMENT is moved up to the highest id handed out so
+    far, since late packets still land in older days.
+
+    Retention drops whole days once every packet in them has expired,
+    after copying the packets that never expire (``expire_at IS NULL``) to
+    ``malicious_packets``. Days are dropped oldest first, so the archive is
+    always older than the partitions left and reads take it last.
+
+    A PostgreSQL ``packets`` table created before partitioning, and other
+    databases, stay a single table whose expired rows are deleted.
+    """
+
+    def __init__(self, retention_days: int = RETENTION_DAYS):
+        self.retention_days = retention_days
+        # 'native' (PostgreSQL partitions), 'tables' (SQLite day tables) or 'single'
+        self.mode: Optional[str] = None
+        # Days this process knows have a partition
+        self.days: Set[date] = set()
+        self.tables: Dict[date, Table] = {}
+        self.entities: Dict[str, Any] = {}
+
+    @staticmethod
+    def name(day: date) -> str:
+        return f"packets_{day:%Y%m%d}"
+
+    async def prepare(self, session) -> str:
+        """Work out how this database stores packets, once per process."""
+        if self.mode is None:
+            dialect = session.bind.dialect.name
+            if dialect == 'sqlite':
+                self.mode = 'tables'
+            elif dialect == 'postgresql':
+                result = await session.execute(text(
+                    "SELECT count(*) FROM pg_partitioned_table p "
+                    "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'packets'"
+                ))
+                self.mode = 'native' if result.scalar_one() else 'single'
+                if self.mode == 'single':
+                    logger.warning("The packets table is not partitioned; expired packets are deleted row by row")
+            else:
+                self.mode = 'single'
+        return self.mode
+
+    def table(self, day: date) -> Table:
+        """Table object for one day's partition, with the packets columns and indexes."""
+        table = self.tables.get(day)
+        if table is None:
+            name = self.name(day)
+            packets = PacketRecord.__table__
+            # On SQLite the id alone is the key, so it can be the AUTOINCREMENT rowid
+            table = Table(
+                name, MetaData(),
+                *[Column(column.name, column.type, primary_key=column.name == 'id',
+                         nullable=column.nullable, default=column.default)
+                  for column in packets.columns],
+                sqlite_autoincrement=True
+            )
+            for index in packets.indexes:
+                Index(index.name.replace('packets', name, 1), *[table.c[column.name] for column in index.columns])
+            self.tables[day] = table
+        return table
+
+    def entity(self, table: Table) -> Any:
+        """ORM entity that loads ``PacketRecord`` objects from ``table``."""
+        if table is PacketRecord.__table__:
+            return PacketRecord
+        entity = self.entities.get(table.name)
+        if entity is None:
+            entity = self.entities[table.name] = aliased(PacketRecord, table, adapt_on_names=True)
+        return entity
+
+    async def existing_days(self, session) -> List[date]:
+        """Days that have a partition, newest first."""
+        if self.mode == 'tables':
+            query = text("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'packets_%'")
+        else:
+            query = text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'packets'"
+            )
+        result = await session.execute(query)
+        matches = [PARTITION_NAME.match(name) for name in result.scalars()]
+        return sorted((datetime.strptime(match.group(1), '%Y%m%d').date() for match in matches if match),
+                      reverse=True)
+
+    async def table_for(self, session, day: date) -> Table:
+        """Table to insert ``day``'s packets into, creating its partition if needed."""
+        mode = await self.prepare(session)
+        if mode == 'single':
+            return PacketRecord.__table__
+        if day not in self.days:
+            await self._create(session, day)
+            self.days.add(day)
+        if mode == 'native':
+            return PacketRecord.__table__
+        # Writers are serialized, so nothing else hands out ids between this and the insert
+        await session.execute(text(
+            "UPDATE sqlite_sequence SET seq = max("
+            "(SELECT max(seq) FROM sqlite_sequence WHERE name LIKE 'packets_%'), "
+            "coalesce((SELECT max(id) FROM malicious_packets), 0), "
+            "coalesce((SELECT max(id) FROM packets), 0)) "
+            "WHERE name = :name"
+        ), {'name': self.name(day)})
+        return self.table(day)
+
+    async def _create(self, session, day: date) -> None:
+        name = self.name(day)
+        if self.mode == 'native':
+            await session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF packets "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            ))
+            return
+        table = self.table(day)
+        await session.execute(CreateTable(table, if_not_exists=True))
+        for index in table.indexes:
+            await session.execute(CreateIndex(index, if_not_exists=True))
+        await session.execute(text(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT :name, 0 "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+        ), {'name': name})
+
+    async def sources(self, session, start: Optional[datetime] = None,
+                      end: Optional[datetime] = None) -> List[Table]:
+        """Tables holding packets between ``start`` and ``end``, newest first.
+
+        Their time ranges do not overlap, so reading them in order returns
+        packets newest first.
+        """
+        mode = await self.prepare(session)
+        if mode == 'single':
+            return [PacketRecord.__table__]
+        if mode == 'native':
+            return [PacketRecord.__table__, MaliciousPacketRecord.__table__]
+        days = [day for day in await self.existing_days(session)
+                if (start is None or day >= start.date()) and (end is None or day <= end.date())]
+        return [self.table(day) for day in days] + [MaliciousPacketRecord.__table__]
+
+    async def drop_expired(self, session, now: Optional[datetime] = None) -> int:
+        """Drop the partitions whose packets have all expired; returns the packets removed.
+
+        Packets that never expire are moved to the archive first. Each day
+        is dropped in its own transaction.
+        """
+        if await self.prepare(session) == 'single':
+            return 0
+        # Packet timestamps are local time; a day is done once its last packet has expired
+        cutoff = ((now or datetime.now()) - timedelta(days=self.retention_days)).date()
+        archive = MaliciousPacketRecord.__table__
+        names = [column.name for column in archive.columns]
+        removed = 0
+        for day in sorted(day for day in await self.existing_days(session) if day < cutoff):
+            table = self.table(day)
+            result = await session.execute(
+                insert(archive).from_select(
+                    names, select(*[table.c[name] for name in names]).where(table.c.expire_at.is_(None))
+                )
+            )
+            kept = max(result.rowcount, 0)
+            result = await session.execute(select(func.count()).select_from(table))
+            removed += result.scalar_one() - kept
+            await session.execute(text(f"DROP TABLE {table.name}"))
+            await session.commit()
+            self.days.discard(day)
+            logger.info(f"Dropped packet partition {table.name} ({kept} packets archived)")
+        return removed
+
+    async def migrate(self, session) -> int:
+        """Move packets stored in the single SQLite table into day tables; returns the packets moved."""
+        if await self.prepare(session) != 'tables':
+            return 0
+        packets = PacketRecord.__table__
+        result = await session.execute(select(func.date(packets.c.timestamp)).distinct())
+        days = [date.fromisoformat(day) for day in result.scalars() if day]
+        if not days:
+            return 0
+        names = [column.name for column in packets.columns]
+        moved = 0
+        for day in sorted(days):
+            start = datetime.combine(day, datetime.min.time())
+            table = await self.table_for(session, day)
+            result = await session.execute(
+                insert(table).from_select(
+                    names,
+                    select(*[packets.c[name] for name in names])
+                    .where(packets.c.timestamp >= start, packets.c.timestamp < start + timedelta(days=1))
+                )
+            )
+            moved += max(result.rowcount, 0)
+        await session.execute(delete(packets).where(packets.c.timestamp.isnot(None)))
+        await session.commit()
+        logger.info(f"Moved {moved} packets into {len(days)} day tables")
+        return moved
+
+packet_partitions = PacketPartitions()
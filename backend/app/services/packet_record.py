@@ -0,0 +1,134 @@
+import socket
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from .packet_parser import PROTOCOL_NAMES, PROTOCOL_VERSIONS, application_for, tcp_flags_to_str
+
+# Bytes of payload kept per packet for the hex excerpt
+PAYLOAD_EXCERPT_BYTES = 100
+
+def int_to_ip(address: int, version: int) -> str:
+    """Format an integer address as a dotted (IPv4) or colon (IPv6) string."""
+    if version == 4:
+        return socket.inet_ntoa(address.to_bytes(4, 'big'))
+    return socket.inet_ntop(socket.AF_INET6, address.to_bytes(16, 'big'))
+
+class CapturedPacket:
+    """Compact in-memory record of one captured packet.
+
+    Addresses and ports are ints, the capture time is epoch nanoseconds,
+    the protocol is its IP protocol number and TCP flags stay a bit mask.
+    Strings (addresses, ISO timestamp, summary, hex payload) are only built
+    when a property or ``to_dict`` asks for them, so the capture path
+    allocates one small object per packet instead of a ~20-key dict.
+    """
+
+    __slots__ = (
+        'id', 'timestamp_ns', 'version', 'src', 'dst', 'source_port',
+        'destination_port', 'proto', 'tcp_flags', 'ttl', 'length', 'payload',
+        'raw_packet', 'source_device_name', 'destination_device_name',
+        'is_malicious', 'threat_category', 'connection_id',
+    )
+
+    def __init__(self, id: int, timestamp_ns: int, version: int, src: int, dst: int,
+                 proto: int, ttl: int, length: int,
+                 source_port: Optional[int] = None, destination_port: Optional[int] = None,
+                 tcp_flags: Optional[int] = None, payload: Optional[bytes] = None,
+                 raw_packet: Optional[bytes] = None):
+        self.id = id
+        self.timestamp_ns = timestamp_ns
+        self.version = version
+        self.src = src
+        self.dst = dst
+        self.source_port = source_port
+        self.destination_port = destination_port
+        self.proto = proto
+        self.tcp_flags = tcp_flags
+        self.ttl = ttl
+        self.length = length
+        self.payload = payload
+        self.raw_packet = raw_packet
+        self.source_device_name: Optional[str] = None
+        self.destination_device_name: Optional[str] = None
+        self.is_malicious = False
+        self.threat_category: Optional[str] = None
+        self.connection_id: Optional[str] = None  # The flow's connection_id, once linked
+
+    @property
+    def source_ip(self) -> str:
+        return int_to_ip(self.src, self.version)
+
+    @property
+    def destination_ip(self) -> str:
+        return int_to_ip(self.dst, self.version)
+
+    @property
+    def protocol(self) -> str:
+        return PROTOCOL_NAMES.get(self.proto, 'Unknown')
+
+    @property
+    def protocol_version(self) -> str:
+        return PROTOCOL_VERSIONS[self.version]
+
+    @property
+    def flags(self) -> Optional[str]:
+        return tcp_flags_to_str(self.tcp_flags) if self.tcp_flags is not None else None
+
+    @property
+    def application_protocol(self) -> Optional[str]:
+        return application_for(self.proto, self.source_port, self.destination_port)
+
+    @property
+    def datetime(self) -> datetime:
+        """Capture time as a naive local datetime, like the stored rows."""
+        return datetime.fromtimestamp(self.timestamp_ns / 1e9)
+
+    @property
+    def payload_excerpt(self) -> Optional[str]:
+        return self.payload.hex() if self.payload else None
+
+    @property
+    def packet_summary(self) -> str:
+        if self.source_port is not None:
+            summary = (f"{self.protocol_version} / {self.protocol} "
+                       f"{self.source_ip}:{self.source_port} > "
+                       f"{self.destination_ip}:{self.destination_port}")
+            flags = self.flags
+            return f"{summary} {flags}" if flags else summary
+        return f"{self.protocol_version} / {self.protocol} {self.source_ip} > {self.destination_ip}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Build the packet_info dict served by the API."""
+        info = {
+            'id': self.id,
+            'timestamp': self.datetime.isoformat(),
+            'length': self.length,
+            'raw_packet': self.raw_packet,
+            'source_ip': self.source_ip,
+            'destination_ip': self.destination_ip,
+            'protocol_version': self.protocol_version,
+            'ttl': self.ttl,
+            'protocol': self.protocol,
+            'flags': self.flags,
+            'packet_summary': self.packet_summary,
+            'source_device_name': self.source_device_name,
+            'destination_device_name': self.destination_device_name,
+        }
+        if self.source_port is not None:
+            info['source_port'] = self.source_port
+            info['destination_port'] = self.destination_port
+            application = self.application_protocol
+            if application:
+                info['application_protocol'] = application
+        if self.payload:
+            info['payload_excerpt'] = self.payload.hex()
+        return info
+
+    def to_row(self) -> Dict[str, Any]:
+        """Build the dict handed to ``DatabaseService.save_packets``."""
+        row = self.to_dict()
+        row['timestamp'] = self.datetime
+        row['is_malicious'] = self.is_malicious
+        row['threat_category'] = self.threat_category
+        row['connection_id'] = self.connection_id
+        return row
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from ..core.cache import LRUCache
+from ..db.session import AsyncSessionLocal
+from .packet_record import CapturedPacket
+
+logger = logging.getLogger(__name__)
+
+class PacketWriter:
+    """Single long-lived writer that persists captured packets in batches.
+
+    The capture thread hands packets over through a bounded queue with
+    ``submit``; one writer thread owns an event loop for its whole lifetime
+    and flushes multi-row inserts whenever ``batch_size`` rows are waiting
+    or ``flush_interval`` seconds have passed. The batch size adapts to the
+    observed commit latency (additive increase, multiplicative decrease).
+
+    Device names that resolve after their packets were queued are handed in
+    with ``submit_backfill``: rows still waiting in the queue are patched
+    before insert and rows already written are updated in place.
+
+    When a ``connection_source`` is given (the flow table's ``collect``),
+    the same thread pulls aggregated flow rows from it every
+    ``connection_interval`` seconds and upserts them into ``connections``.
+    """
+
+    def __init__(self,
+                 max_queue_size: int = 50000,
+                 max_batch_size: int = 5000,
+                 min_batch_size: int = 100,
+                 flush_interval: float = 0.2,
+                 target_flush_latency: float = 0.1,
+                 connection_source: Optional[Callable[[], List[Dict[str, Any]]]] = None,
+                 connection_interval: float = 5.0,
+                 session_factory=AsyncSessionLocal):
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self.max_batch_size = max_batch_size
+        self.min_batch_size = min_batch_size
+        self.batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.target_flush_latency = target_flush_latency
+        self.connection_source = connection_source
+        self.connection_interval = connection_interval
+        self.session_factory = session_factory
+
+        self.writer_thread: Optional[threading.Thread] = None
+        self.should_stop = threading.Event()
+        # ip -> hostname waiting to be applied to stored rows
+        self.pending_names: Dict[str, str] = {}
+        self._names_lock = threading.Lock()
+        # Names applied recently, used to patch rows that were still queued at the time
+        self.recent_names = LRUCache(maxsize=4096, default_ttl=60)
+        self.stats = {
+            'submitted': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'flushes': 0,
+            'last_flush_rows': 0,
+            'last_flush_latency': 0.0,
+            'avg_flush_latency': 0.0,
+            'max_flush_latency': 0.0,
+            'backfilled_names': 0,
+            'backfilled_rows': 0,
+            'connection_flushes': 0,
+            'connections_written': 0,
+            'connections_failed': 0,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self.writer_thread is not None and self.writer_thread.is_alive()
+
+    def start(self) -> None:
+        """Start the writer thread if it is not already running."""
+        if self.is_running:
+            return
+        self.should_stop.clear()
+        self.writer_thread = threading.Thread(
+            target=self._run,
+            name="packet-writer",
+            daemon=True
+        )
+        self.writer_thread.start()
+        logger.info(f"Started packet writer (batch size {self.batch_size}, flush interval {self.flush_interval}s)")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the writer thread after draining what is already queued."""
+        if not self.is_running:
+            return
+        self.should_stop.set()
+        self.writer_thread.join(timeout=timeout)
+        if self.writer_thread.is_alive():
+            logger.warning(f"Packet writer did not drain in {timeout}s, {self.queue.qsize()} packets left in queue")
+        self.writer_thread = None
+        logger.info("Stopped packet writer")
+
+    def submit(self, packet_info: Any) -> bool:
+        """Queue a packet (a CapturedPacket or a packet_info dict) without blocking the caller.
+
+        Returns False (and counts a drop) when the queue is full.
+        """
+        try:
+            self.queue.put_nowait(packet_info)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['submitted'] += 1
+        return True
+
+    def submit_backfill(self, ip_address: str, hostname: str) -> None:
+        """Record a late-resolved device name to write into rows stored without one."""
+        with self._names_lock:
+            self.pending_names[ip_address] = hostname
+
+    @property
+    def load(self) -> float:
+        """Fraction of the queue in use."""
+        return self.queue.qsize() / self.queue.maxsize
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get writer statistics: queue depth, flush latency and drop counts."""
+        return {
+            **self.stats,
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'batch_size': self.batch_size,
+            'is_running': self.is_running,
+        }
+
+    def _run(self) -> None:
+        """Writer thread: collect batches and flush them on one event loop."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        next_connections = time.monotonic() + self.connection_interval
+        try:
+            while not self.should_stop.is_set() or not self.queue.empty() or self.pending_names:
+                if self.connection_source and time.monotonic() >= next_connections:
+                    next_connections = time.monotonic() + self.connection_interval
+                    loop.run_until_complete(self._flush_connections(self.connection_source()))
+                batch = self._collect_batch()
+                with self._names_lock:
+                    names, self.pending_names = self.pending_names, {}
+                for ip_address, hostname in names.items():
+                    self.recent_names.set(ip_address, hostname)
+                if batch:
+                    loop.run_until_complete(self._flush(batch))
+                if names:
+                    loop.run_until_complete(self._backfill(names))
+            if self.connection_source:
+                # Flows touched since the last pass
+                loop.run_until_complete(self._flush_connections(self.connection_source()))
+        finally:
+            loop.close()
+
+    def _collect_batch(self) -> List[Any]:
+        """Wait for the first packet, then gather until the batch is full or the interval expires."""
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    async def _flush(self, batch: List[Any]) -> None:
+        """Write one batch as a multi-row insert and adapt the batch size."""
+        from ..services.database import DatabaseService
+
+        # Compact records are only turned into row dicts here, off the capture path
+        batch = [item.to_row() if isinstance(item, CapturedPacket) else item for item in batch]
+        for packet_info in batch:
+            # Parse timestamp if it's a string
+            if isinstance(packet_info.get('timestamp'), str):
+                try:
+                    packet_info['timestamp'] = datetime.fromisoformat(packet_info['timestamp'])
+                except ValueError:
+                    packet_info['timestamp'] = datetime.utcnow()
+            if len(self.recent_names):
+                for field, ip_field in (('source_device_name', 'source_ip'),
+                                        ('destination_device_name', 'destination_ip')):
+                    if not packet_info.get(field):
+                        packet_info[field] = self.recent_names.get(packet_info.get(ip_field))
+
+        started = time.perf_counter()
+        try:
+            async with self.session_factory() as session:
+                db_service = DatabaseService(session)
+                written = await db_service.save_packets(batch)
+        except Exception as e:
+            self.stats['failed'] += len(batch)
+            logger.error(f"Error saving {len(batch)} packets to database: {e}")
+            return
+        latency = time.perf_counter() - started
+
+        self.stats['written'] += written
+        self.stats['flushes'] += 1
+        self.stats['last_flush_rows'] = written
+        self.stats['last_flush_latency'] = latency
+        self.stats['max_flush_latency'] = max(self.stats['max_flush_latency'], latency)
+        # Exponential moving average keeps the figure stable under bursts
+        self.stats['avg_flush_latency'] += 0.2 * (latency - self.stats['avg_flush_latency'])
+        self._adapt_batch_size(len(batch), latency)
+
+    async def _backfill(self, names: Dict[str, str]) -> None:
+        """Write late-resolved device names into rows that were stored without them."""
+        from ..services.database import DatabaseService
+
+        try:
+            async with self.session_factory() as session:
+                updated = await DatabaseService(session).backfill_device_names(names)
+        except Exception as e:
+            logger.error(f"Error backfilling {len(names)} device names: {e}")
+            return
+        self.stats['backfilled_names'] += len(names)
+        self.stats['backfilled_rows'] += updated
+
+    async def _flush_connections(self, rows: List[Dict[str, Any]]) -> None:
+        """Upsert aggregated flow rows into the connections table."""
+        from ..services.database import DatabaseService
+
+        if not rows:
+            return
+        try:
+            async with self.session_factory() as session:
+                written = await DatabaseService(session).upsert_connections(rows)
+        except Exception as e:
+            self.stats['connections_failed'] += len(rows)
+            logger.error(f"Error saving {len(rows)} connections to database: {e}")
+            return
+        self.stats['connection_flushes'] += 1
+        self.stats['connections_written'] += written
+
+    def _adapt_batch_size(self, rows: int, latency: float) -> None:
+        """Halve the batch when commits are slow, grow it when full batches commit quickly."""
+        if latency > self.target_flush_latency:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        elif rows >= self.batch_size and latency < self.target_flush_latency / 2:
+            self.batch_size = min(self.max_batch_size, self.batch_size + self.min_batch_size)
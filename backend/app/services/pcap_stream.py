@@ -0,0 +1,236 @@
+import logging
+import os
+import select
+import stat
+import struct
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+# Both byte orders, used to spot a new file header in the middle of a stream
+PCAP_MAGICS = {PCAP_MAGIC_US, PCAP_MAGIC_NS, 0xD4C3B2A1, 0x4D3CB2A1}
+PCAPNG_SECTION_HEADER = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+PCAPNG_INTERFACE_DESCRIPTION = 0x00000001
+PCAPNG_SIMPLE_PACKET = 0x00000003
+PCAPNG_ENHANCED_PACKET = 0x00000006
+PCAPNG_OPTION_IF_TSRESOL = 9
+
+PCAP_GLOBAL_HEADER_SIZE = 24
+PCAP_RECORD_HEADER_SIZE = 16
+
+# (timestamp, linktype, frame)
+Frame = Tuple[float, int, bytes]
+
+class PcapStreamReader:
+    """Incremental pcap/pcapng reader for capture files and named pipes.
+
+    The file descriptor stays open for the whole capture and data is read in
+    large chunks. Records that are split across two reads stay in the buffer
+    until the rest arrives, so nothing is lost at chunk boundaries. When the
+    writer of a named pipe goes away (e.g. tcpdump restarts) the pipe is
+    reopened and a fresh file header is expected.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 1 << 20, batch_size: int = 1024):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+
+        self.fd: Optional[int] = None
+        self.is_pipe = False
+        self.buffer = bytearray()
+        self.offset = 0
+        self._reset_format()
+        self.stats = {
+            'bytes_read': 0,
+            'packets_read': 0,
+            'reopens': 0,
+            'restarts': 0,
+        }
+
+    def _reset_format(self) -> None:
+        self.format: Optional[str] = None
+        self.endian = '<'
+        self.linktype = 1
+        self.ts_divisor = 1e6
+        # pcapng: (linktype, timestamp divisor) per interface id
+        self.interfaces: List[Tuple[int, float]] = []
+
+    def open(self) -> None:
+        """Open the capture file without waiting for a pipe writer to connect."""
+        # Non-blocking so read_batch keeps honouring its timeout while the pipe has no writer
+        self.fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        self.is_pipe = stat.S_ISFIFO(os.fstat(self.fd).st_mode)
+        self.buffer.clear()
+        self.offset = 0
+        self._reset_format()
+        logger.info(f"Opened {'named pipe' if self.is_pipe else 'capture file'} {self.path}")
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_batch(self, timeout: float = 0.5) -> List[Frame]:
+        """Return the next batch of complete records, waiting up to ``timeout`` for new data.
+
+        An empty list means no complete record arrived in time.
+        """
+        frames = self._parse(self.batch_size)
+        if frames:
+            return frames
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return frames
+
+        try:
+            chunk = os.read(self.fd, self.chunk_size)
+        except BlockingIOError:
+            return frames
+        if not chunk:
+            if self.is_pipe:
+                # Writer closed the pipe; wait for the next one and start over
+                self.close()
+                self.stats['reopens'] += 1
+                self.open()
+            else:
+                # Regular file at EOF: give the writer a moment to append more
+                time.sleep(timeout)
+            return frames
+
+        self.stats['bytes_read'] += len(chunk)
+        if self.offset:
+            # Drop consumed bytes, keeping any partial record at the end
+            del self.buffer[:self.offset]
+            self.offset = 0
+        self.buffer += chunk
+        return self._parse(self.batch_size)
+
+    def _parse(self, limit: int) -> List[Frame]:
+        """Parse up to ``limit`` complete records out of the buffer."""
+        frames = []
+        while len(frames) < limit:
+            if self.format is None and not self._parse_file_header():
+                break
+            if self.format == 'pcap':
+                frames += self._parse_pcap(limit - len(frames))
+            else:
+                frames += self._parse_pcapng(limit - len(frames))
+            # A restarted writer may start a new file header mid-stream
+            if self.format is not None:
+                break
+        self.stats['packets_read'] += len(frames)
+        return frames
+
+    def _parse_file_header(self) -> bool:
+        if len(self.buffer) - self.offset < 4:
+            return False
+        magic_le = struct.unpack_from('<I', self.buffer, self.offset)[0]
+        magic_be = struct.unpack_from('>I', self.buffer, self.offset)[0]
+
+        if PCAPNG_SECTION_HEADER in (magic_le, magic_be):
+            # The section header block is parsed like any other block
+            self.format = 'pcapng'
+            return True
+
+        for endian, magic in (('<', magic_le), ('>', magic_be)):
+            if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                if len(self.buffer) - self.offset < PCAP_GLOBAL_HEADER_SIZE:
+                    return False
+                self.endian = endian
+                self.ts_divisor = 1e9 if magic == PCAP_MAGIC_NS else 1e6
+                self.linktype = struct.unpack_from(endian + 'I', self.buffer, self.offset + 20)[0] & 0x0FFFFFFF
+                self.offset += PCAP_GLOBAL_HEADER_SIZE
+                self.format = 'pcap'
+                return True
+
+        raise ValueError(f"{self.path} is not a pcap or pcapng stream (magic {magic_le:#010x})")
+
+    def _parse_pcap(self, limit: int) -> List[Frame]:
+        buffer = self.buffer
+        end = len(buffer)
+        offset = self.offset
+        record_header = struct.Struct(self.endian + 'IIII')
+        frames = []
+        while len(frames) < limit and end - offset >= PCAP_RECORD_HEADER_SIZE:
+            ts_sec, ts_frac, captured, _original = record_header.unpack_from(buffer, offset)
+            if ts_sec in PCAP_MAGICS:
+                # Writer restarted without us seeing EOF; read the new file header
+                self.format = None
+                self.stats['restarts'] += 1
+                break
+            record_end = offset + PCAP_RECORD_HEADER_SIZE + captured
+            if record_end > end:
+                break  # Partial record, wait for the rest
+            frames.append((ts_sec + ts_frac / self.ts_divisor, self.linktype,
+                           bytes(buffer[offset + PCAP_RECORD_HEADER_SIZE:record_end])))
+            offset = record_end
+        self.offset = offset
+        return frames
+
+    def _parse_pcapng(self, limit: int) -> List[Frame]:
+        buffer = self.buffer
+        end = len(buffer)
+        frames = []
+        while len(frames) < limit and end - self.offset >= 12:
+            offset = self.offset
+            block_type = struct.unpack_from(self.endian + 'I', buffer, offset)[0]
+
+            if block_type == PCAPNG_SECTION_HEADER:
+                # Byte order can change with every section
+                byte_order = struct.unpack_from('<I', buffer, offset + 8)[0]
+                self.endian = '<' if byte_order == PCAPNG_BYTE_ORDER_MAGIC else '>'
+                self.interfaces = []
+
+            block_length = struct.unpack_from(self.endian + 'I', buffer, offset + 4)[0]
+            if block_length < 12:
+                raise ValueError(f"Corrupt pcapng block in {self.path} (length {block_length})")
+            if end - offset < block_length:
+                break  # Partial block, wait for the rest
+            body = offset + 8
+
+            if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+                linktype = struct.unpack_from(self.endian + 'H', buffer, body)[0]
+                self.interfaces.append((linktype, self._interface_ts_divisor(body + 8, offset + block_length - 4)))
+            elif block_type == PCAPNG_ENHANCED_PACKET:
+                interface_id, ts_high, ts_low, captured, _original = struct.unpack_from(self.endian + 'IIIII', buffer, body)
+                linktype, divisor = self.interfaces[interface_id] if interface_id < len(self.interfaces) else (1, 1e6)
+                data = body + 20
+                frames.append((((ts_high << 32) | ts_low) / divisor, linktype, bytes(buffer[data:data + captured])))
+            elif block_type == PCAPNG_SIMPLE_PACKET:
+                original = struct.unpack_from(self.endian + 'I', buffer, body)[0]
+                linktype = self.interfaces[0][0] if self.interfaces else 1
+                captured = min(original, block_length - 16)
+                # Simple packet blocks carry no timestamp
+                frames.append((time.time(), linktype, bytes(buffer[body + 4:body + 4 + captured])))
+
+            self.offset = offset + block_length
+        return frames
+
+    def _interface_ts_divisor(self, options: int, options_end: int) -> float:
+        """Read if_tsresol from interface description options (default microseconds)."""
+        buffer = self.buffer
+        while options + 4 <= options_end:
+            code, length = struct.unpack_from(self.endian + 'HH', buffer, options)
+            if code == 0:
+                break
+            if code == PCAPNG_OPTION_IF_TSRESOL and length >= 1:
+                resolution = buffer[options + 4]
+                if resolution & 0x80:
+                    return float(2 ** (resolution & 0x7F))
+                return float(10 ** resolution)
+            options += 4 + ((length + 3) & ~3)
+        return 1e6
@@ -0,0 +1,66 @@
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from ..db.session import AsyncSessionLocal
+from ..models.database import TrafficStatsRecord, TrafficStatsHourlyRecord
+from .traffic_stats import TrafficStatsAggregator
+
+logger = logging.getLogger(__name__)
+
+# Rollup table for each persisted resolution
+ROLLUP_TABLES = ((60, TrafficStatsRecord), (3600, TrafficStatsHourlyRecord))
+
+class TrafficRollup:
+    """Background job that persists minute and hour traffic aggregates.
+
+    The job scheduler runs it every ``interval`` seconds. Each pass reads
+    the buckets the live statistics engine has filled since the previous
+    pass and upserts them into ``traffic_stats`` (minutes) and
+    ``traffic_stats_hourly`` (hours). The
+    bucket in progress is written too and rewritten on each pass until it
+    closes, so the tables are never more than one pass behind.
+    """
+
+    def __init__(self,
+                 source: Callable[[], TrafficStatsAggregator],
+                 interval: float = 30.0,
+                 session_factory=AsyncSessionLocal):
+        self.source = source
+        self.interval = interval
+        self.session_factory = session_factory
+
+        # Last completed bucket written, per resolution
+        self.cursors: Dict[int, Optional[int]] = {resolution: None for resolution, _model in ROLLUP_TABLES}
+        self.stats = {
+            'passes': 0,
+            'rows_written': 0,
+            'failed': 0,
+        }
+
+    async def run_once(self) -> int:
+        """Write the buckets filled since the last pass and return the number of rows."""
+        from ..services.database import DatabaseService
+
+        aggregator = self.source()
+        written = 0
+        for resolution, model in ROLLUP_TABLES:
+            rows, cursor = aggregator.rollup_rows(resolution, self.cursors[resolution])
+            if not rows:
+                continue
+            try:
+                async with self.session_factory() as session:
+                    written += await DatabaseService(session).upsert_traffic_rollups(model, rows)
+            except Exception as e:
+                self.stats['failed'] += len(rows)
+                logger.error(f"Error writing {len(rows)} {model.__tablename__} rows: {e}")
+                continue
+            self.cursors[resolution] = cursor
+        self.stats['passes'] += 1
+        self.stats['rows_written'] += written
+        return written
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'interval': self.interval,
+        }
@@ -0,0 +1,404 @@
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .packet_parser import (
+    IPPROTO_TCP, IPPROTO_UDP, PROTOCOL_NAMES, TCP_APPLICATIONS, UDP_APPLICATIONS
+)
+
+# (seconds per bucket, buckets kept): one hour of seconds, a day of minutes, 30 days of hours
+RESOLUTIONS = ((1, 3600), (60, 1440), (3600, 720))
+
+# Window the top protocol and application lists of ``current`` are summed over
+WINDOW_SECONDS = 60
+
+PROTOCOL_COLUMNS = tuple(sorted(set(PROTOCOL_NAMES.values()))) + ('Other',)
+APPLICATION_COLUMNS = tuple(sorted(set(TCP_APPLICATIONS.values()) | set(UDP_APPLICATIONS.values()))) + ('Other',)
+
+# Scalar counters per bucket
+PACKETS, BYTES, NEW_CONNECTIONS = range(3)
+
+def interval_seconds(interval: str) -> int:
+    """Parse an interval such as '30s', '5m' or '1h' into seconds."""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if interval and interval[-1] in units:
+        seconds = int(interval[:-1]) * units[interval[-1]]
+    else:
+        seconds = int(interval)
+    if seconds < 1:
+        raise ValueError(f"Interval must be at least one second: {interval}")
+    return seconds
+
+class StatsRing:
+    """Counters for one resolution in preallocated NumPy ring arrays.
+
+    Bucket ``b`` (epoch seconds // resolution) lives in row ``b % length``.
+    ``stamp`` records which bucket a row holds, so rows left over from an
+    earlier lap read as empty and are zeroed on first write.
+    """
+
+    def __init__(self, resolution: int, length: int):
+        self.resolution = resolution
+        self.length = length
+        self.stamp = np.full(length, -1, dtype=np.int64)
+        self.counters = np.zeros((length, 3), dtype=np.int64)
+        self.protocols = np.zeros((length, len(PROTOCOL_COLUMNS)), dtype=np.int64)
+        self.applications = np.zeros((length, len(APPLICATION_COLUMNS)), dtype=np.int64)
+        # Most concurrent flows seen in the bucket
+        self.active = np.zeros(length, dtype=np.int64)
+
+    def row(self, second: int) -> int:
+        """Return the row for the bucket holding ``second``, claiming it if stale."""
+        bucket = second // self.resolution
+        row = bucket % self.length
+        if self.stamp[row] != bucket:
+            self.stamp[row] = bucket
+            self.counters[row] = 0
+            self.protocols[row] = 0
+            self.applications[row] = 0
+            self.active[row] = 0
+        return row
+
+    def select(self, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return bucket numbers covering seconds [start, end) and their rows, empty rows masked out."""
+        first = max(start // self.resolution, (end - 1) // self.resolution - self.length + 1)
+        buckets = np.arange(first, (end - 1) // self.resolution + 1, dtype=np.int64)
+        rows = buckets % self.length
+        valid = self.stamp[rows] == buckets
+        return buckets[valid], rows[valid]
+
+class TrafficStatsAggregator:
+    """Streaming per-second traffic counters at 1s, 1m and 1h resolution.
+
+    The capture path calls ``add`` for every packet; it only increments
+    plain Python counters for the current second. When a packet (or a
+    reader) moves the clock past that second, the second is folded into
+    every ``StatsRing`` and the sliding window used by ``current`` is
+    refreshed, so ``current`` is a dictionary lookup and ``history`` reads
+    at most one ring's worth of rows whatever the time range.
+
+    The clock follows packet time, like the flow table, and keeps running
+    on wall time between packets so idle seconds still roll over.
+
+    Distinct hosts and connections do not add up across buckets, so for
+    spans of a minute or more they come from ``distinct_source``, which
+    returns the counts for a range of seconds (or None when it no longer
+    holds them).
+    """
+
+    def __init__(self,
+                 resolutions=RESOLUTIONS,
+                 active_source: Optional[Callable[[], int]] = None,
+                 distinct_source: Optional[Callable[[int, int], Optional[Dict[str, int]]]] = None):
+        self.rings = [StatsRing(resolution, length) for resolution, length in resolutions]
+        self.active_source = active_source
+        self.distinct_source = distinct_source
+        self.lock = threading.Lock()
+
+        self.protocol_index = {proto: PROTOCOL_COLUMNS.index(name) for proto, name in PROTOCOL_NAMES.items()}
+        self.tcp_applications = {port: APPLICATION_COLUMNS.index(name) for port, name in TCP_APPLICATIONS.items()}
+        self.udp_applications = {port: APPLICATION_COLUMNS.index(name) for port, name in UDP_APPLICATIONS.items()}
+        self._other_protocol = len(PROTOCOL_COLUMNS) - 1
+        self._other_application = len(APPLICATION_COLUMNS) - 1
+
+        # Current (incomplete) second
+        self.second = 0
+        self.packets = 0
+        self.bytes = 0
+        self.new_connections = 0
+        self.protocol_counts = [0] * len(PROTOCOL_COLUMNS)
+        self.application_counts = [0] * len(APPLICATION_COLUMNS)
+        self._clock_at = time.monotonic()
+        # Set once seconds arrive through ``merge``; the reporters then drive the clock
+        self.merged = False
+        self.first_second: Optional[int] = None
+
+        self.totals = {'packets': 0, 'bytes': 0, 'connections': 0}
+        self._current: Dict[str, Any] = self._snapshot(None)
+
+    def add(self, timestamp_ns: int, length: int, proto: int, sport: Optional[int],
+            dport: Optional[int], new_connection: bool = False) -> None:
+        """Count one packet."""
+        second = timestamp_ns // 1000000000
+        with self.lock:
+            if second > self.second:
+                self._roll(second)
+            # Late packets are counted in the current second
+            self.packets += 1
+            self.bytes += length
+            if new_connection:
+                self.new_connections += 1
+            self.protocol_counts[self.protocol_index.get(proto, self._other_protocol)] += 1
+            if proto == IPPROTO_TCP:
+                applications = self.tcp_applications
+            elif proto == IPPROTO_UDP:
+                applications = self.udp_applications
+            else:
+                self.application_counts[self._other_application] += 1
+                return
+            index = applications.get(dport)
+            if index is None:
+                index = applications.get(sport, self._other_application)
+            self.application_counts[index] += 1
+
+    def _roll(self, second: int) -> None:
+        """Fold the current second into the rings and start ``second``."""
+        if self.second:
+            active = self.active_source() if self.active_source else 0
+            self._add_second(self.second, (self.packets, self.bytes, self.new_connections),
+                             self.protocol_counts, self.application_counts, active)
+        else:
+            self.first_second = second
+        self.second = second
+        self._clock_at = time.monotonic()
+        self.packets = self.bytes = self.new_connections = 0
+        self.protocol_counts = [0] * len(PROTOCOL_COLUMNS)
+        self.application_counts = [0] * len(APPLICATION_COLUMNS)
+        self._current = self._snapshot(second - 1)
+
+    def _add_second(self, second: int, counters, protocols, applications, active: int) -> None:
+        seconds_ring = self.rings[0]
+        row = seconds_ring.row(second)
+        seconds_ring.counters[row] += counters
+        seconds_ring.protocols[row] += protocols
+        seconds_ring.applications[row] += applications
+        # Merged worker seconds add up; coarser buckets keep the busiest second
+        seconds_ring.active[row] += active
+        active = seconds_ring.active[row]
+        for ring in self.rings[1:]:
+            row = ring.row(second)
+            ring.counters[row] += counters
+            ring.protocols[row] += protocols
+            ring.applications[row] += applications
+            ring.active[row] = max(ring.active[row], active)
+        self.totals['packets'] += counters[PACKETS]
+        self.totals['bytes'] += counters[BYTES]
+        self.totals['connections'] += counters[NEW_CONNECTIONS]
+
+    def _ring(self, resolution: int) -> StatsRing:
+        for ring in self.rings:
+            if ring.resolution == resolution:
+                return ring
+        raise ValueError(f"No {resolution}s resolution")
+
+    def _snapshot(self, second: Optional[int]) -> Dict[str, Any]:
+        """Build the ``current`` answer for the last complete second."""
+        ring = self.rings[0]
+        last = np.zeros(3, dtype=np.int64)
+        active = 0
+        protocols = np.zeros(len(PROTOCOL_COLUMNS), dtype=np.int64)
+        applications = np.zeros(len(APPLICATION_COLUMNS), dtype=np.int64)
+        if second is not None:
+            row = second % ring.length
+            if ring.stamp[row] == second:
+                last = ring.counters[row]
+                active = int(ring.active[row])
+            _buckets, rows = ring.select(second - WINDOW_SECONDS + 1, second + 1)
+            protocols = ring.protocols[rows].sum(axis=0)
+            applications = ring.applications[rows].sum(axis=0)
+        return {
+            'total_connections': self.totals['connections'],
+            'active_connections': active,
+            'packets_per_second': int(last[PACKETS]),
+            'bytes_per_second': float(last[BYTES]),
+            'connections_per_second': float(last[NEW_CONNECTIONS]),
+            'total_packets': self.totals['packets'],
+            'total_bytes': self.totals['bytes'],
+            'top_protocols': _top(PROTOCOL_COLUMNS, protocols),
+            'top_applications': _top(APPLICATION_COLUMNS[:-1], applications[:-1]),
+            'timestamp': datetime.fromtimestamp(second if second is not None else time.time()).isoformat(),
+        }
+
+    def advance(self) -> None:
+        """Roll over seconds that passed without packets."""
+        with self.lock:
+            if not self.second or self.merged:
+                return
+            now = self.second + int(time.monotonic() - self._clock_at)
+            if now > self.second:
+                self._roll(now)
+
+    def current(self) -> Dict[str, Any]:
+        """Latest complete second plus lifetime totals and the top lists of the last minute."""
+        self.advance()
+        return self._current
+
+    def history(self, start: float, end: float, interval: int = 60) -> List[Dict[str, Any]]:
+        """Return one point per ``interval`` seconds between two epoch times.
+
+        Reads the coarsest ring whose resolution fits in ``interval``, so a
+        day at one-minute intervals reads 1,440 rows. Ranges older than that
+        ring's retention come back as zero points.
+        """
+        self.advance()
+        interval = max(int(interval), 1)
+        ring = self.rings[0]
+        for candidate in self.rings:
+            if candidate.resolution <= interval:
+                ring = candidate
+
+        with self.lock:
+            # The current second is still incomplete
+            end = min(int(end), self.second) if self.second else int(end)
+            start = int(start)
+            if end <= start:
+                return []
+            buckets, rows = ring.select(start, end)
+            counters = ring.counters[rows]
+            protocols = ring.protocols[rows]
+            applications = ring.applications[rows]
+            active = ring.active[rows]
+
+        first_group = start // interval
+        group_count = (end - 1) // interval - first_group + 1
+        groups = buckets * ring.resolution // interval - first_group
+        keep = (groups >= 0) & (groups < group_count)
+        groups = groups[keep]
+
+        point_counters = np.zeros((group_count, 3), dtype=np.int64)
+        point_protocols = np.zeros((group_count, len(PROTOCOL_COLUMNS)), dtype=np.int64)
+        point_applications = np.zeros((group_count, len(APPLICATION_COLUMNS)), dtype=np.int64)
+        point_active = np.zeros(group_count, dtype=np.int64)
+        np.add.at(point_counters, groups, counters[keep])
+        np.add.at(point_protocols, groups, protocols[keep])
+        np.add.at(point_applications, groups, applications[keep])
+        np.maximum.at(point_active, groups, active[keep])
+
+        points = []
+        for group in range(group_count):
+            packets, total_bytes, new_connections = (int(value) for value in point_counters[group])
+            group_start = (first_group + group) * interval
+            connections, hosts = self._distinct(group_start, group_start + interval, new_connections)
+            points.append({
+                'total_connections': connections,
+                'active_connections': int(point_active[group]),
+                'packets_per_second': packets / interval,
+                'bytes_per_second': total_bytes / interval,
+                'connections_per_second': new_connections / interval,
+                'total_packets': packets,
+                'total_bytes': total_bytes,
+                'unique_hosts': hosts,
+                'top_protocols': _top(PROTOCOL_COLUMNS, point_protocols[group]),
+                'top_applications': _top(APPLICATION_COLUMNS[:-1], point_applications[group][:-1]),
+                'timestamp': datetime.fromtimestamp(group_start).isoformat(),
+            })
+        return points
+
+    def _distinct(self, start: int, end: int, new_connections: int) -> Tuple[int, int]:
+        """Distinct connections and hosts in seconds [start, end).
+
+        Falls back to the flows started and no host count for spans under
+        a minute or ones ``distinct_source`` no longer holds.
+        """
+        if self.distinct_source is None or end - start < 60:
+            return new_connections, 0
+        counts = self.distinct_source(start, end)
+        if counts is None:
+            return new_connections, 0
+        return counts['connections'], counts['hosts']
+
+    def covers(self, start: float, interval: int) -> bool:
+        """True when the ring ``history`` would read for ``interval`` holds data back to ``start``.
+
+        For intervals of a minute or more ``distinct_source`` must still
+        hold ``start`` too.
+        """
+        if self.first_second is None or start < self.first_second:
+            return False
+        ring = self.rings[0]
+        for candidate in self.rings:
+            if candidate.resolution <= interval:
+                ring = candidate
+        if start < self.second - ring.resolution * (ring.length - 1):
+            return False
+        if self.distinct_source is not None and interval >= 60:
+            start = int(start) // interval * interval
+            return self.distinct_source(start, start + interval) is not None
+        return True
+
+    def rollup_rows(self, resolution: int, since: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return one row per bucket after bucket number ``since``, and the new cursor.
+
+        The bucket in progress is included with its counts so far; the
+        cursor only moves past completed buckets, so that one comes back
+        again, complete, on a later call.
+        """
+        self.advance()
+        ring = self._ring(resolution)
+        with self.lock:
+            if not self.second:
+                return [], since
+            current = self.second // resolution
+            first = current - ring.length + 1 if since is None else since + 1
+            buckets, rows = ring.select(first * resolution, (current + 1) * resolution)
+            result = []
+            for bucket, row in zip(buckets.tolist(), rows.tolist()):
+                packets, total_bytes, new_connections = ring.counters[row].tolist()
+                result.append({
+                    'timestamp': datetime.fromtimestamp(bucket * resolution),
+                    'total_connections': new_connections,
+                    'active_connections': int(ring.active[row]),
+                    'bytes_per_second': total_bytes / resolution,
+                    'total_bytes': total_bytes,
+                    'total_packets': packets,
+                    'unique_hosts': 0,
+                    'connections_per_second': new_connections / resolution,
+                    'top_protocols': _top(PROTOCOL_COLUMNS, ring.protocols[row]),
+                    'top_applications': _top(APPLICATION_COLUMNS[:-1], ring.applications[row][:-1]),
+                })
+        # Distinct counts are read outside the lock; the sketches have their own
+        for row in result:
+            start = int(row['timestamp'].timestamp())
+            row['total_connections'], row['unique_hosts'] = self._distinct(
+                start, start + resolution, row['total_connections'])
+        return result, current - 1
+
+    def seconds_since(self, cursor: Optional[int] = None) -> Tuple[List[tuple], Optional[int]]:
+        """Return completed seconds after ``cursor`` as plain tuples, and the new cursor.
+
+        Fan-out workers ship these to the parent, which folds them in with ``merge``.
+        """
+        self.advance()
+        ring = self.rings[0]
+        with self.lock:
+            if not self.second:
+                return [], cursor
+            start = self.second - ring.length if cursor is None else cursor + 1
+            buckets, rows = ring.select(start, self.second)
+            seconds = [
+                (int(second), ring.counters[row].tolist(), ring.protocols[row].tolist(),
+                 ring.applications[row].tolist(), int(ring.active[row]))
+                for second, row in zip(buckets, rows)
+            ]
+            return seconds, self.second - 1
+
+    def merge(self, seconds: List[tuple]) -> None:
+        """Add completed seconds reported by another aggregator."""
+        if not seconds:
+            return
+        with self.lock:
+            for second, counters, protocols, applications, active in seconds:
+                self._add_second(second, counters, protocols, applications, active)
+            self.merged = True
+            if self.first_second is None:
+                self.first_second = min(second for second, *_rest in seconds)
+            latest = max(second for second, *_rest in seconds)
+            if latest >= self.second:
+                self.second = latest + 1
+                self._current = self._snapshot(latest)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            **self.totals,
+            'resolutions': [ring.resolution for ring in self.rings],
+            'memory_bytes': sum(ring.counters.nbytes + ring.protocols.nbytes + ring.applications.nbytes
+                                + ring.active.nbytes + ring.stamp.nbytes
+                                for ring in self.rings),
+        }
+
+def _top(names, counts) -> Dict[str, int]:
+    """Non-zero counts by name, largest first."""
+    return {name: int(count) for count, name in sorted(zip(counts, names), reverse=True) if count}
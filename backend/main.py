@@ -22,6 +22,17 @@ except ImportError as e:
     from fastapi import APIRouter
     packets_router = APIRouter(prefix="/packets", tags=["packets"])
 
+try:
+    from app.api.traffic import router as traffic_router
+except ImportError as e:
+    logger.error(f"Failed to import traffic router: {e}")
+    from fastapi import APIRouter
+    traffic_router = APIRouter(prefix="/traffic", tags=["traffic"])
+
+from app.core.scheduler import scheduler
+from app.db.session import init_db
+from app.services.jobs import register_jobs
+
 # Create FastAPI application
 app = FastAPI(
     title="NautScan API",
@@ -38,6 +49,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Create tables and start background jobs (housekeeping, rollups, cache eviction, GeoIP reloads)
+@app.on_event("startup")
+async def startup():
+    try:
+        await init_db()
+    except Exception as e:
+        logger.error(f"Failed to initialize database: {e}")
+    register_jobs(scheduler)
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await scheduler.stop()
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -48,9 +73,15 @@ async def root():
 async def health_check():
     return {"status": "ok"}
 
+# Background job metrics: runs, failures, durations and rows handled
+@app.get("/jobs")
+async def get_jobs():
+    return scheduler.get_statistics()
+
 # Include API routers with proper prefix
 PREFIX = "/api"
 app.include_router(packets_router, prefix=PREFIX)
+app.include_router(traffic_router, prefix=PREFIX)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
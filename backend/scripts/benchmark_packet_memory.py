@@ -0,0 +1,95 @@
+import argparse
+import gc
+import logging
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from itertools import count
+from pathlib import Path
+from uuid import uuid4
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from scapy.all import RawPcapReader
+
+from app.services.packet_parser import parse_frame, parse_headers, summarize
+from app.services.packet_record import CapturedPacket, PAYLOAD_EXCERPT_BYTES
+from benchmark_parser import build_fixture
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def legacy_packet(frame: bytes, timestamp: float, _ids) -> dict:
+    """packet_info dict as the capture path used to build it for every packet."""
+    header = parse_frame(frame)
+    payload_offset = header.pop('payload_offset')
+    packet_info = {
+        'id': str(uuid4()),
+        'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+        'length': len(frame),
+        'raw_packet': None,
+        **header
+    }
+    packet_info['packet_summary'] = summarize(packet_info)
+    packet_info['source_device_name'] = None
+    packet_info['destination_device_name'] = None
+    if len(frame) > payload_offset:
+        packet_info['payload_excerpt'] = frame[payload_offset:payload_offset + 100].hex()
+    return packet_info
+
+def compact_packet(frame: bytes, timestamp: float, ids) -> CapturedPacket:
+    """CapturedPacket as the capture path builds it now."""
+    version, src, dst, ttl, proto, sport, dport, flags, offset = parse_headers(frame)
+    return CapturedPacket(
+        id=next(ids),
+        timestamp_ns=int(timestamp * 1000000000),
+        version=version,
+        src=int.from_bytes(src, 'big'),
+        dst=int.from_bytes(dst, 'big'),
+        proto=proto,
+        ttl=ttl,
+        length=len(frame),
+        source_port=sport,
+        destination_port=dport,
+        tcp_flags=flags,
+        payload=frame[offset:offset + PAYLOAD_EXCERPT_BYTES] if len(frame) > offset else None
+    )
+
+def measure(name: str, build, frames: list) -> float:
+    """Return the heap retained per packet while all packets are held in memory."""
+    ids = count(1)
+    gc.collect()
+    tracemalloc.start()
+    packets = [build(frame, timestamp, ids) for frame, timestamp in frames]
+    retained, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_packet = retained / len(packets)
+    logger.info(f"{name:>8}: {per_packet:,.0f} bytes/packet over {len(packets)} packets")
+    del packets
+    return per_packet
+
+def main():
+    """Measure the per-packet heap cost of packet_info dicts versus CapturedPacket records"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('pcap', nargs='?', help="pcap file to replay (a synthetic fixture is generated if omitted)")
+    parser.add_argument('--count', type=int, default=20000, help="number of frames in the generated fixture")
+    args = parser.parse_args()
+
+    if args.pcap:
+        pcap_path = Path(args.pcap)
+    else:
+        pcap_path = Path(tempfile.gettempdir()) / 'nautscan_parser_fixture.pcap'
+        logger.info(f"Generating {args.count} frame fixture at {pcap_path}")
+        build_fixture(pcap_path, args.count)
+
+    frames = [(frame, meta.sec + meta.usec / 1e6) for frame, meta in RawPcapReader(str(pcap_path))
+              if parse_headers(frame) is not None]
+
+    legacy = measure('dict', legacy_packet, frames)
+    compact = measure('compact', compact_packet, frames)
+    logger.info(f"CapturedPacket uses {compact / legacy:.0%} of the dict's memory ({legacy - compact:,.0f} bytes saved per packet)")
+
+if __name__ == '__main__':
+    main()
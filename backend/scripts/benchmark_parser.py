@@ -0,0 +1,110 @@
+import argparse
+import logging
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from scapy.all import Ether, Dot1Q, IP, IPv6, TCP, UDP, ICMP, DNS, DNSQR, Raw, RawPcapReader, wrpcap
+
+from app.services.packet_parser import parse_frame, summarize
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fixed MACs so scapy does not try to resolve them while building frames
+FIXTURE_MACS = {'src': '02:00:00:00:00:01', 'dst': '02:00:00:00:00:02'}
+
+def build_fixture(path: Path, count: int) -> None:
+    """Write a pcap with a realistic mix of TCP/UDP/ICMP, IPv4/IPv6 and VLAN frames."""
+    rng = random.Random(42)
+    packets = []
+    for i in range(count):
+        kind = i % 10
+        src = f"192.168.1.{rng.randint(2, 254)}"
+        dst = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        payload = Raw(rng.randbytes(rng.randint(0, 1200)))
+        if kind < 5:
+            pkt = Ether(**FIXTURE_MACS) / IP(src=src, dst=dst) / TCP(sport=rng.randint(1024, 65535), dport=443, flags='PA') / payload
+        elif kind < 7:
+            pkt = Ether(**FIXTURE_MACS) / IP(src=src, dst=dst) / UDP(sport=rng.randint(1024, 65535), dport=53) / DNS(qd=DNSQR(qname='example.com'))
+        elif kind == 7:
+            pkt = Ether(**FIXTURE_MACS) / Dot1Q(vlan=10) / IP(src=src, dst=dst) / TCP(sport=22, dport=rng.randint(1024, 65535), flags='A') / payload
+        elif kind == 8:
+            pkt = Ether(**FIXTURE_MACS) / IPv6(src='fe80::1', dst='2001:db8::1') / TCP(sport=rng.randint(1024, 65535), dport=80, flags='S')
+        else:
+            pkt = Ether(**FIXTURE_MACS) / IP(src=src, dst=dst) / ICMP()
+        packets.append(pkt)
+    wrpcap(str(path), packets)
+
+def legacy_extract(frame: bytes) -> dict:
+    """Header extraction as done by the scapy-based capture callback."""
+    packet = Ether(frame)
+    is_ipv6 = IPv6 in packet
+    if not (IP in packet or is_ipv6):
+        return {}
+    ip_layer = packet[IPv6] if is_ipv6 else packet[IP]
+    info = {
+        'source_ip': ip_layer.src,
+        'destination_ip': ip_layer.dst,
+        'ttl': getattr(ip_layer, 'hlim' if is_ipv6 else 'ttl', None),
+        'packet_summary': packet.summary(),
+    }
+    if TCP in packet:
+        info['source_port'] = packet[TCP].sport
+        info['destination_port'] = packet[TCP].dport
+        info['flags'] = int(packet[TCP].flags)
+    elif UDP in packet:
+        info['source_port'] = packet[UDP].sport
+        info['destination_port'] = packet[UDP].dport
+    payload = bytes(packet.payload.payload)
+    if payload:
+        info['payload_excerpt'] = payload[:100].hex()
+    return info
+
+def fast_extract(frame: bytes) -> dict:
+    """Header extraction through the struct-based fast path."""
+    info = parse_frame(frame)
+    if info is None:
+        return {}
+    offset = info.pop('payload_offset')
+    info['packet_summary'] = summarize(info)
+    if len(frame) > offset:
+        info['payload_excerpt'] = frame[offset:offset + 100].hex()
+    return info
+
+def measure(name: str, extract, frames: list) -> float:
+    started = time.perf_counter()
+    for frame in frames:
+        extract(frame)
+    elapsed = time.perf_counter() - started
+    pps = len(frames) / elapsed
+    logger.info(f"{name:>8}: {len(frames)} frames in {elapsed:.3f}s -> {pps:,.0f} pps")
+    return pps
+
+def main():
+    """Compare scapy dissection with the fast-path parser on a pcap fixture"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('pcap', nargs='?', help="pcap file to replay (a synthetic fixture is generated if omitted)")
+    parser.add_argument('--count', type=int, default=20000, help="number of frames in the generated fixture")
+    args = parser.parse_args()
+
+    if args.pcap:
+        pcap_path = Path(args.pcap)
+    else:
+        pcap_path = Path(tempfile.gettempdir()) / 'nautscan_parser_fixture.pcap'
+        logger.info(f"Generating {args.count} frame fixture at {pcap_path}")
+        build_fixture(pcap_path, args.count)
+
+    frames = [frame for frame, _meta in RawPcapReader(str(pcap_path))]
+
+    scapy_pps = measure('scapy', legacy_extract, frames)
+    fast_pps = measure('fast', fast_extract, frames)
+    logger.info(f"Fast path speedup: {fast_pps / scapy_pps:.1f}x")
+
+if __name__ == '__main__':
+    main()
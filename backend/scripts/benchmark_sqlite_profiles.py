@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.db.session import SQLITE_PROFILES, WriterSessionFactory, create_engines
+from app.models.database import Base
+from app.services.database import DatabaseService
+from app.services.packet_partitions import packet_partitions
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def packet_rows(count: int) -> list:
+    now = datetime.now()
+    return [
+        {
+            'timestamp': now,
+            'source_ip': f"10.0.0.{i % 256}",
+            'source_port': 1024 + i,
+            'destination_ip': '93.184.216.34',
+            'destination_port': 443,
+            'protocol': 'TCP' if i % 4 else 'UDP',
+            'length': 60 + i % 1400,
+            'application_protocol': 'HTTPS',
+        }
+        for i in range(count)
+    ]
+
+async def write(sessions, batches: int, batch_size: int) -> float:
+    """Insert ``batches`` batches, one commit each; returns rows per second."""
+    started = time.perf_counter()
+    for _ in range(batches):
+        async with sessions() as session:
+            await DatabaseService(session).save_packets(packet_rows(batch_size))
+    return batches * batch_size / (time.perf_counter() - started)
+
+async def read(sessions, duration: float) -> float:
+    """Page through recent packets for ``duration`` seconds; returns queries per second."""
+    queries = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        async with sessions() as session:
+            await DatabaseService(session).get_packets(limit=50, protocol='UDP')
+        queries += 1
+        await asyncio.sleep(0)
+    return queries / (time.perf_counter() - started)
+
+async def run_profile(directory: Path, profile: str, batches: int, batch_size: int, readers: int) -> None:
+    path = directory / f"profile_{profile}.db"
+    for suffix in ('', '-wal', '-shm'):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    # The partition cache is per process; each profile starts on a fresh file
+    packet_partitions.days.clear()
+
+    write_engine, read_engine = create_engines(f"sqlite+aiosqlite:///{path}", profile)
+    writer_sessions = WriterSessionFactory(sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False),
+                                           serialize=True)
+    reader_sessions = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    async with write_engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    # Small commits, as flow upserts and name backfills make them
+    small = await write(writer_sessions, batches, 10)
+    # Batched inserts alone, then alongside readers
+    batched = await write(writer_sessions, batches, batch_size)
+    started = time.perf_counter()
+    write_task = asyncio.ensure_future(write(writer_sessions, batches, batch_size))
+    read_rates = await asyncio.gather(*[read(reader_sessions, 2.0) for _ in range(readers)])
+    mixed = await write_task
+    elapsed = time.perf_counter() - started
+    logger.info(f"{profile:>8}: {small:>8,.0f} rows/s in 10-row commits, {batched:>8,.0f} rows/s in "
+                f"{batch_size}-row commits, {mixed:>8,.0f} rows/s with {readers} readers at "
+                f"{sum(read_rates):>6,.0f} queries/s ({elapsed:.1f}s)")
+    await write_engine.dispose()
+    await read_engine.dispose()
+
+def main():
+    """Measure insert and query throughput of each SQLite profile on one storage device"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--directory', help="where to create the test databases, e.g. a directory on the SD card "
+                                            "(a temporary directory if omitted)")
+    parser.add_argument('--profiles', nargs='+', default=list(SQLITE_PROFILES), choices=list(SQLITE_PROFILES))
+    parser.add_argument('--batches', type=int, default=100, help="commits per measurement")
+    parser.add_argument('--batch-size', type=int, default=500, help="rows per batched commit")
+    parser.add_argument('--readers', type=int, default=2, help="concurrent readers in the mixed measurement")
+    args = parser.parse_args()
+
+    directory = Path(args.directory or tempfile.mkdtemp())
+    logger.info(f"Benchmarking SQLite profiles in {directory}")
+    for profile in args.profiles:
+        asyncio.run(run_profile(directory, profile, args.batches, args.batch_size, args.readers))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import socket
+
+from app.services.cardinality import PRECISION, CardinalityTracker, relative_error
+
+SECOND = 1000000000
+MINUTE = 1700000040  # Start of a minute, in seconds
+
+def add_connections(tracker, first, count, at=MINUTE + 1):
+    destination = socket.inet_aton('93.184.216.34')
+    for i in range(first, first + count):
+        source = socket.inet_aton(f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}')
+        tracker.add(at * SECOND, 6, 1024 + i % 50000, 443, source, destination)
+
+def close_to(value, expected):
+    # Four standard errors
+    return abs(value - expected) <= 4 * relative_error(PRECISION) * expected + 2
+
+def test_counts_distinct_hosts_ports_and_connections():
+    tracker = CardinalityTracker(max_hosts=16)
+    add_connections(tracker, 0, 5000)
+    # Repeats do not count twice
+    add_connections(tracker, 0, 5000)
+    counts = tracker.count(MINUTE, MINUTE + 60)
+    assert close_to(counts['hosts'], 5001)
+    assert close_to(counts['connections'], 5000)
+    assert counts['ports'] == 1
+    assert counts['remote_ips'] == 1
+
+def test_merging_workers_counts_the_union_once():
+    first, second = CardinalityTracker(max_hosts=16), CardinalityTracker(max_hosts=16)
+    add_connections(first, 0, 6000)
+    add_connections(second, 3000, 6000)
+
+    parent = CardinalityTracker(max_hosts=16)
+    for worker in (first, second):
+        buckets, _cursor = worker.buckets_since()
+        parent.merge(buckets)
+        # Registers merge by maximum, so a bucket sent again changes nothing
+        parent.merge(buckets)
+    counts = parent.count(MINUTE, MINUTE + 60)
+    assert close_to(counts['connections'], 9000)
+    assert close_to(counts['hosts'], 9001)
+
+def test_closed_minutes_roll_into_the_hour():
+    tracker = CardinalityTracker(max_hosts=16)
+    add_connections(tracker, 0, 2000, at=MINUTE + 1)
+    add_connections(tracker, 2000, 2000, at=MINUTE + 61)
+    assert close_to(tracker.count(MINUTE, MINUTE + 60)['connections'], 2000)
+    assert close_to(tracker.count(MINUTE, MINUTE + 120)['connections'], 4000)
@@ -0,0 +1,222 @@
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.db import session as db_session
+from app.models.database import LocationRecord
+from app.models.network import Location
+from app.services import database
+from app.services.database import DatabaseService, decode_packet_cursor, encode_packet_cursor
+from app.services.packet_capture import PacketCapture
+from app.services.packet_partitions import packet_partitions
+from test_packet_capture import START as FRAME_START, tcp_frame
+
+# Tables as the first release created them, before flows and rollups gained columns
+LEGACY_SCHEMA = """
+CREATE TABLE locations (id INTEGER NOT NULL, latitude FLOAT, longitude FLOAT, city VARCHAR, country VARCHAR,
+                        PRIMARY KEY (id));
+CREATE TABLE connections (id INTEGER NOT NULL, connection_id VARCHAR, source_id INTEGER, destination_id INTEGER,
+                          protocol VARCHAR, source_port INTEGER, destination_port INTEGER, bytes_sent INTEGER,
+                          bytes_received INTEGER, timestamp DATETIME, duration FLOAT, application VARCHAR,
+                          status VARCHAR, PRIMARY KEY (id));
+CREATE TABLE traffic_stats (id INTEGER NOT NULL, timestamp DATETIME, total_connections INTEGER,
+                            active_connections INTEGER, bytes_per_second FLOAT, total_bytes INTEGER,
+                            connections_per_second FLOAT, top_protocols JSON, top_applications JSON,
+                            PRIMARY KEY (id));
+INSERT INTO locations VALUES (1, 1.5, 2.5, 'Paris', 'France'), (2, 1.5, 2.5, 'Paris', 'France');
+INSERT INTO connections (id, connection_id, source_id, destination_id, protocol, bytes_sent, status)
+VALUES (1, 'legacy', 1, 2, 'TCP', 100, 'closed');
+"""
+
+@asynccontextmanager
+async def open_database(path, monkeypatch):
+    """Point the app at a fresh SQLite file for one test"""
+    write_engine, read_engine = db_session.create_engines(f"sqlite+aiosqlite:///{path}", 'default')
+    sessions = db_session.WriterSessionFactory(
+        sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False), serialize=True
+    )
+    monkeypatch.setattr(db_session, 'AsyncSessionLocal', sessions)
+    packet_partitions.days.clear()
+    database._location_ids.clear()
+    try:
+        yield sessions
+    finally:
+        await write_engine.dispose()
+        await read_engine.dispose()
+
+def packet_rows(count, now, **fields):
+    return [
+        dict(timestamp=now - timedelta(hours=i % 50, seconds=i), source_ip=f"10.0.0.{i % 5}", source_port=1024 + i,
+             destination_ip='8.8.8.8' if i % 2 else '1.1.1.1', destination_port=53, protocol='UDP', length=60,
+             connection_id=f"flow-{i % 4}", **fields)
+        for i in range(count)
+    ]
+
+def test_init_db_upgrades_an_existing_database(tmp_path, monkeypatch):
+    path = tmp_path / 'nautscan.db'
+    with sqlite3.connect(path) as connection:
+        connection.executescript(LEGACY_SCHEMA)
+
+    async def scenario():
+        async with open_database(path, monkeypatch) as sessions:
+            await db_session.init_db()
+            # A second start finds nothing left to do
+            await db_session.init_db()
+            async with sessions() as session:
+                service = DatabaseService(session)
+                now = datetime.now()
+                await service.upsert_connections([dict(
+                    connection_id='new', protocol='TCP', source_ip='10.0.0.1', source_port=50000,
+                    destination_ip='93.184.216.34', destination_port=443, bytes_sent=1, bytes_received=2,
+                    packets_sent=1, packets_received=1, timestamp=now, last_seen=now, duration=0.0,
+                    application='HTTPS', tcp_state='established', status='active'
+                )])
+                await service.save_packets(packet_rows(10, now))
+
+    asyncio.run(scenario())
+    with sqlite3.connect(path) as connection:
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(connections)")}
+        assert {'source_ip', 'destination_ip', 'packets_sent', 'last_seen', 'tcp_state'} <= columns
+        rollup_columns = {row[1]: row[4] for row in connection.execute("PRAGMA table_info(traffic_stats)")}
+        assert rollup_columns['total_packets'] == '0'
+        # Duplicate places were merged and the legacy flow repointed
+        assert connection.execute("SELECT count(*) FROM locations").fetchone() == (1,)
+        assert connection.execute("SELECT source_id, destination_id FROM connections "
+                                  "WHERE connection_id = 'legacy'").fetchone() == (1, 1)
+        assert connection.execute("SELECT tcp_state FROM connections "
+                                  "WHERE connection_id = 'new'").fetchone() == ('established',)
+
+def test_cursor_pages_cover_every_packet_once(tmp_path, monkeypatch):
+    async def scenario():
+        async with open_database(tmp_path / 'nautscan.db', monkeypatch) as sessions:
+            await db_session.init_db()
+            now = datetime.now()
+            async with sessions() as session:
+                service = DatabaseService(session)
+                # Spread over three day partitions, with timestamps shared by several packets
+                rows = packet_rows(300, now)
+                for row in rows[::3]:
+                    row['timestamp'] = now - timedelta(hours=1)
+                await service.save_packets(rows)
+
+                seen, cursor = [], None
+                while True:
+                    page = await service.get_packets(limit=40, protocol='UDP', cursor=cursor)
+                    if not page:
+                        break
+                    seen += [(packet.timestamp, packet.id) for packet in page]
+                    cursor = decode_packet_cursor(encode_packet_cursor(page[-1]))
+                assert len(seen) == 300
+                assert len(set(seen)) == 300
+                assert seen == sorted(seen, reverse=True)
+
+                first_page = await service.get_packets(limit=40, source_ip='10.0.0.1')
+                second_page = await service.get_packets(limit=40, source_ip='10.0.0.1',
+                                                        cursor=(first_page[-1].timestamp, first_page[-1].id))
+                assert [packet.id for packet in second_page] == \
+                       [packet.id for packet in await service.get_packets(limit=40, offset=40, source_ip='10.0.0.1')]
+
+    asyncio.run(scenario())
+
+def test_malformed_cursor():
+    with pytest.raises(ValueError):
+        decode_packet_cursor('not-a-cursor')
+
+def test_location_ids_are_cached_only_once_committed(tmp_path, monkeypatch):
+    places = [Location(lat=float(i), lng=float(i), city='City', country='Country') for i in range(3)]
+    key = DatabaseService.location_key(places[0])
+
+    async def scenario():
+        async with open_database(tmp_path / 'nautscan.db', monkeypatch) as sessions:
+            await db_session.init_db()
+            async with sessions() as session:
+                ids = await DatabaseService(session).get_location_ids(places)
+                assert len(ids) == 3
+                assert database._location_ids.get(key) is None
+                await session.rollback()
+                assert database._location_ids.get(key) is None
+            async with sessions() as session:
+                assert await session.scalar(select(func.count()).select_from(LocationRecord)) == 0
+                ids = await DatabaseService(session).get_location_ids(places + places)
+                await session.commit()
+                assert database._location_ids.get(key) == ids[key]
+
+    asyncio.run(scenario())
+
+def test_bulk_marking_matches_a_rebuilt_summary(tmp_path, monkeypatch):
+    async def scenario():
+        async with open_database(tmp_path / 'nautscan.db', monkeypatch) as sessions:
+            await db_session.init_db()
+            async with sessions() as session:
+                service = DatabaseService(session)
+                await service.save_packets(packet_rows(1000, datetime.now()))
+                with pytest.raises(ValueError):
+                    await service.mark_packets_as_malicious(threat_category='scan')
+                # Either end matches ip; 10.0.0.1 sends a fifth of the packets
+                assert await service.mark_packets_as_malicious(threat_category='scan', ip='10.0.0.1',
+                                                               chunk_size=64) == 200
+                # Overlaps the first mark; those packets are not counted again
+                assert await service.mark_packets_as_malicious(connection_id='flow-1', chunk_size=64) == 250
+                incremental = await service.get_malicious_ip_list()
+                await service.rebuild_malicious_ips()
+                assert await service.get_malicious_ip_list() == incremental
+                counts = {entry['ip']: entry['occurrence_count'] for entry in incremental}
+                assert counts['10.0.0.1'] == 200
+                assert counts['8.8.8.8'] == 100 + 250 - 50
+
+    asyncio.run(scenario())
+
+def test_marking_a_captured_flow(tmp_path, monkeypatch):
+    capture = PacketCapture()
+    for i in range(5):
+        capture._process_frame(tcp_frame('10.0.0.2', '93.184.216.34', 50000 + i % 2, 443), FRAME_START + i)
+    rows = [packet.to_row() for _seq, packet in capture.recent_packets.snapshot()]
+    connection_id = rows[0]['connection_id']
+
+    async def scenario():
+        async with open_database(tmp_path / 'nautscan.db', monkeypatch) as sessions:
+            await db_session.init_db()
+            async with sessions() as session:
+                service = DatabaseService(session)
+                await service.save_packets(rows)
+                assert await service.mark_packets_as_malicious(threat_category='c2', confidence_score=0.9,
+                                                               connection_id=connection_id) == 3
+                # Details left out keep what analysts stored before
+                assert await service.mark_packets_as_malicious(notes='seen again', connection_id=connection_id) == 3
+                packets = await service.get_packets(connection_id=connection_id)
+                assert {(packet.threat_category, packet.confidence_score, packet.notes) for packet in packets} == \
+                       {('c2', 0.9, 'seen again')}
+                assert len(await service.get_packets(is_malicious=True)) == 3
+
+    asyncio.run(scenario())
+
+def test_chunked_writes_let_other_writers_in(tmp_path, monkeypatch):
+    async def scenario():
+        async with open_database(tmp_path / 'nautscan.db', monkeypatch) as sessions:
+            await db_session.init_db()
+            async with sessions() as session:
+                await DatabaseService(session).save_packets(packet_rows(2000, datetime.now()))
+
+            order = []
+
+            async def bulk():
+                async with sessions() as session:
+                    await DatabaseService(session).mark_packets_as_malicious(ip='8.8.8.8', chunk_size=100)
+                order.append('bulk')
+
+            async def writer():
+                await asyncio.sleep(0.01)
+                async with sessions() as session:
+                    await DatabaseService(session).save_packets(packet_rows(1, datetime.now()))
+                order.append('writer')
+
+            await asyncio.gather(bulk(), writer())
+            assert order == ['writer', 'bulk']
+
+    asyncio.run(scenario())
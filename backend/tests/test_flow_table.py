@@ -0,0 +1,119 @@
+import socket
+
+from app.services.flow_table import FlowTable, TCP_ACK, TCP_FIN, TCP_RST, TCP_SYN
+from app.services.packet_parser import IPPROTO_TCP, IPPROTO_UDP
+
+CLIENT = socket.inet_aton('10.0.0.2')
+SERVER = socket.inet_aton('93.184.216.34')
+SECOND = 1000000000
+START = 1700000000 * SECOND
+
+def tcp(table, forward, flags, at, length=60):
+    if forward:
+        return table.update(CLIENT, SERVER, IPPROTO_TCP, 50000, 443, length, flags, at)
+    return table.update(SERVER, CLIENT, IPPROTO_TCP, 443, 50000, length, flags, at)
+
+def only_row(table):
+    rows = table.collect()
+    assert len(rows) == 1
+    return rows[0]
+
+def test_handshake_establishes_and_counts_each_direction():
+    table = FlowTable(capacity=16)
+    assert tcp(table, True, TCP_SYN, START)
+    assert only_row(table)['tcp_state'] == 'syn_sent'
+    assert not tcp(table, False, TCP_SYN | TCP_ACK, START + 1, length=80)
+    assert only_row(table)['tcp_state'] == 'syn_received'
+    tcp(table, True, TCP_ACK, START + 2)
+
+    row = only_row(table)
+    assert row['tcp_state'] == 'established'
+    assert (row['source_ip'], row['source_port']) == ('10.0.0.2', 50000)
+    assert (row['destination_ip'], row['destination_port']) == ('93.184.216.34', 443)
+    assert (row['packets_sent'], row['bytes_sent']) == (2, 120)
+    assert (row['packets_received'], row['bytes_received']) == (1, 80)
+    assert row['application'] == 'HTTPS'
+    assert row['status'] == 'active'
+    assert len(table) == 1
+
+def test_originator_is_the_first_sender_whatever_the_key_order():
+    table = FlowTable(capacity=16)
+    tcp(table, False, TCP_ACK, START)
+    row = only_row(table)
+    assert row['source_ip'] == '93.184.216.34'
+    # Picked up mid-stream
+    assert row['tcp_state'] == 'established'
+
+def test_fin_from_both_sides_closes_and_expires_early():
+    table = FlowTable(capacity=16, tcp_timeout=300, closed_timeout=10)
+    tcp(table, True, TCP_SYN, START)
+    tcp(table, False, TCP_SYN | TCP_ACK, START)
+    tcp(table, True, TCP_ACK, START)
+    tcp(table, True, TCP_FIN | TCP_ACK, START + SECOND)
+    assert only_row(table)['tcp_state'] == 'closing'
+    tcp(table, False, TCP_FIN | TCP_ACK, START + SECOND)
+    assert only_row(table)['tcp_state'] == 'closed'
+
+    table.expire(START + 5 * SECOND)
+    assert len(table) == 1
+    table.expire(START + 12 * SECOND)
+    assert len(table) == 0
+    row = only_row(table)
+    assert row['status'] == 'closed'
+    assert table.get_statistics()['closed'] == 1
+
+def test_reset_closes_the_flow():
+    table = FlowTable(capacity=16)
+    tcp(table, True, TCP_SYN, START)
+    tcp(table, False, TCP_RST, START)
+    assert only_row(table)['tcp_state'] == 'reset'
+
+def test_idle_udp_flow_expires_and_activity_postpones_it():
+    table = FlowTable(capacity=16, udp_timeout=60)
+    table.update(CLIENT, SERVER, IPPROTO_UDP, 40000, 53, 70, None, START)
+    table.update(SERVER, CLIENT, IPPROTO_UDP, 53, 40000, 120, None, START + 30 * SECOND)
+    table.collect()
+
+    table.expire(START + 70 * SECOND)
+    assert len(table) == 1
+    table.expire(START + 95 * SECOND)
+    assert len(table) == 0
+    row = only_row(table)
+    assert row['protocol'] == 'UDP'
+    assert row['tcp_state'] is None
+    assert row['duration'] == 30.0
+
+def test_full_table_drops_new_flows_and_reuses_expired_slots():
+    table = FlowTable(capacity=2, udp_timeout=10)
+    for port in (1, 2, 3):
+        table.update(CLIENT, SERVER, IPPROTO_UDP, port, 53, 60, None, START)
+    assert len(table) == 2
+    assert table.get_statistics()['table_full'] == 1
+
+    table.expire(START + 20 * SECOND)
+    assert len(table) == 0
+    assert table.update(CLIENT, SERVER, IPPROTO_UDP, 3, 53, 60, None, START + 21 * SECOND)
+    assert len(table) == 1
+
+def test_packets_get_their_flow_connection_id():
+    table = FlowTable(capacity=16)
+    tcp(table, True, TCP_SYN, START)
+    connection_id = table.connection_id(table.last_slot)
+    tcp(table, False, TCP_SYN | TCP_ACK, START + 1)
+    assert table.connection_id(table.last_slot) == connection_id
+    assert only_row(table)['connection_id'] == connection_id
+
+    full = FlowTable(capacity=1)
+    full.update(CLIENT, SERVER, IPPROTO_UDP, 1, 53, 60, None, START)
+    full.update(CLIENT, SERVER, IPPROTO_UDP, 2, 53, 60, None, START)
+    assert full.connection_id(full.last_slot) is None
+
+def test_drain_reports_live_and_expired_flows_as_closed():
+    table = FlowTable(capacity=16, udp_timeout=10)
+    table.update(CLIENT, SERVER, IPPROTO_UDP, 1, 53, 60, None, START)
+    tcp(table, True, TCP_SYN, START + 15 * SECOND)
+    rows = table.drain()
+    assert sorted(row['protocol'] for row in rows) == ['TCP', 'UDP']
+    assert {row['status'] for row in rows} == {'closed'}
+    assert len(table) == 0
+    assert table.collect() == []
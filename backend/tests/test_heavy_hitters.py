@@ -0,0 +1,84 @@
+import random
+import socket
+
+from app.services.heavy_hitters import SOURCES, HeavyHitters, HitterBucket
+from app.services.packet_parser import IPPROTO_TCP
+
+SECOND = 1000000000
+MINUTE = 1700000040  # Start of a minute, in seconds
+
+def check_bounds(bucket, true_counts, capacity):
+    counts, error = bucket.counts[SOURCES], bucket.errors[SOURCES]
+    assert len(counts) <= capacity
+    assert error <= bucket.total / (capacity + 1)
+    for key, true_count in true_counts.items():
+        estimate = counts.get(key, 0)
+        assert estimate <= true_count <= estimate + error
+
+def skewed_stream(seed, count):
+    generator = random.Random(seed)
+    # A few heavy keys over a long tail
+    keys = [f"heavy-{i}" for i in range(5)] * 100 + [f"tail-{i}" for i in range(500)]
+    return [(generator.choice(keys), generator.randint(40, 1500)) for _ in range(count)]
+
+def summarize(stream, capacity):
+    bucket = HitterBucket(0)
+    true_counts = {}
+    for key, length in stream:
+        bucket.total += length
+        counts = bucket.counts[SOURCES]
+        counts[key] = counts.get(key, 0) + length
+        true_counts[key] = true_counts.get(key, 0) + length
+        if len(counts) > 2 * capacity:
+            bucket.prune(SOURCES, capacity)
+    bucket.prune(SOURCES, capacity)
+    return bucket, true_counts
+
+def test_pruned_counts_stay_within_the_error_bound():
+    bucket, true_counts = summarize(skewed_stream(1, 20000), 16)
+    check_bounds(bucket, true_counts, 16)
+    # Keys over total / (capacity + 1) always survive pruning
+    assert all(f"heavy-{i}" in bucket.counts[SOURCES] for i in range(5))
+
+def test_merged_summaries_keep_the_bound():
+    first, first_counts = summarize(skewed_stream(2, 10000), 16)
+    second, second_counts = summarize(skewed_stream(3, 10000), 16)
+    first.merge(second, 16)
+    true_counts = dict(first_counts)
+    for key, count in second_counts.items():
+        true_counts[key] = true_counts.get(key, 0) + count
+    check_bounds(first, true_counts, 16)
+
+def test_tuple_round_trip():
+    bucket, _true_counts = summarize(skewed_stream(4, 1000), 8)
+    copy = HitterBucket.from_tuple(bucket.to_tuple())
+    assert copy.to_tuple() == bucket.to_tuple()
+    assert copy.counts[SOURCES] is not bucket.counts[SOURCES]
+
+def add_packets(hitters, source, count, length, at):
+    destination = socket.inet_aton('93.184.216.34')
+    for i in range(count):
+        hitters.add(at * SECOND, length, IPPROTO_TCP, 40000 + i % 100, 443, source, destination)
+
+def test_workers_merge_into_the_parent():
+    workers = [HeavyHitters(capacity=8), HeavyHitters(capacity=8)]
+    heavy = socket.inet_aton('10.0.0.1')
+    for number, worker in enumerate(workers):
+        add_packets(worker, heavy, 50, 1000, MINUTE + 1)
+        for host in range(30):
+            add_packets(worker, socket.inet_aton(f'10.0.{number + 1}.{host}'), 2, 100, MINUTE + 2)
+        # The next minute closes this one
+        add_packets(worker, heavy, 1, 100, MINUTE + 61)
+
+    parent = HeavyHitters(capacity=8)
+    for worker in workers:
+        buckets, cursor = worker.buckets_since()
+        assert cursor == MINUTE // 60
+        parent.merge(buckets)
+
+    top, total = parent.top('sources', 120, limit=3)
+    assert total == 2 * (50 * 1000 + 30 * 2 * 100)
+    key, estimate, upper = top[0]
+    assert key == '10.0.0.1'
+    assert estimate <= 100000 <= upper
+    assert parent.top('protocols', 120)[0][0][0] == 'TCP'
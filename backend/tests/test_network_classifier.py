@@ -0,0 +1,52 @@
+import ipaddress
+
+from app.core.network_classifier import CIDRTrie, NetworkClassifier, pack_ip
+
+def trie(*networks):
+    table = CIDRTrie()
+    for cidr, label in networks:
+        network = ipaddress.ip_network(cidr)
+        table.insert(network.network_address.packed, network.prefixlen, label)
+    return table
+
+def test_longest_prefix_wins_in_any_insertion_order():
+    networks = [('10.0.0.0/8', 'wide'), ('10.1.0.0/16', 'narrow'), ('10.1.2.128/25', 'narrowest')]
+    for ordered in (networks, networks[::-1]):
+        table = trie(*ordered)
+        assert table.lookup(pack_ip('10.1.2.200')) == 'narrowest'
+        assert table.lookup(pack_ip('10.1.2.127')) == 'narrow'
+        assert table.lookup(pack_ip('10.2.0.1')) == 'wide'
+        assert table.lookup(pack_ip('11.0.0.1')) is None
+
+def test_prefixes_inside_a_byte_cover_exactly_their_range():
+    table = trie(('172.16.0.0/12', 'private'))
+    assert table.lookup(pack_ip('172.16.0.1')) == 'private'
+    assert table.lookup(pack_ip('172.31.255.255')) == 'private'
+    assert table.lookup(pack_ip('172.15.255.255')) is None
+    assert table.lookup(pack_ip('172.32.0.0')) is None
+
+def test_default_route_and_ipv6():
+    table = trie(('0.0.0.0/0', 'default'), ('192.168.1.0/24', 'lan'))
+    assert table.lookup(pack_ip('8.8.8.8')) == 'default'
+    assert table.lookup(pack_ip('192.168.1.9')) == 'lan'
+
+    table6 = trie(('2001:db8::/32', 'docs'), ('2001:db8:1::/48', 'site'))
+    assert table6.lookup(pack_ip('2001:db8:1::5')) == 'site'
+    assert table6.lookup(pack_ip('2001:db8:2::5')) == 'docs'
+    assert table6.lookup(pack_ip('2001:db9::1')) is None
+
+def test_classifier_keeps_families_apart():
+    classifier = NetworkClassifier()
+    assert classifier.add_provider_network('8.8.8.0/24', 'Google')
+    assert classifier.add_provider_network('2001:4860::/32', 'Google')
+    assert not classifier.add_provider_network('not a network', 'Nobody')
+    assert classifier.providers[4].lookup(pack_ip('8.8.8.8')) == 'Google'
+    assert classifier.providers[16].lookup(pack_ip('2001:4860::8888')) == 'Google'
+    assert classifier.providers[4].lookup(pack_ip('8.8.4.4')) is None
+
+def test_pack_ip():
+    assert pack_ip('1.2.3.4') == bytes([1, 2, 3, 4])
+    assert pack_ip(0x01020304) == bytes([1, 2, 3, 4])
+    assert pack_ip('fe80::1%eth0') == ipaddress.ip_address('fe80::1').packed
+    assert pack_ip('1.2.3') is None
+    assert pack_ip(b'abc') is None
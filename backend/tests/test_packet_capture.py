@@ -0,0 +1,62 @@
+import socket
+import struct
+
+import pytest
+
+from app.services.packet_capture import PacketCapture
+
+START = 1700000000 * 1000000000
+
+def tcp_frame(src, dst, sport, dport, flags=0x18):
+    """Ethernet, IPv4 and TCP headers with no payload"""
+    tcp = struct.pack('!HHIIBBHHH', sport, dport, 0, 0, 5 << 4, flags, 65535, 0, 0)
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 0, 0, 64, 6, 0,
+                     socket.inet_aton(src), socket.inet_aton(dst))
+    return b'\0' * 12 + b'\x08\x00' + ip + tcp
+
+def test_unknown_sampling_mode_is_rejected():
+    capture = PacketCapture()
+    with pytest.raises(ValueError):
+        capture.update_settings({'sampling': {'mode': 'flowhash', 'rate': 10}})
+    assert capture.settings['sampling']['mode'] == 'all'
+    capture.update_settings({'sampling': {'mode': 'one_in_n', 'rate': 10}})
+    assert capture.settings['sampling']['mode'] == 'one_in_n'
+
+def test_flow_hash_keeps_whole_flows_in_every_process():
+    sampling = {'mode': 'flow_hash', 'rate': 4}
+    client, server = socket.inet_aton('10.0.0.2'), socket.inet_aton('93.184.216.34')
+    sampled_out = [PacketCapture._sampled_out(None, sampling, client, server, 6, port, 443) for port in range(4000)]
+    # Both directions of a flow get the same decision
+    assert sampled_out == [PacketCapture._sampled_out(None, sampling, server, client, 6, 443, port)
+                           for port in range(4000)]
+    assert 800 < sampled_out.count(False) < 1200
+    # CRC-32 rather than the per-process salted hash()
+    assert sampled_out[:8] == [True, True, False, False, True, True, True, True]
+
+def capture_flow(capture, packets=3):
+    for i in range(packets):
+        capture._process_frame(tcp_frame('10.0.0.2', '93.184.216.34', 50000, 443), START + i)
+    capture._process_frame(tcp_frame('93.184.216.34', '10.0.0.2', 443, 50000), START + packets)
+
+def test_replacing_the_flow_table_reports_its_flows():
+    capture = PacketCapture()
+    capture_flow(capture)
+    capture.update_settings({'flows': dict(capture.settings['flows'], udp_timeout=30)})
+    rows = capture._collect_flows()
+    assert [(row['packets_sent'], row['packets_received'], row['status']) for row in rows] == [(3, 1, 'closed')]
+    assert capture._collect_flows() == []
+
+def test_reset_statistics_starts_a_new_flow_table():
+    capture = PacketCapture()
+    capture_flow(capture)
+    capture.reset_statistics()
+    assert len(capture.flow_table) == 0
+    assert capture.flow_table.get_statistics()['created'] == 0
+    assert len(capture._collect_flows()) == 1
+
+def test_packets_carry_their_flow_connection_id():
+    capture = PacketCapture()
+    capture_flow(capture)
+    rows = [packet.to_row() for _seq, packet in capture.recent_packets.snapshot()]
+    (flow,) = capture._collect_flows()
+    assert [row['connection_id'] for row in rows] == [flow['connection_id']] * 4
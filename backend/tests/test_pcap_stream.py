@@ -0,0 +1,62 @@
+import struct
+
+from app.services.pcap_stream import PCAP_MAGIC_NS, PCAP_MAGIC_US, PcapStreamReader
+
+def pcap_header(magic=PCAP_MAGIC_US, linktype=1):
+    return struct.pack('<IHHiIII', magic, 2, 4, 0, 0, 65535, linktype)
+
+def pcap_record(ts_sec, ts_frac, frame):
+    return struct.pack('<IIII', ts_sec, ts_frac, len(frame), len(frame)) + frame
+
+def pcapng_block(block_type, body):
+    length = 12 + len(body)
+    return struct.pack('<II', block_type, length) + body + struct.pack('<I', length)
+
+def pcapng_stream(frames):
+    section = pcapng_block(0x0A0D0D0A, struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1))
+    # if_tsresol of 9: nanosecond timestamps
+    options = struct.pack('<HHB3x', 9, 1, 9) + struct.pack('<HH', 0, 0)
+    interface = pcapng_block(0x00000001, struct.pack('<HHI', 1, 0, 65535) + options)
+    packets = b''
+    for timestamp_ns, frame in frames:
+        padded = frame + b'\0' * (-len(frame) % 4)
+        packets += pcapng_block(0x00000006, struct.pack('<IIIII', 0, timestamp_ns >> 32, timestamp_ns & 0xFFFFFFFF,
+                                                        len(frame), len(frame)) + padded)
+    return section + interface + packets
+
+def read_all(path, chunk_size, expected):
+    frames = []
+    with PcapStreamReader(str(path), chunk_size=chunk_size, batch_size=2) as reader:
+        for _ in range(10000):
+            frames += reader.read_batch(timeout=0)
+            if len(frames) >= expected:
+                break
+        return frames, reader
+
+FRAMES = [bytes([i]) * (20 + 13 * i) for i in range(6)]
+
+def test_pcap_records_split_across_reads(tmp_path):
+    path = tmp_path / 'capture.pcap'
+    path.write_bytes(pcap_header() + b''.join(pcap_record(1700000000 + i, 250000, frame)
+                                              for i, frame in enumerate(FRAMES)))
+    # Chunks smaller than a record header split every record
+    frames, reader = read_all(path, 7, len(FRAMES))
+    assert [frame for _timestamp, _linktype, frame in frames] == FRAMES
+    assert frames[0][:2] == (1700000000.25, 1)
+    assert reader.stats['packets_read'] == len(FRAMES)
+    assert reader.stats['bytes_read'] == path.stat().st_size
+
+def test_pcap_restart_mid_stream_reads_the_new_header(tmp_path):
+    path = tmp_path / 'capture.pcap'
+    path.write_bytes(pcap_header() + pcap_record(1, 0, FRAMES[0]) +
+                     pcap_header(PCAP_MAGIC_NS, linktype=113) + pcap_record(2, 500000000, FRAMES[1]))
+    frames, reader = read_all(path, 5, 2)
+    assert frames == [(1.0, 1, FRAMES[0]), (2.5, 113, FRAMES[1])]
+    assert reader.stats['restarts'] == 1
+
+def test_pcapng_blocks_split_across_reads(tmp_path):
+    path = tmp_path / 'capture.pcapng'
+    path.write_bytes(pcapng_stream([(1700000000 * 10 ** 9 + i, frame) for i, frame in enumerate(FRAMES)]))
+    frames, _reader = read_all(path, 11, len(FRAMES))
+    assert [frame for _timestamp, _linktype, frame in frames] == FRAMES
+    assert frames[0][:2] == (1700000000.0, 1)
@@ -0,0 +1,78 @@
+import pytest
+
+from app.core.ring_buffer import RingBuffer
+
+def test_keeps_the_newest_items_once_lapped():
+    ring = RingBuffer(3)
+    for item in 'abcde':
+        ring.append(item)
+    assert ring.items() == ['c', 'd', 'e']
+    assert ring.snapshot() == [(2, 'c'), (3, 'd'), (4, 'e')]
+    assert len(ring) == 3
+    assert ring.last_seq == 4
+
+def test_since_and_limit():
+    ring = RingBuffer(10)
+    for item in range(6):
+        ring.append(item)
+    assert ring.items(since=3) == [4, 5]
+    assert ring.items(limit=2) == [4, 5]
+    assert ring.items(limit=3, since=1) == [3, 4, 5]
+    assert ring.items(since=ring.last_seq) == []
+
+def test_cursor_behind_the_oldest_item_gets_what_is_left():
+    ring = RingBuffer(2)
+    for item in range(5):
+        ring.append(item)
+    assert ring.snapshot(since=0) == [(3, 3), (4, 4)]
+
+def test_entries_lapped_during_a_read_are_dropped():
+    ring = RingBuffer(4)
+    for item in range(4):
+        ring.append(item)
+    slots = ring._generation[0]
+    # The writer overwrote seq 1 after the reader took head
+    slots[1] = (5, 'newer')
+    assert [seq for seq, _item in ring.snapshot()] == [0, 2, 3]
+
+def test_shrink_keeps_old_items_readable_until_overwritten():
+    ring = RingBuffer(4)
+    for item in range(4):
+        ring.append(item)
+    ring.resize(2)
+    assert ring.items() == [2, 3]
+    ring.append(4)
+    assert ring.items() == [3, 4]
+    ring.append(5)
+    ring.append(6)
+    assert ring.items() == [5, 6]
+    assert ring.capacity == 2
+
+def test_grow_keeps_old_items_and_fills_the_new_slots():
+    ring = RingBuffer(2)
+    for item in range(3):
+        ring.append(item)
+    ring.resize(4)
+    assert ring.items() == [1, 2]
+    ring.append(3)
+    ring.append(4)
+    assert ring.items() == [1, 2, 3, 4]
+    ring.append(5)
+    ring.append(6)
+    assert ring.items() == [3, 4, 5, 6]
+
+def test_clear_keeps_sequence_numbers_counting():
+    ring = RingBuffer(4)
+    for item in range(3):
+        ring.append(item)
+    ring.clear()
+    assert ring.items() == []
+    assert len(ring) == 0
+    assert ring.append('next') == 3
+    assert ring.snapshot(since=1) == [(3, 'next')]
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+    with pytest.raises(ValueError):
+        RingBuffer(1).resize(0)